@@ -27,7 +27,8 @@ class Config:
                  adj_src_type="cc_traveltime_misfit", start_pad=20, end_pad=500,
                  observed_tag="observed", synthetic_tag=None,
                  synthetics_only=False, win_amp_ratio=0., paths=None,
-                 save_to_ds=True, **kwargs):
+                 save_to_ds=True, columnar_windows=False, cache_observed=False,
+                 **kwargs):
         """
         Initiate the Config object. Kwargs are passed to Pyflex and Pyadjoint
         Fonfig objects so that they can be set by the User through this Config
@@ -64,7 +65,9 @@ class Config:
         :type pyflex_preset: str
         :param pyflex_preset: name to map to pyflex preset config
         :type adj_src_type: str
-        :param adj_src_type: method of misfit quantification for Pyadjoint
+        :param adj_src_type: method of misfit quantification for Pyadjoint.
+            'cc_batch' calculates cross correlation traveltime misfit for all
+            windows at once with pyatoa.utils.adjoint rather than Pyadjoint
         :type start_pad: int
         :param start_pad: seconds before event origintime to grab waveform data
             for use by data gathering class
@@ -95,6 +98,18 @@ class Config:
             is gathered/collected. This is useful, e.g. if a dataset that
             contains data is passed to the Manager, but you don't want to
             overwrite the data inside while you do some temporary processing.
+        :type columnar_windows: bool
+        :param columnar_windows: store misfit windows in the dataset as
+            structured arrays (one row per window) rather than as one
+            auxiliary data object per window. Reduces the number of HDF5
+            objects and speeds up reading windows back, at the cost of not
+            storing phase arrivals.
+        :type cache_observed: bool
+        :param cache_observed: store processed observed waveforms in the
+            dataset and reuse them in subsequent evaluations (e.g. later
+            iterations or step counts) if processing parameters and
+            instrument responses match. Off by default, as the processed
+            waveforms are stored alongside the raw data and grow the dataset.
         :raises ValueError: If kwargs do not match Pyatoa, Pyflex or Pyadjoint
             attribute names.
         """
@@ -122,6 +137,8 @@ class Config:
         self.component_list = component_list
 
         self.save_to_ds = save_to_ds
+        self.columnar_windows = columnar_windows
+        self.cache_observed = cache_observed
 
         # Empty init because these are filled by self._check()
         self.pyflex_config = None
@@ -170,10 +187,11 @@ class Config:
                    f"    {'event_id:':<25}{self.event_id}\n"
                    )
         # Format the remainder of the keys identically
-        key_dict = {"Gather": ["client", "start_pad", "end_pad", "save_to_ds"],
+        key_dict = {"Gather": ["client", "start_pad", "end_pad", "save_to_ds",
+                               "columnar_windows"],
                     "Process": ["min_period", "max_period", "filter_corners",
                                 "unit_output", "rotate_to_rtz", "win_amp_ratio",
-                                "synthetics_only"],
+                                "synthetics_only", "cache_observed"],
                     "Labels": ["component_list", "observed_tag",
                                "synthetic_tag", "paths"],
                     "External": ["pyflex_preset", "adj_src_type",
@@ -730,11 +748,13 @@ def format_adj_src_type(choice):
     """
     if choice in ["cc", "cc_traveltime_misfit", "cross_correlation"]:
         adj_src_type = "cc_traveltime_misfit"
+    elif choice in ["cc_batch", "cc_traveltime_misfit_batch"]:
+        adj_src_type = "cc_traveltime_misfit_batch"
     elif choice in ["mt", "mtm", "multitaper_misfit", "multitaper"]:
         adj_src_type = "multitaper_misfit"
     elif choice in ["wav", "wave", "waveform", "w"]:
         adj_src_type = "waveform"
     else:
         raise ValueError(f"'{choice}' does not match available adjoint source "
-                         f"types, must be 'cc', 'mt', or 'wav'")
+                         f"types, must be 'cc', 'cc_batch', 'mt', or 'wav'")
     return adj_src_type
@@ -14,6 +14,8 @@ by the User unless for bespoke data gathering functionality.
 """
 import os
 import glob
+import time
+import fnmatch
 import warnings
 import traceback
 
@@ -21,10 +23,11 @@ from pyasdf import ASDFWarning
 from obspy.core.event import Event
 from obspy.clients.fdsn import Client
 from obspy import Stream, read, read_inventory
-from obspy.clients.fdsn.header import FDSNException
+from obspy.clients.fdsn.header import FDSNException, FDSNNoDataException
 
 from pyatoa import logger
-from pyatoa.utils.read import read_sem
+from pyatoa.utils.read import (read_sem, read_stations_file, read_specfem_su,
+                               read_specfem_binary, read_su_receivers)
 from pyatoa.utils.form import format_event_name
 from pyatoa.utils.calculate import overlapping_days
 from pyatoa.utils.srcrcv import merge_inventories
@@ -38,6 +41,141 @@ class GathererNoDataException(Exception):
     pass
 
 
+class DirectoryIndex:
+    """
+    In-memory index of all files beneath a root directory, used to answer
+    glob-style lookups without repeatedly querying the filesystem. The index
+    is built with a single recursive os.scandir traversal and stores the
+    modification time of each directory so that it can be invalidated when
+    files are added or removed.
+
+    .. note::
+        Like glob, wildcards do not match across directory separators and
+        hidden files (starting with '.') are not indexed.
+    """
+    def __init__(self, path):
+        """
+        :type path: str
+        :param path: root directory to index
+        """
+        self.path = os.path.abspath(path)
+        self.files = {}
+        self.subdirs = {}
+        self.mtimes = {}
+        self.build()
+
+    def build(self):
+        """
+        Traverse the root directory once and store file and subdirectory names
+        by directory
+        """
+        self.files, self.subdirs, self.mtimes = {}, {}, {}
+        stack = [""]
+        while stack:
+            relpath = stack.pop()
+            dirpath = os.path.join(self.path, relpath)
+            try:
+                self.mtimes[relpath] = os.stat(dirpath).st_mtime_ns
+                entries = list(os.scandir(dirpath))
+            except OSError:
+                continue
+            files, subdirs = [], []
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                    stack.append(os.path.join(relpath, entry.name))
+                else:
+                    files.append(entry.name)
+            self.files[relpath] = sorted(files)
+            self.subdirs[relpath] = sorted(subdirs)
+        logger.debug(f"indexed {sum(len(_) for _ in self.files.values())} "
+                     f"files in {len(self.files)} directories of {self.path}")
+
+    def is_stale(self):
+        """
+        Check whether any indexed directory has been modified since indexing
+
+        :rtype: bool
+        :return: True if the index no longer reflects the filesystem
+        """
+        for relpath, mtime in self.mtimes.items():
+            try:
+                if os.stat(os.path.join(self.path, relpath)).st_mtime_ns != \
+                        mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def glob(self, pattern):
+        """
+        Return the files matching a glob pattern relative to the root
+        directory, equivalent to glob.glob(os.path.join(path, pattern))
+
+        :type pattern: str
+        :param pattern: glob pattern relative to the index root, e.g.
+            '2018/NZ/BFZ/HHZ*/NZ.BFZ.*.HHZ*2018.049'
+        :rtype: list of str
+        :return: full paths of matching files
+        """
+        parts = os.path.normpath(pattern).split(os.sep)
+
+        # Walk down the directory tree one pattern component at a time
+        dirs = [""]
+        for part in parts[:-1]:
+            matches = []
+            for relpath in dirs:
+                if glob.has_magic(part):
+                    names = fnmatch.filter(self.subdirs.get(relpath, []), part)
+                elif os.path.join(relpath, part) in self.files:
+                    names = [part]
+                else:
+                    names = []
+                matches += [os.path.join(relpath, name) for name in names]
+            dirs = matches
+
+        matches = []
+        for relpath in dirs:
+            files = self.files.get(relpath, [])
+            if glob.has_magic(parts[-1]):
+                names = fnmatch.filter(files, parts[-1])
+            else:
+                names = [parts[-1]] if parts[-1] in files else []
+            matches += [os.path.join(self.path, relpath, name)
+                        for name in names]
+
+        return matches
+
+
+# Indices are shared between Gatherers so that they are built once per run
+_DIRECTORY_INDICES = {}
+
+
+def get_directory_index(path, validate=True):
+    """
+    Return a cached DirectoryIndex for a path, building it if it does not
+    exist or rebuilding it if the filesystem has changed since it was built.
+
+    :type path: str
+    :param path: root directory to index
+    :type validate: bool
+    :param validate: check directory modification times against the index
+    :rtype: pyatoa.core.gatherer.DirectoryIndex
+    :return: index of the given directory
+    """
+    path = os.path.abspath(path)
+    index = _DIRECTORY_INDICES.get(path)
+    if index is None:
+        index = _DIRECTORY_INDICES[path] = DirectoryIndex(path)
+    elif validate and index.is_stale():
+        logger.debug(f"directory index for {path} is stale, rebuilding")
+        index.build()
+
+    return index
+
+
 class ExternalGetter:
     """
     Low-level gathering classs to retrieve data via FDSN webservices.
@@ -163,6 +301,177 @@ class ExternalGetter:
         except FDSNException:
             return None
 
+    def station_get_bulk(self, codes, chunk_size=50, retries=3, backoff=1.,
+                         **kwargs):
+        """
+        Call for ObsPy FDSN client to download station dataless information
+        for many stations with as few bulk requests as possible. See
+        _bulk_get() for how chunks, retries and failed requests are handled.
+
+        :type codes: list of str
+        :param codes: station codes following SEED naming convention, in the
+            form NN.SSSS.LL.CCC. Allows for wildcard naming.
+        :type chunk_size: int
+        :param chunk_size: maximum number of station codes per request
+        :type retries: int
+        :param retries: number of times a failed request is repeated
+        :type backoff: float
+        :param backoff: seconds to wait before the first retry, doubled for
+            each subsequent retry
+        :rtype: obspy.core.inventory.Inventory or None
+        :return: inventory containing all stations that were found, or None
+
+        Keyword Arguments
+        ::
+            str station_level:
+                The level of the station metadata if retrieved using the ObsPy
+                Client. Defaults to 'response'
+        """
+        level = kwargs.get("station_level", "response")
+
+        if not self.Client:
+            return None
+
+        logger.debug(f"bulk querying client {self.config.client} for "
+                     f"{len(codes)} stations")
+        bulk = [(*code.split("."), self.origintime - self.config.start_pad,
+                 self.origintime + self.config.end_pad) for code in codes]
+        inv = None
+        for inv_chunk in self._bulk_get(self.Client.get_stations_bulk, bulk,
+                                        chunk_size=chunk_size, retries=retries,
+                                        backoff=backoff, level=level):
+            if inv is None:
+                inv = inv_chunk
+            else:
+                inv += inv_chunk
+        return inv
+
+    def obs_waveform_get_bulk(self, codes, chunk_size=50, retries=3,
+                              backoff=1.):
+        """
+        Call for ObsPy FDSN webservice client to download waveform data for
+        many stations with as few bulk requests as possible. See _bulk_get()
+        for how chunks, retries and failed requests are handled.
+
+        .. Note:
+            As with obs_waveform_get(), waveforms are retrieved with a 10 second
+            cushion on start and end time and trimmed after retrieval.
+
+        :type codes: list of str
+        :param codes: station codes following SEED naming convention, in the
+            form NN.SSSS.LL.CCC. Allows for wildcard naming.
+        :type chunk_size: int
+        :param chunk_size: maximum number of station codes per request
+        :type retries: int
+        :param retries: number of times a failed request is repeated
+        :type backoff: float
+        :param backoff: seconds to wait before the first retry, doubled for
+            each subsequent retry
+        :rtype: obspy.core.stream.Stream or None
+        :return: waveforms of all stations that were found, or None
+        """
+        if not self.Client or self.config.synthetics_only:
+            return None
+
+        logger.debug(f"bulk querying client {self.config.client} for "
+                     f"{len(codes)} stations")
+        bulk = [(*code.split("."),
+                 self.origintime - (self.config.start_pad + 10),
+                 self.origintime + (self.config.end_pad + 10))
+                for code in codes]
+        st = Stream()
+        for st_chunk in self._bulk_get(self.Client.get_waveforms_bulk, bulk,
+                                       chunk_size=chunk_size, retries=retries,
+                                       backoff=backoff):
+            st += st_chunk
+        if not st:
+            return None
+
+        st.trim(starttime=self.origintime - self.config.start_pad,
+                endtime=self.origintime + self.config.end_pad)
+        return st
+
+    def _bulk_get(self, func, bulk, chunk_size=50, retries=3, backoff=1.,
+                  **kwargs):
+        """
+        Split a bulk request into chunks and send each chunk to an ObsPy
+        Client bulk function, e.g. get_waveforms_bulk().
+
+        Requests that fail because the service is unavailable, overloaded
+        or timed out are repeated up to `retries` times with exponential
+        backoff. Any other failure may be caused by a single bad station, so
+        the chunk is split in half and each half requested after a backoff.
+        This continues until only the station(s) causing the failure are
+        left, so one bad station does not lose data for the rest of its chunk.
+        Chunks without data are skipped.
+
+        :type func: function
+        :param func: ObsPy Client bulk function, kwargs are passed to it
+        :type bulk: list of tuple
+        :param bulk: (net, sta, loc, cha, starttime, endtime) request lines
+        :type chunk_size: int
+        :param chunk_size: maximum number of request lines per request
+        :type retries: int
+        :param retries: number of times a request is repeated if the service
+            is temporarily unavailable
+        :type backoff: float
+        :param backoff: seconds to wait before the first retry, doubled for
+            each subsequent retry. Also the wait before requesting each half
+            of a split chunk
+        :rtype: list
+        :return: results of all successful requests
+        """
+        chunks = [bulk[i:i + chunk_size] for i in
+                  range(0, len(bulk), chunk_size)]
+        results = []
+        while chunks:
+            chunk = chunks.pop(0)
+            for attempt in range(retries + 1):
+                try:
+                    results.append(func(chunk, **kwargs))
+                except FDSNNoDataException:
+                    pass
+                except FDSNException as e:
+                    if self._is_transient(e):
+                        if attempt < retries:
+                            logger.debug(f"bulk request failed, retrying: "
+                                         f"{e}")
+                            time.sleep(backoff * 2 ** attempt)
+                            continue
+                        logger.warning(f"bulk request for {len(chunk)} "
+                                       f"station(s) failed after {retries} "
+                                       f"retries: {e}")
+                    elif len(chunk) > 1:
+                        logger.debug(f"bulk request for {len(chunk)} stations "
+                                     f"failed, splitting request: {e}")
+                        half = len(chunk) // 2
+                        chunks[:0] = [chunk[:half], chunk[half:]]
+                        time.sleep(backoff)
+                    else:
+                        logger.warning(f"bulk request failed for "
+                                       f"{'.'.join(chunk[0][:4])}: {e}")
+                break
+        return results
+
+    @staticmethod
+    def _is_transient(error):
+        """
+        Determine whether a failed FDSN request is worth repeating, i.e. the
+        service was temporarily unavailable (503), rate limited (429) or the
+        request timed out. The pinned ObsPy raises a generic FDSNException
+        for all of these, so the error message is checked instead, which
+        also matches the specific exceptions of newer ObsPy versions.
+
+        :type error: obspy.clients.fdsn.header.FDSNException
+        :param error: exception raised by an ObsPy Client request
+        :rtype: bool
+        :return: True if the request failed for reasons unrelated to the
+            stations requested
+        """
+        msg = str(error.args[0]).lower() if error.args else ""
+        return any(_ in msg for _ in ["temporarily unavailable", "timed out",
+                                      "too many requests", "code: 429"])
+
     def _obs_get_multithread(self, code, **kwargs):
         """
         A small function to gather StationXMLs and observed waveforms together.
@@ -355,9 +664,9 @@ class InternalFetcher:
                 continue
             # Attempting to instantiate an empty Inventory requires some 
             # positional arguements we dont have, so don't do that
-            fid = os.path.join(path_, dir_structure, file_template).format(
+            fid = os.path.join(dir_structure, file_template).format(
                 net=net, sta=sta, cha=cha, loc=loc)
-            for filepath in glob.glob(fid):
+            for filepath in self._glob(path_, fid):
                 if inv is None:
                     # The first inventory becomes the main inv to return
                     inv = read_inventory(filepath)
@@ -425,7 +734,7 @@ class InternalFetcher:
         for path_ in paths:
             if not os.path.exists(path_):
                 continue
-            full_path = os.path.join(path_, dir_structure, file_template)
+            full_path = os.path.join(dir_structure, file_template)
             pathlist = []
             for jday in jdays:
                 pathlist.append(full_path.format(net=net, sta=sta, cha=cha,
@@ -434,7 +743,7 @@ class InternalFetcher:
                                 )
             st = Stream()
             for fid in pathlist:
-                for filepath in glob.glob(fid):
+                for filepath in self._glob(path_, fid):
                     st += read(filepath)
                     logger.debug(f"retrieved local file:\n{filepath}")
             if len(st) > 0:
@@ -482,14 +791,36 @@ class InternalFetcher:
                 Defaults to empty string
             str syn_fid_template:
                 The naming template of synthetic waveforms defaults to
-                "{net}.{sta}.*{cmp}.sem{syn_unit}"
+                "{net}.{sta}.*{cmp}.sem{syn_unit}" for ASCII files,
+                "*_{syn_unit}?_SU" for Seismic Unix files and
+                "U?_file_*_{syn_unit}.bin" for binary files
+            str syn_format:
+                Format of the synthetic seismograms written by Specfem:
+                'ascii' (default) for one .sem? file per trace, 'su' for
+                Seismic Unix files written per processor (SU_FORMAT), or
+                'binary' for Specfem2D binary seismograms. Binary formats are
+                read with memory maps and matched to stations using the
+                STATIONS file
+            str syn_stations_file:
+                STATIONS file used to map binary seismograms to stations.
+                Defaults to 'STATIONS' in the synthetics path
+            float syn_delta:
+                Sampling interval of binary seismograms in seconds, required
+                for 'binary' as these files contain no header
+            float syn_time_offset:
+                Time of the first sample relative to the origin time for
+                binary formats (i.e. Specfem's t0). For 'su' defaults to the
+                recording delay in the trace headers, for 'binary' to 0
         """
         syn_cfgpath = kwargs.get("syn_cfgpath", "synthetics")
         syn_unit = kwargs.get("syn_unit", "?")
+        syn_format = kwargs.get("syn_format", "ascii").lower()
         syn_dir_template = kwargs.get("syn_dir_template", "")
-        syn_fid_template = kwargs.get("syn_fid_template",
-                                      "{net}.{sta}.*{cmp}.sem{dva}"
-                                      )
+        syn_fid_template = kwargs.get("syn_fid_template", {
+            "ascii": "{net}.{sta}.*{cmp}.sem{dva}",
+            "su": "*_{dva}?_SU",
+            "binary": "U?_file_*_{dva}.bin"}[syn_format]
+        )
 
         if self.origintime is None:
             raise AttributeError("'origintime' must be specified")
@@ -509,17 +840,23 @@ class InternalFetcher:
 
             # Here the path is determined for search. If event_id is given,
             # the function will search for an event_id directory.
-            full_path = os.path.join(path_, syn_dir_template, syn_fid_template)
-            st = Stream()
-            for filepath in glob.glob(full_path.format(
-                    net=net, sta=sta, cmp=cha[2:], dva=syn_unit.lower())):
-                try:
-                    # Convert the ASCII file to a miniseed
-                    st += read_sem(filepath, self.origintime)
-                except UnicodeDecodeError:
-                    # If the data file is for some reason already in miniseed
-                    st += read(filepath)
-                logger.debug(f"retrieved local file:\n{filepath}")
+            full_path = os.path.join(syn_dir_template, syn_fid_template)
+            filepaths = self._glob(path_, full_path.format(
+                net=net, sta=sta, cmp=cha[2:], dva=syn_unit.lower()))
+            if syn_format == "ascii":
+                st = Stream()
+                for filepath in filepaths:
+                    try:
+                        # Convert the ASCII file to a miniseed
+                        st += read_sem(filepath, self.origintime)
+                    except UnicodeDecodeError:
+                        # If the data file is for some reason already miniseed
+                        st += read(filepath)
+                    logger.debug(f"retrieved local file:\n{filepath}")
+            else:
+                st = self._read_specfem_binary(
+                    path_, filepaths, net=net, sta=sta, **kwargs
+                ).select(component=cha[2:])
             if len(st) > 0:
                 st.merge()
                 st.trim(starttime=self.origintime - self.config.start_pad,
@@ -529,6 +866,89 @@ class InternalFetcher:
         else:
             return None
 
+    def _read_specfem_binary(self, path, filepaths, net, sta, **kwargs):
+        """
+        Read the traces of a single station from Specfem binary seismogram
+        files, which contain traces for many stations. The STATIONS file, and
+        for Seismic Unix files the receivers contained in each file, are read
+        once and cached so that subsequent stations only touch the files and
+        traces that they need.
+
+        :type path: str
+        :param path: synthetics path that `filepaths` were found in
+        :type filepaths: list of str
+        :param filepaths: Seismic Unix or binary files to search
+        :type net: str
+        :param net: network code
+        :type sta: str
+        :param sta: station code
+        :rtype: obspy.core.stream.Stream
+        :return: stream containing all components for the given station
+
+        Keyword Arguments
+        ::
+            See `fetch_syn_by_dir`: syn_format, syn_stations_file, syn_delta,
+            syn_time_offset
+        """
+        syn_format = kwargs.get("syn_format", "su").lower()
+        if not hasattr(self, "_specfem_cache"):
+            self._specfem_cache = {}
+        stations_file = kwargs.get("syn_stations_file",
+                                   os.path.join(path, "STATIONS"))
+        if stations_file not in self._specfem_cache:
+            self._specfem_cache[stations_file] = \
+                read_stations_file(stations_file)
+        stations = self._specfem_cache[stations_file]
+
+        st = Stream()
+        for filepath in filepaths:
+            if syn_format == "su":
+                if filepath not in self._specfem_cache:
+                    self._specfem_cache[filepath] = set(
+                        read_su_receivers(filepath, stations))
+                if (net, sta) not in self._specfem_cache[filepath]:
+                    continue
+                st += read_specfem_su(
+                    filepath, stations, origintime=self.origintime,
+                    time_offset=kwargs.get("syn_time_offset", None),
+                    network=net, station=sta)
+            elif syn_format == "binary":
+                if kwargs.get("syn_delta", None) is None:
+                    raise ValueError("'syn_delta' required for binary format")
+                st += read_specfem_binary(
+                    filepath, stations, delta=kwargs["syn_delta"],
+                    origintime=self.origintime,
+                    time_offset=kwargs.get("syn_time_offset", 0.),
+                    network=net, station=sta)
+            logger.debug(f"retrieved local file:\n{filepath}")
+
+        return st
+
+    def _glob(self, path, pattern):
+        """
+        Find files matching a glob pattern beneath a given path. If
+        `use_index` is set, lookups are answered from an in-memory
+        DirectoryIndex, which is validated against directory modification
+        times the first time each path is searched by this Gatherer.
+        Otherwise falls back to glob.glob.
+
+        :type path: str
+        :param path: root path to search, e.g. an entry of Config.paths
+        :type pattern: str
+        :param pattern: glob pattern relative to `path`
+        :rtype: list of str
+        :return: full paths of matching files
+        """
+        if not getattr(self, "use_index", True):
+            return glob.glob(os.path.join(path, pattern))
+
+        if not hasattr(self, "_validated_paths"):
+            self._validated_paths = set()
+        validate = path not in self._validated_paths
+        self._validated_paths.add(path)
+
+        return get_directory_index(path, validate=validate).glob(pattern)
+
     def obs_waveform_fetch(self, code, **kwargs):
         """
         Mid-level internal fetching function for observation waveform data.
@@ -619,17 +1039,22 @@ class Gatherer(InternalFetcher, ExternalGetter):
 
     All saving to ASDFDataSet taken care of by the Gatherer class.
     """
-    def __init__(self, config, ds=None, origintime=None):
+    def __init__(self, config, ds=None, origintime=None, use_index=True):
         """
         :type config: pyatoa.core.config.Config
         :param config: configuration object that contains necessary parameters
             to run through the Pyatoa workflow
         :type ds: pyasdf.asdf_data_set.ASDFDataSet
         :param ds: dataset for internal data searching and saving
+        :type use_index: bool
+        :param use_index: answer local filesystem searches from an in-memory
+            index of Config.paths rather than calling glob for every lookup
         """
         self.ds = ds
         self.config = config
         self.origintime = origintime
+        self.use_index = use_index
+        self._validated_paths = set()
         if self.config.client is not None:
             self.Client = Client(self.config.client)
         else:
@@ -819,6 +1244,85 @@ class Gatherer(InternalFetcher, ExternalGetter):
                     print(f"{code} data count: {status}")
 
 
+    def gather_obs_bulk(self, codes, chunk_size=50, retries=3, backoff=1.,
+                        **kwargs):
+        """
+        Fetch all observed data (waveforms and StationXMLs) for a given event
+        with FDSN bulk requests, and store it to an ASDFDataSet. Stations are
+        grouped into requests of `chunk_size` stations, rather than querying
+        once per station as in gather_obs_multithread().
+
+        :type codes: list of str
+        :param codes: A list of station codes where station codes must be in the
+            form NN.SSSS.LL.CCC (N=network, S=station, L=location, C=channel)
+        :type chunk_size: int
+        :param chunk_size: maximum number of station codes per request
+        :type retries: int
+        :param retries: number of times a failed request is repeated
+        :type backoff: float
+        :param backoff: seconds to wait before the first retry, doubled for
+            each subsequent retry
+        :rtype: dict
+        :return: number of data items collected, keyed by station code
+
+        Keyword Arguments
+        ::
+            str station_level:
+                The level of the station metadata if retrieved using the ObsPy
+                Client. Defaults to 'response'
+            int return_count:
+                if not None, determines how many data items must be collected
+                for the station to be saved into the ASDFDataSet.
+                e.g. StationXML and 3 component waveforms would equal 4 pieces
+                of data, so a return_count == 4 means stations that do not
+                return all components and metadata will not be saved to the
+                dataset.
+        """
+        return_count = kwargs.get("return_count", None)
+
+        logger.info("bulk gathering observation data")
+
+        assert(self.ds is not None), \
+            "Bulk gathering requires a dataset `ds` for data storage"
+        assert(self.Client is not None), \
+            "Bulk gathering requires a Client for data queries"
+        assert(self.origintime is not None), \
+            "Bulk gathering requires an origintime for data queries"
+
+        inv = self.station_get_bulk(codes, chunk_size=chunk_size,
+                                    retries=retries, backoff=backoff, **kwargs)
+        st = self.obs_waveform_get_bulk(codes, chunk_size=chunk_size,
+                                        retries=retries, backoff=backoff)
+
+        data_counts = {}
+        for code in codes:
+            net, sta, loc, cha = code.split(".")
+            inv_sta, st_sta = None, None
+            if inv is not None:
+                inv_sta = inv.select(network=net, station=sta, location=loc,
+                                     channel=cha)
+                inv_sta = inv_sta if inv_sta.networks else None
+            if st is not None:
+                st_sta = st.select(network=net, station=sta, location=loc,
+                                   channel=cha)
+            data_counts[code] = int(inv_sta is not None) + len(st_sta or [])
+            logger.info(f"{code} data count: {data_counts[code]}")
+
+            # Additional check for saving data if not all requested data found
+            if (return_count is not None) and \
+                    (data_counts[code] < return_count):
+                continue
+            if inv_sta is not None:
+                try:
+                    self.ds.add_stationxml(inv_sta)
+                except TypeError:
+                    pass
+            if st_sta:
+                self.ds.add_waveforms(waveform=st_sta,
+                                      tag=self.config.observed_tag)
+
+        return data_counts
+
     def _save_waveforms_to_dataset(self, st, tag):
         """
         Save waveformsm to the ASDFDataSet with a simple check for existence
@@ -9,12 +9,37 @@ import traceback
 import numpy as np
 import pandas as pd
 from glob import glob
-from fnmatch import filter as fnf
-from obspy.geodetics import gps2dist_azimuth
+from functools import partial
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pyatoa.utils.form import format_event_name
+from pyatoa.utils.srcrcv import gcd_and_baz_array
+from pyatoa.utils.asdf.load import (get_window_index,
+                                    load_auxiliary_parameters)
 from pyatoa.visuals.insp_plot import InspectorPlotter
 
 
+# Columns of the windows dataframe that Inspector.isolate() can select on, in
+# the order of the levels of the index used to answer queries
+ISOLATE_KEYS = ["event", "iteration", "step", "network", "station", "channel",
+                "component"]
+
+# Number of isolate() queries whose selected rows are remembered
+ISOLATE_CACHE_SIZE = 128
+
+# Column types of the windows dataframe when the Inspector is compact. Labels
+# repeat for every window so they are stored as categorical codes, measurements
+# do not need more than single precision
+COMPACT_DTYPES = {
+    "event": "category", "iteration": "category", "step": "category",
+    "network": "category", "station": "category", "channel": "category",
+    "component": "category", "misfit": "float32", "length_s": "float32",
+    "dlnA": "float32", "window_weight": "float32", "max_cc_value": "float32",
+    "relative_endtime": "float32", "relative_starttime": "float32",
+    "cc_shift_in_seconds": "float32"
+}
+
+
 class Inspector(InspectorPlotter):
     """
     This plugin object will collect information from a Pyatoa run folder and
@@ -24,7 +49,7 @@ class Inspector(InspectorPlotter):
     Inherits plotting capabilities from InspectorPlotter class to reduce clutter
     """
 
-    def __init__(self, tag="default", verbose=True):
+    def __init__(self, tag="default", verbose=True, compact=False):
         """
         Inspector will automatically search for relevant file names using the
         tag attribute. If nothing is found, internal dataframes will be empty.
@@ -34,12 +59,13 @@ class Inspector(InspectorPlotter):
             in existing data from disk
         :type verbose: bool
         :param verbose: detail the files that are being read and their status
+        :type compact: bool
+        :param compact: store window labels (event, iteration, step, station
+            etc.) as categoricals and window measurements as single precision
+            floats, which reduces the memory of the windows dataframe for
+            large inversions. Misfit is then calculated in single precision
         """
-        self.windows = pd.DataFrame()
-        self.sources = pd.DataFrame()
-        self.receivers = pd.DataFrame()
-        self.tag = tag
-        self.verbose = verbose
+        self.compact = compact
 
         # Placeholder attributes for getters
         self._models = None
@@ -48,6 +74,17 @@ class Inspector(InspectorPlotter):
         self._event_misfit = None
         self._station_misfit = None
 
+        # Placeholder attributes for isolate()
+        self._windows = None
+        self._query_index = None
+        self._query_cache = OrderedDict()
+
+        self.windows = pd.DataFrame()
+        self.sources = pd.DataFrame()
+        self.receivers = pd.DataFrame()
+        self.tag = tag
+        self.verbose = verbose
+
         # Try to load an already created Inspector
         try:
             self.read(tag=self.tag)
@@ -91,6 +128,47 @@ class Inspector(InspectorPlotter):
             except KeyError:
                 return []
 
+    @property
+    def windows(self):
+        """Dataframe containing information per misfit window"""
+        return self._windows
+
+    @windows.setter
+    def windows(self, windows):
+        """
+        Setting new windows invalidates the index used by isolate() and
+        any previously calculated misfit. Compact Inspectors convert windows
+        to the compact column types on the way in
+        """
+        if self.compact:
+            windows = self._compact_windows(windows)
+        self._windows = windows
+        self._query_index = None
+        self._query_cache.clear()
+        self._models = None
+        self._step_misfit = None
+        self._event_misfit = None
+        self._station_misfit = None
+
+    @staticmethod
+    def _compact_windows(windows):
+        """
+        Convert the columns of a windows dataframe to `COMPACT_DTYPES`.
+        Categoricals that were concatenated with different categories fall
+        back to object columns and are converted again.
+
+        :type windows: pandas.DataFrame
+        :param windows: windows to convert
+        :rtype: pandas.DataFrame
+        :return: windows with compact column types
+        """
+        dtypes = {key: val for key, val in COMPACT_DTYPES.items()
+                  if key in windows.columns and
+                  not pd.api.types.is_dtype_equal(windows[key].dtype, val)}
+        if dtypes:
+            windows = windows.astype(dtypes)
+        return windows
+
     @property
     def keys(self):
         """Shorthand to access the keys of the Windows dataframe"""
@@ -137,7 +215,7 @@ class Inspector(InspectorPlotter):
     def steps(self):
         """Returns a pandas. Series of iteration with values listing steps"""
         try:
-            return self.windows.groupby("iteration").apply(
+            return self.windows.groupby("iteration", observed=True).apply(
                 lambda x: x["step"].unique()
             )
         except KeyError:
@@ -195,53 +273,42 @@ class Inspector(InspectorPlotter):
         """Return a dictionary of event depths in units of meters"""
         return self._try_print("depth_km")
 
-    def _get_srcrcv_from_dataset(self, ds):
+    @staticmethod
+    def _get_srcrcv_from_dataset(ds):
         """
         Get source and receiver information from dataset, this includes
         latitude and longitude values for both, and event information including
         magnitude, origin time, id, etc.
 
-        Returns Dataframes for sources and receivers iff they are not already
-        contained in the class dataframes, to avoid duplicates.
-
-        Returns empty DataFrames if no unique info was found.
-
         :type ds: pyasdf.ASDFDataSet
         :param ds: dataset to query for distances
         :rtype source: pandas.core.frame.DataFrame
         :return source: single row Dataframe containing event info from dataset
         :rtype receivers: multiindexed dataframe containing unique station info
         """
-        # Create a dataframe with source information, ignore duplicates
-        event_id = format_event_name(ds)
-        if event_id not in self.sources.index:
-            src = {
-                "event_id": format_event_name(ds),
-                "time": str(ds.events[0].preferred_origin().time),
-                "magnitude": ds.events[0].preferred_magnitude().mag,
-                "depth_km": ds.events[0].preferred_origin().depth * 1E-3,
-                "latitude": ds.events[0].preferred_origin().latitude,
-                "longitude": ds.events[0].preferred_origin().longitude,
-                }
-            source = pd.DataFrame([list(src.values())],
-                                  columns=list(src.keys())
-                                  )
-            source.set_index("event_id", inplace=True)
-
-            self.sources = pd.concat([self.sources, source])
+        # Create a dataframe with source information
+        src = {
+            "event_id": format_event_name(ds),
+            "time": str(ds.events[0].preferred_origin().time),
+            "magnitude": ds.events[0].preferred_magnitude().mag,
+            "depth_km": ds.events[0].preferred_origin().depth * 1E-3,
+            "latitude": ds.events[0].preferred_origin().latitude,
+            "longitude": ds.events[0].preferred_origin().longitude,
+            }
+        source = pd.DataFrame([list(src.values())], columns=list(src.keys()))
+        source.set_index("event_id", inplace=True)
 
         # Loop through all the stations in the dataset to create a dataframe
         networks, stations, latitudes, longitudes = [], [], [], []
         for sta, sta_info in ds.get_all_coordinates().items():
-            # Append station information one time globally by checking name
             net, sta = sta.split(".")
-            if not (net, sta) in self.receivers.index:
-                networks.append(net)
-                stations.append(sta)
-                latitudes.append(sta_info["latitude"])
-                longitudes.append(sta_info["longitude"])
+            networks.append(net)
+            stations.append(sta)
+            latitudes.append(sta_info["latitude"])
+            longitudes.append(sta_info["longitude"])
 
         # Create a list of tuples for multiindexing
+        receivers = pd.DataFrame()
         if networks:
             tuples = list(zip(*[networks, stations]))
             idx = pd.MultiIndex.from_tuples(tuples,
@@ -249,10 +316,12 @@ class Inspector(InspectorPlotter):
             receivers = pd.DataFrame([latitudes, longitudes],
                                      index=["latitude", "longitude"],
                                      columns=idx
-                                     )
-            self.receivers = pd.concat([self.receivers, receivers.T])
+                                     ).T
+
+        return source, receivers
 
-    def _get_windows_from_dataset(self, ds):
+    @staticmethod
+    def _get_windows_from_dataset(ds, skip=None, verbose=False):
         """
         Get window and misfit information from dataset auxiliary data
         Model and Step information should match between the two
@@ -260,111 +329,346 @@ class Inspector(InspectorPlotter):
 
         :type ds: pyasdf.ASDFDataSet
         :param ds: dataset to query for misfit:
-        :rtype: pandas.DataFrame
-        :return: a dataframe object containing information per misfit window
+        :type skip: list of tuple
+        :param skip: (iteration, step) groups that have already been collected
+            for this dataset and should not be read
+        :type verbose: bool
+        :param verbose: print adjoint sources that could not be matched
+        :rtype windows: pandas.DataFrame
+        :return windows: a dataframe object containing information per misfit
+            window, empty if nothing was collected
+        :rtype groups: list of tuple
+        :return groups: all (iteration, step) groups contained in the dataset
         """
         eid = format_event_name(ds)
+        skip = skip or []
+        index = get_window_index(ds)
 
-        # Initialize an empty dictionary that will be used to initalize
-        # a Pandas DataFrame
-        window = {"event": [], "iteration": [], "step": [], "network": [],
-                  "station": [], "channel": [], "component": [], "misfit": [],
-                  "length_s": [],
-                  }
         # These are direct parameter names of the MisfitWindow aux data objects
-        winfo = {"dlnA": [], "window_weight": [], "max_cc_value": [],
-                 "relative_endtime": [], "relative_starttime": [],
-                 "cc_shift_in_seconds": [], "absolute_starttime": [],
-                 "absolute_endtime": [],
-                 }
+        winfo = ["dlnA", "window_weight", "max_cc_value", "relative_endtime",
+                 "relative_starttime", "cc_shift_in_seconds",
+                 "absolute_starttime", "absolute_endtime"]
+        strings = ["absolute_starttime", "absolute_endtime"]
 
         misfit_windows = ds.auxiliary_data.MisfitWindows
-        adjoint_sources = ds.auxiliary_data.AdjointSources
+        # Misfit-only evaluations save windows but no adjoint sources
+        if "AdjointSources" in ds.auxiliary_data.list():
+            adjoint_sources = ds.auxiliary_data.AdjointSources
+        else:
+            adjoint_sources = None
 
+        # Columns are collected per iteration/step and concatenated once
+        groups, columns = [], []
         for iter_ in misfit_windows.list():
             for step in misfit_windows[iter_].list():
+                groups.append((iter_, step))
                 # If any entries exist for a given event/model/step
                 # ignore appending them to the internal structure as they've
                 # already been collected
-                if not self.windows.empty and \
-                        not self.isolate(iter_, step, eid).empty:
+                if (iter_, step) in skip:
                     continue
 
-                for win in misfit_windows[iter_][step]:
-                    # pick apart information from this window
-                    cha_id = win.parameters["channel_id"]
-                    net, sta, loc, cha = cha_id.split(".")
-                    component = cha[-1]
+                parameters = [_[1] for _ in index.get(iter_, step)]
+                if not parameters:
+                    continue
+                nwin = len(parameters)
+
+                # pick apart information from the windows
+                cha_ids = [_["channel_id"].split(".") for _ in parameters]
+                column = {
+                    "event": np.full(nwin, eid, dtype=object),
+                    "iteration": np.full(nwin, iter_, dtype=object),
+                    "step": np.full(nwin, step, dtype=object),
+                    "network": np.array([_[0] for _ in cha_ids], dtype=object),
+                    "station": np.array([_[1] for _ in cha_ids], dtype=object),
+                    "channel": np.array([_[3] for _ in cha_ids], dtype=object),
+                    "component": np.array([_[3][-1] for _ in cha_ids],
+                                          dtype=object),
+                }
 
+                # Misfit is the same for multiple windows on one component,
+                # steps without adjoint sources are given NaN misfit
+                if adjoint_sources is not None and \
+                        iter_ in adjoint_sources.list() and \
+                        step in adjoint_sources[iter_].list():
+                    misfits = Inspector._get_misfits_from_dataset(
+                        ds, adjoint_sources[iter_][step], iter_, step)
+                else:
+                    misfits = {}
+                column["misfit"] = np.full(nwin, np.nan)
+                for i, (net, sta, loc, cha) in enumerate(cha_ids):
                     try:
+                        column["misfit"][i] = misfits[(net, sta, cha[-1])]
+                    except KeyError:
+                        if verbose:
+                            print(f"No matching adjoint source for "
+                                  f"{'.'.join([net, sta, loc, cha])}")
+
+                # winfo keys match the keys of the Pyflex Window objects
+                for par in winfo:
+                    if par in strings:
+                        column[par] = np.array([_[par] for _ in parameters],
+                                               dtype=object)
+                    else:
+                        column[par] = np.fromiter(
+                            (_[par] for _ in parameters), dtype=float,
+                            count=nwin)
 
-                        # Workaround for potential mismatch between channel
-                        # names of windows and adjsrcs, search for w/ wildcard
-                        adj_tag = fnf(adjoint_sources[iter_][step].list(),
-                                      f"{net}_{sta}_*{component}"
-                                      )[0]
-
-                        # This misfit value will be the same for mult windows
-                        window["misfit"].append(adjoint_sources[iter_][step][
-                            adj_tag].parameters["misfit"])
-                    except IndexError:
-                        if self.verbose:
-                            print(f"No matching adjoint source for {cha_id}")
-                        window["misfit"].append(np.nan)
-
-                    # winfo keys match the keys of the Pyflex Window objects
-                    for par in winfo:
-                        winfo[par].append(win.parameters[par])
-
-                    # get identifying information for this window
-                    window["event"].append(eid)
-                    window["network"].append(net)
-                    window["station"].append(sta)
-                    window["channel"].append(cha)
-                    window["component"].append(component)
-                    window["iteration"].append(iter_)
-                    window["step"].append(step)
-
-                    # useful to get window length information
-                    window["length_s"].append(
-                        win.parameters["relative_endtime"] -
-                        win.parameters["relative_starttime"]
-                    )
-
-        # Only add to internal structure if something was collected
-        if window["event"]:
-            window.update(winfo)
-            self.windows = pd.concat([self.windows, pd.DataFrame(window)],
-                                     ignore_index=True)
-    
-    def discover(self, path="./"):
+                # useful to get window length information
+                column["length_s"] = (column["relative_endtime"] -
+                                      column["relative_starttime"])
+                columns.append(column)
+
+        keys = ["event", "iteration", "step", "network", "station", "channel",
+                "component", "misfit", "length_s"] + winfo
+        if not columns:
+            return pd.DataFrame({key: [] for key in keys}), groups
+
+        return pd.DataFrame({key: np.concatenate([_[key] for _ in columns])
+                             for key in keys}), groups
+
+    @staticmethod
+    def _get_misfits_from_dataset(ds, adjsrcs, iteration, step):
+        """
+        Map the network, station and component of each adjoint source of a
+        given iteration and step to its misfit value
+
+        .. note::
+            Channel names of windows and adjoint sources may not match, so
+            adjoint sources are only matched on component. If multiple adjoint
+            sources share a component, the first in sorted order is used.
+
+        :type ds: pyasdf.ASDFDataSet
+        :param ds: dataset containing the adjoint sources
+        :type adjsrcs: pyasdf.utils.AuxiliaryDataAccessor
+        :param adjsrcs: ds.auxiliary_data.AdjointSources[iter][step]
+        :type iteration: str
+        :param iteration: iteration tag, e.g. 'i01'
+        :type step: str
+        :param step: step tag, e.g. 's00'
+        :rtype: dict
+        :return: {(network, station, component): misfit}
+        """
+        data_type = f"AdjointSources/{iteration}/{step}"
+        misfits = {}
+        for tag in adjsrcs.list():
+            net, sta, *_ = tag.split("_")
+            key = (net, sta, tag[-1])
+            if key not in misfits:
+                misfits[key] = load_auxiliary_parameters(
+                    ds, data_type, tag)["misfit"]
+
+        return misfits
+
+    def _collected_groups(self):
+        """
+        Return the iteration/step groups that have already been collected for
+        each event, used to avoid collecting windows twice
+
+        :rtype: dict
+        :return: {event: set of (iteration, step)}
+        """
+        collected = {}
+        if not self.windows.empty:
+            for event, iter_, step in self.windows.groupby(
+                    ["event", "iteration", "step"], observed=True
+                    ).size().index:
+                collected.setdefault(event, set()).add((iter_, step))
+
+        return collected
+
+    def _merge(self, results):
+        """
+        Concatenate information collected from datasets onto the internal
+        dataframes in a single step, ignoring sources and receivers that
+        have already been collected
+
+        :type results: list of dict
+        :param results: outputs of `read_dataset`, in the order they should
+            be appended
+        """
+        sources = [self.sources] + [_["source"] for _ in results
+                                    if _["source"] is not None]
+        receivers = [self.receivers] + [_["receivers"] for _ in results
+                                        if _["receivers"] is not None]
+        # Windows of an event/iteration/step are only collected once
+        collected = {(event, *group) for event, groups in
+                     self._collected_groups().items() for group in groups}
+        windows = [self.windows]
+        for result in results:
+            if result["windows"] is None or result["windows"].empty:
+                continue
+            keys = list(zip(result["windows"].event,
+                            result["windows"].iteration,
+                            result["windows"].step))
+            windows.append(result["windows"][
+                [key not in collected for key in keys]])
+            collected.update(keys)
+        if len(sources) > 1 or len(receivers) > 1:
+            self._srcrcv = None
+        if len(sources) > 1:
+            self.sources = pd.concat(sources)
+            self.sources = self.sources[
+                ~self.sources.index.duplicated(keep="first")]
+        if len(receivers) > 1:
+            self.receivers = pd.concat(receivers)
+            self.receivers = self.receivers[
+                ~self.receivers.index.duplicated(keep="first")]
+        if len(windows) > 1:
+            # Keep previously calculated misfit and only add the new windows
+            misfits = (self._station_misfit, self._event_misfit,
+                       self._step_misfit)
+            nwin = len(self.windows)
+            self.windows = pd.concat(windows, ignore_index=True)
+            self._station_misfit, self._event_misfit, self._step_misfit = \
+                misfits
+            self._update_misfit(self.windows.iloc[nwin:])
+
+    def discover(self, path="./", cache=None, max_workers=1):
         """
         Allow the Inspector to scour through a path and find relevant files,
         appending them to the internal structure as necessary.
 
+        .. note::
+            If a `cache` is given, the collected information is stored on disk
+            alongside the modification time, size and iteration/step groups
+            of each dataset. Subsequent calls only open datasets that have
+            changed, and only read iteration/step groups that were not
+            previously collected, so that refreshing the Inspector during an
+            inversion does not require re-reading the entire inversion.
+
         :type path: str
         :param path: path to the pyasdf.asdf_data_set.ASDFDataSets that were
             outputted by the Seisflows workflow
+        :type cache: str
+        :param cache: optional filename of a persistent cache of previously
+            discovered datasets, created if it does not exist. If the Inspector
+            is empty, its contents are loaded from the cache
+        :type max_workers: int
+        :param max_workers: number of parallel processes used to read
+            datasets. If 1, datasets are read in serial. If None, defaults to
+            the number of processors on the machine. Results are the same for
+            serial and parallel reading.
         """
+        manifest = {}
+        if cache is not None and os.path.exists(cache) and self.windows.empty:
+            manifest = self._read_discover_cache(cache)
+
         dsfids = glob(os.path.join(path, "*.h5"))
-        for i, dsfid in enumerate(dsfids):
+        collected = self._collected_groups()
+
+        def progress(i, dsfid, status):
+            """Print the status of a single dataset"""
             if self.verbose:
-                print(
-                    f"{os.path.basename(dsfid):<25} {i:0>3}/{len(dsfids):0>3}",
-                    end="...")
-            try:
-                self.append(dsfid)
-                if self.verbose:
-                    print("done")
-            except KeyError as e:
-                if self.verbose:
-                    print(f"error: {e}")
-                    traceback.print_exc()
+                print(f"{os.path.basename(dsfid):<25} "
+                      f"{i:0>3}/{len(dsfids):0>3}...{status}")
+
+        # Datasets that have not been modified since they were cached can be
+        # skipped without opening them
+        pending = []
+        for i, dsfid in enumerate(dsfids):
+            key, stat = os.path.abspath(dsfid), os.stat(dsfid)
+            entry = manifest.get(key)
+            if entry and entry["mtime"] == stat.st_mtime_ns and \
+                    entry["size"] == stat.st_size:
+                progress(i, dsfid, "cached")
                 continue
+            pending.append((i, dsfid, key, stat,
+                            entry["groups"] if entry else None))
+
+        results = {}
+        if max_workers == 1:
+            for i, dsfid, _, _, skip in pending:
+                read = partial(read_dataset, dsfid, skip=skip,
+                               collected=collected, verbose=self.verbose)
+                results[i] = self._discover_result(read, i, dsfid, progress)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(read_dataset, dsfid, skip=skip,
+                                    collected=collected, verbose=self.verbose):
+                        (i, dsfid) for i, dsfid, _, _, skip in pending
+                }
+                for future in as_completed(futures):
+                    i, dsfid = futures[future]
+                    results[i] = self._discover_result(future.result, i,
+                                                       dsfid, progress)
+
+        # Concatenate once, in the order the datasets were found
+        for i, dsfid, key, stat, _ in pending:
+            if results[i] is not None:
+                manifest[key] = {"mtime": stat.st_mtime_ns,
+                                 "size": stat.st_size,
+                                 "groups": results[i]["groups"]}
+        self._merge([results[i] for i, *_ in pending
+                     if results[i] is not None])
+
+        if cache is not None:
+            self._write_discover_cache(cache, manifest)
 
         return self
 
-    def append(self, dsfid, srcrcv=True, windows=True):
+    def _discover_result(self, get, i, dsfid, progress):
+        """
+        Retrieve the result of reading a single dataset during `discover`,
+        reporting progress and skipping datasets that raise KeyErrors
+
+        :type get: function
+        :param get: returns the output of `read_dataset`
+        :type i: int
+        :param i: index of the dataset
+        :type dsfid: str
+        :param dsfid: fid of the dataset
+        :type progress: function
+        :param progress: prints the status of the dataset
+        :rtype: dict or None
+        :return: output of `read_dataset`, None if reading failed
+        """
+        try:
+            result = get()
+        except KeyError as e:
+            progress(i, dsfid, f"error: {e}")
+            if self.verbose:
+                traceback.print_exc()
+            return None
+        progress(i, dsfid, "done" if result is not None else "error")
+
+        return result
+
+    def _read_discover_cache(self, cache):
+        """
+        Load the internal dataframes from a discover cache
+
+        :type cache: str
+        :param cache: filename of the cache written by `discover`
+        :rtype: dict
+        :return: modification time, size and collected (iteration, step)
+            groups of each cached dataset, keyed by absolute dataset path
+        """
+        contents = pd.read_pickle(cache)
+        self.windows = contents["windows"]
+        self.sources = contents["sources"]
+        self.receivers = contents["receivers"]
+
+        return contents["datasets"]
+
+    def _write_discover_cache(self, cache, manifest):
+        """
+        Write the internal dataframes and the dataset manifest to a discover
+        cache. Dataframes are pickled by column blocks, which is much faster
+        to read back than re-parsing CSV files.
+
+        :type cache: str
+        :param cache: filename of the cache
+        :type manifest: dict
+        :param manifest: modification time, size and collected groups of each
+            dataset, keyed by absolute dataset path
+        """
+        pd.to_pickle({"datasets": manifest, "windows": self.windows,
+                      "sources": self.sources, "receivers": self.receivers},
+                     cache)
+
+    def append(self, dsfid, srcrcv=True, windows=True, skip=None):
         """
         Simple function to parse information from a
         pyasdf.asdf_data_setASDFDataSet file and append it to the currect
@@ -376,23 +680,22 @@ class Inspector(InspectorPlotter):
         :param srcrcv: gather source-receiver information
         :type windows: bool
         :param windows: gather window information
+        :type skip: list of tuple
+        :param skip: (iteration, step) groups of this dataset that have already
+            been collected and should not be read again. If None, groups
+            that already exist in the internal structure are skipped
+        :rtype: list of tuple
+        :return: (iteration, step) groups contained in the dataset, or None if
+            the dataset could not be read
         """
-        try:
-            with pyasdf.ASDFDataSet(dsfid) as ds:
-                if srcrcv:
-                    self._get_srcrcv_from_dataset(ds)
-                if windows:
-                    try:
-                        self._get_windows_from_dataset(ds)
-                    except AttributeError as e:
-                        if self.verbose:
-                            print("error reading dataset: "
-                                  "missing auxiliary data")
-                return
-        except OSError:
-            if self.verbose:
-                print(f"error reading dataset: already open")
-            return
+        result = read_dataset(dsfid, srcrcv=srcrcv, windows=windows,
+                              skip=skip, collected=self._collected_groups(),
+                              verbose=self.verbose)
+        if result is None:
+            return None
+        self._merge([result])
+
+        return result["groups"]
 
     def extend(self, windows):
         """
@@ -432,9 +735,12 @@ class Inspector(InspectorPlotter):
             # Determine the new B iteration values based on the
             # final iteration of leg A
             final_iter_a = self.iterations[-1]
-            for iter_ in windows_ext.iteration.unique():
-                shifted_iter = convert(convert(iter_) + convert(final_iter_a))
-                windows_ext.iteration.replace(iter_, shifted_iter, inplace=True)
+            shifted_iters = {
+                iter_: convert(convert(iter_) + convert(final_iter_a))
+                for iter_ in windows_ext.iteration.unique()
+            }
+            windows_ext["iteration"] = \
+                windows_ext.iteration.astype(object).replace(shifted_iters)
 
             self.windows = pd.concat([self.windows, windows_ext])
 
@@ -449,7 +755,9 @@ class Inspector(InspectorPlotter):
         Save the downloaded attributes into JSON files for easier re-loading.
 
         .. note::
-            fmt == 'hdf' requires 'pytables' to be installed in the environment
+            fmt == 'hdf' requires 'pytables' to be installed in the environment,
+            fmt == 'parquet' or 'feather' require 'pyarrow'. Parquet and Feather
+            files keep the column types of compact Inspectors
 
         :type tag: str
         :param tag: tag to use to save files, defaults to the class tag
@@ -457,7 +765,8 @@ class Inspector(InspectorPlotter):
         :type path: str
         :param path: optional path to save to, defaults to cwd
         :type fmt: str
-        :param fmt: format of the files to write, default csv
+        :param fmt: format of the files to write, default csv, available:
+            'csv', 'hdf', 'parquet', 'feather'
         """
         if tag is None:
             tag = self.tag
@@ -467,6 +776,12 @@ class Inspector(InspectorPlotter):
             except ImportError:
                 fmt = "csv"
                 print("format 'hdf' requires pytables, defaulting to 'csv'")
+        elif fmt in ["parquet", "feather"]:
+            try:
+                import pyarrow
+            except ImportError:
+                print(f"format '{fmt}' requires pyarrow, defaulting to 'csv'")
+                fmt = "csv"
 
         if fmt == "csv":
             if not self.sources.empty:
@@ -481,6 +796,14 @@ class Inspector(InspectorPlotter):
                 s["sources"] = self.sources
                 s["receivers"] = self.receivers
                 s["windows"] = self.windows
+        elif fmt in ["parquet", "feather"]:
+            # Neither format stores a non-default index, write it as columns
+            for df, suffix in [(self.sources.reset_index(), "_src"),
+                               (self.receivers.reset_index(), "_rcv"),
+                               (self.windows.reset_index(drop=True), "")]:
+                if not df.empty:
+                    getattr(df, f"to_{fmt}")(
+                        os.path.join(path, f"{tag}{suffix}.{fmt}"))
         else:
             raise NotImplementedError
 
@@ -498,7 +821,8 @@ class Inspector(InspectorPlotter):
         :type path: str
         :param path: optional path to file, defaults to cwd
         :type fmt: str
-        :param fmt: format of the files to read, default csv
+        :param fmt: format of the files to read, if not given, determined
+            from the files available in `path`
         """
         if tag is None:
             tag = self.tag
@@ -510,6 +834,10 @@ class Inspector(InspectorPlotter):
                 fmt = "csv"
             elif os.path.exists(os.path.join(path, f"{tag}.hdf")):
                 fmt = "hdf"
+            elif os.path.exists(os.path.join(path, f"{tag}.parquet")):
+                fmt = "parquet"
+            elif os.path.exists(os.path.join(path, f"{tag}.feather")):
+                fmt = "feather"
             else:
                 raise FileNotFoundError
 
@@ -526,9 +854,32 @@ class Inspector(InspectorPlotter):
                 self.sources = s["sources"]
                 self.receivers = s["receivers"]
                 self.windows = s["windows"]
+        elif fmt in ["parquet", "feather"]:
+            read_fmt = getattr(pd, f"read_{fmt}")
+            self.sources = read_fmt(os.path.join(path, f"{tag}_src.{fmt}"))
+            self.sources.set_index("event_id", inplace=True)
+
+            self.receivers = read_fmt(os.path.join(path, f"{tag}_rcv.{fmt}"))
+            self.receivers.set_index(["network", "station"], inplace=True)
+
+            self.windows = read_fmt(os.path.join(path, f"{tag}.{fmt}"))
         else:
             raise NotImplementedError
 
+    def footprint(self):
+        """
+        Memory used by each of the internal dataframes, including the contents
+        of string columns. Useful to decide whether an Inspector should be
+        `compact`
+
+        :rtype: pandas.Series
+        :return: memory usage in MB of the windows, sources and receivers
+        """
+        return pd.Series(
+            {name: getattr(self, name).memory_usage(deep=True).sum() / 1E6
+             for name in ["windows", "sources", "receivers"]}, name="MB"
+        )
+
     def reset(self):
         """
         Simple function to wipe out all the internal attributes, not super
@@ -572,17 +923,10 @@ class Inspector(InspectorPlotter):
         :rtype: pandas.DataFrame
         :return: DataFrame with selected rows based on selected column values
         """
-        df = self.windows
-        df = df.loc[(df["event"] == (event or df["event"].to_numpy())) &
-                    (df["iteration"] == (
-                                    iteration or df["iteration"].to_numpy())) &
-                    (df["step"] == (step_count or df["step"].to_numpy())) &
-                    (df["station"] == (station or df["station"].to_numpy())) &
-                    (df["network"] == (network or df["network"].to_numpy())) &
-                    (df["channel"] == (channel or df["channel"].to_numpy())) &
-                    (df["component"] == (
-                            component or df["component"].to_numpy()))
-                    ]
+        df = self.windows.iloc[self._isolate_rows(
+            event=event, iteration=iteration, step=step_count,
+            network=network, station=station, channel=channel,
+            component=component)]
         if unique_key is not None:
             # return the unique key alongside identifying information
             unique_keys = ["event", "iteration", "step", "network", "station", 
@@ -602,6 +946,62 @@ class Inspector(InspectorPlotter):
             df = df.loc[:, df.columns.intersection(np.unique(keys))]
         return df
 
+    def _isolate_rows(self, **kwargs):
+        """
+        Find the positions of the rows of the windows dataframe that match
+        the given column values, used by isolate(). Queries are answered by
+        slicing a sorted MultiIndex of the ISOLATE_KEYS columns, which is built
+        once, and the results of recent queries are remembered. Both are
+        invalidated when the windows dataframe is replaced.
+
+        .. note::
+            Modifying the identifying columns of the windows dataframe in place
+            is not detected, reassign Inspector.windows after doing so
+
+        Keyword Arguments
+        ::
+            str event: event id
+            str iteration: iteration
+            str step: step count
+            str network: network code
+            str station: station code
+            str channel: channel code
+            str component: component
+
+        :rtype: np.ndarray
+        :return: sorted positions of the matching rows
+        """
+        # Empty values do not constrain the query
+        query = tuple(kwargs[key] or None for key in ["event", "iteration",
+                                                      "step", "network",
+                                                      "station", "channel",
+                                                      "component"])
+        if query in self._query_cache:
+            self._query_cache.move_to_end(query)
+            return self._query_cache[query]
+
+        if len(self._query_cache) >= ISOLATE_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+
+        if all(_ is None for _ in query):
+            # Ensure missing columns raise KeyErrors as if they were selected
+            rows = np.arange(len(self.windows[ISOLATE_KEYS]))
+        else:
+            if self._query_index is None:
+                index = pd.MultiIndex.from_frame(self.windows[ISOLATE_KEYS])
+                order = index.argsort()
+                self._query_index = (index[order], order)
+            index, order = self._query_index
+            try:
+                rows = np.sort(order[index.get_locs(
+                    [slice(None) if _ is None else [_] for _ in query])])
+            except KeyError:
+                rows = np.array([], dtype=int)
+
+        self._query_cache[query] = rows
+
+        return rows
+
     def nwin(self, level="step"):
         """
         Find the cumulative length of misfit windows for a given iter/step,
@@ -635,7 +1035,7 @@ class Inspector(InspectorPlotter):
         windows = self.windows.loc[:, tuple(group_list)]
         windows.sort_values(group_list, inplace=True)
 
-        group = windows.groupby(group_list[:-1]).length_s
+        group = windows.groupby(group_list[:-1], observed=True).length_s
         df = pd.concat([group.apply(len).rename("nwin"), group.sum()],
                         axis=1)
         if level == "step":
@@ -649,7 +1049,8 @@ class Inspector(InspectorPlotter):
         Sum the total misfit for a given iteration based on the individual
         misfits for each misfit window, and the number of sources used.
         Calculated misfits are stored internally to avoid needing to recalculate
-        each time this function is called
+        each time this function is called, and are updated when new windows
+        are collected with `discover` or `append`
 
         .. note::
             To get per-station misfit on a per-step basis
@@ -666,72 +1067,129 @@ class Inspector(InspectorPlotter):
         :rtype: dict
         :return: total misfit for each iteration in the class
         """
-        # We will try to access internal attributes first to save time
-        if not reset:
-            if level == "step" and self._step_misfit is not None:
-                return self._step_misfit
-            elif level == "station" and self._station_misfit is not None:
-                return self._station_misfit
-            elif level == "event" and self._event_misfit is not None:
-                return self._event_misfit
+        if level not in ["station", "event", "step"]:
+            raise NotImplementedError(
+                "level must be 'station', 'event' or 'step'")
 
-        # Various levels to sort the misfit by
-        group_list = ["iteration", "step", "event", "station", "component", 
-                      "misfit"]
-        misfits = self.windows.loc[:, tuple(group_list)]
+        # Each level is derived from the previous, calculate only what has not
+        # already been stored internally
+        if reset:
+            self._station_misfit = None
+            self._event_misfit = None
+            self._step_misfit = None
+        if self._station_misfit is None:
+            self._station_misfit = self._get_station_misfit(self.windows)
+        if level == "station":
+            return self._station_misfit
+
+        if self._event_misfit is None:
+            self._event_misfit = self._get_event_misfit(self._station_misfit)
+        if level == "event":
+            return self._event_misfit
+
+        if self._step_misfit is None:
+            self._step_misfit = self._get_step_misfit(self._event_misfit)
+
+        return self._step_misfit
+
+    @staticmethod
+    def _get_station_misfit(windows):
+        """
+        Calculate unscaled misfit and number of windows for each station,
+        and station misfit, defined as the unscaled misfit divided by the number
+        of windows (there is no formal definition of station misfit)
+
+        :type windows: pandas.DataFrame
+        :param windows: windows dataframe
+        :rtype: pandas.DataFrame
+        :return: misfit indexed by iteration, step, event and station
+        """
+        group_list = ["iteration", "step", "event", "station"]
+        misfits = windows.loc[:, group_list + ["component", "misfit"]]
 
         # Count the number of windows on a per station basis
-        nwin = misfits.groupby(
-                group_list[:-1]).misfit.apply(len).rename("nwin")
+        nwin = misfits.groupby(group_list, observed=True).size().rename(
+            "nwin")
 
         # Misfit is unique per component, not window, drop repeat components
-        misfits.drop_duplicates(subset=group_list[:-1], keep="first", 
-                                inplace=True)
-
-        # Group misfit and window on a per station basis, collect together
-        nwin = nwin.groupby(group_list[:-2]).sum()
+        misfits = misfits.drop_duplicates(subset=group_list + ["component"],
+                                          keep="first")
         misfits = misfits.groupby(
-                group_list[:-2]).misfit.sum().rename("unscaled_misfit")
+            group_list, observed=True).misfit.sum().rename("unscaled_misfit")
+
         df = pd.concat([misfits, nwin], axis=1)
+        df["misfit"] = df.unscaled_misfit / df.nwin
 
-        # No formal definition of station misfit so we just define it as the
-        # misfit for a given station, divided by number of windows
-        if level == "station":
-            df["misfit"] = df.apply(
-                lambda row: row.unscaled_misfit / row.nwin, axis=1
-            )
-        # Event misfit function defined by Tape et al. (2010) Eq. 6
-        elif level in ["event", "step"]:
-            # Group misfits to the event level and sum together windows, misfit
-            df = df.groupby(group_list[:3]).sum() 
-            df["misfit"] = df.apply(
-                lambda row: row.unscaled_misfit / (2 * row.nwin), axis=1
-            )
-            if level == "step":
-                # Sum the event misfits if step-wise misfit is requested
-                misfits = df.loc[:, "misfit"]
-                group = misfits.groupby(["iteration", "step"])
-                df = pd.concat([group.apply(len).rename("n_event"),
-                                group.sum().rename("summed_misfit")], axis=1)
-                # Misfit function a la Tape et al. (2010) Eq. 7
-                df["misfit"] = df.apply(
-                    lambda row: row.summed_misfit / row.n_event, axis=1
-                )
-                df.drop(labels="summed_misfit", axis=1)
-        else:
-            raise NotImplementedError(
-                "level must be 'station', 'event' or 'step'")
+        return df
 
-        # Set internal attribute for easier access at next request
-        if level == "step":
-            self._step_misfit = df
-        elif level == "station":
-            self._station_misfit = df
-        elif level == "event":
-            self._event_misfit = df
+    @staticmethod
+    def _get_event_misfit(station_misfit):
+        """
+        Calculate event misfit from station misfit following
+        Tape et al. (2010) Eq. 6
+
+        :type station_misfit: pandas.DataFrame
+        :param station_misfit: output of `_get_station_misfit`
+        :rtype: pandas.DataFrame
+        :return: misfit indexed by iteration, step and event
+        """
+        df = station_misfit.loc[:, ["unscaled_misfit", "nwin"]].groupby(
+            level=["iteration", "step", "event"], observed=True).sum()
+        df["misfit"] = df.unscaled_misfit / (2 * df.nwin)
 
         return df
 
+    @staticmethod
+    def _get_step_misfit(event_misfit):
+        """
+        Calculate the misfit of each step from event misfit following
+        Tape et al. (2010) Eq. 7
+
+        :type event_misfit: pandas.DataFrame
+        :param event_misfit: output of `_get_event_misfit`
+        :rtype: pandas.DataFrame
+        :return: misfit indexed by iteration and step
+        """
+        group = event_misfit.misfit.groupby(level=["iteration", "step"],
+                                            observed=True)
+        df = pd.concat([group.size().rename("n_event"),
+                        group.sum().rename("summed_misfit")], axis=1)
+        df["misfit"] = df.summed_misfit / df.n_event
+
+        return df
+
+    def _update_misfit(self, windows):
+        """
+        Update internally stored misfit with newly collected windows, so that
+        collecting a new iteration or step does not require recalculating the
+        misfit of all previous iterations and steps. Station and event misfit
+        of the new windows are appended, step misfit is recalculated from event
+        misfit. If the new windows belong to an event, iteration and step that
+        already have stored misfit, stored misfit is reset instead.
+
+        :type windows: pandas.DataFrame
+        :param windows: newly collected windows
+        """
+        if self._station_misfit is None or windows.empty:
+            return
+
+        station_misfit = self._get_station_misfit(windows)
+        if station_misfit.index.droplevel("station").isin(
+                self._station_misfit.index.droplevel("station")).any():
+            self._station_misfit = None
+            self._event_misfit = None
+            self._step_misfit = None
+            return
+
+        self._station_misfit = pd.concat(
+            [self._station_misfit, station_misfit]).sort_index()
+        if self._event_misfit is not None:
+            self._event_misfit = pd.concat(
+                [self._event_misfit, self._get_event_misfit(station_misfit)]
+            ).sort_index()
+        if self._step_misfit is not None:
+            self._step_misfit = self._get_step_misfit(self._event_misfit)
+
     def compare_misfit(self, iter_init=None, step_init=None, iter_final=None, 
                        step_final=None):
         """
@@ -852,49 +1310,38 @@ class Inspector(InspectorPlotter):
             iteration, step count and misfit value, and the status of the
             function evaluation.
         """
-        misfit = self.misfit()
-        models = {"model": [], "iteration": [], "step_count": [], "misfit": [],
-                  "status": [], "state": []
-                  }
-
-        # Model lags iteration by 1
-        for m, iter_ in enumerate(self.iterations):
-            # First we collect misfit values for each step for reference
-            misfits_ = [float(misfit.loc[iter_].loc[_].misfit) for _ in
-                        self.steps[iter_]
-                        ]
-
-            # Then we loop through the steps and pick out the smallest misfit
-            for s, step in enumerate(self.steps[iter_]):
-                # Initial evaluation, accepted misfits
-                if step == "s00":
-                    model = m
-                    status = 0
-                # Line search, mix of discards and final misfit
-                else:
-                    model = m + 1
-                    if misfits_[s] == min(misfits_):
-                        status = 1
-                    else:
-                        status = -1
-
-                models["model"].append(f"m{model:0>2}")
-                models["misfit"].append(misfits_[s])
-                models["iteration"].append(iter_)
-                models["step_count"].append(step)
-                models["state"].append(status)
-                models["status"].append({0: "INITIAL", 
-                                        1: "SUCCESS", 
-                                        -1: "DISCARD"}[status]
-                                        )
-
-        self._models = pd.DataFrame(models)
-
-    def get_srcrcv(self):
+        misfit = self.misfit().misfit
+        iterations = misfit.index.get_level_values("iteration").to_numpy()
+        steps = misfit.index.get_level_values("step").to_numpy()
+
+        # Model lags iteration by 1. Initial evaluations correspond to the
+        # model of the iteration, line searches to the next model, where the
+        # smallest misfit of the iteration is the accepted step
+        model = pd.factorize(iterations, sort=True)[0]
+        initial = steps == "s00"
+        success = misfit.to_numpy() == misfit.groupby(
+            level="iteration", observed=True).transform("min").to_numpy()
+        state = np.where(initial, 0, np.where(success, 1, -1))
+        model = np.where(initial, model, model + 1)
+
+        self._models = pd.DataFrame({
+            "model": [f"m{_:0>2}" for _ in model],
+            "iteration": iterations,
+            "step_count": steps,
+            "misfit": misfit.to_numpy(),
+            "status": [{0: "INITIAL", 1: "SUCCESS", -1: "DISCARD"}[_]
+                       for _ in state],
+            "state": state
+        })
+
+    def get_srcrcv(self, spherical=False):
         """
         Retrieve information regarding source-receiver pairs including distance,
         backazimuth and theoretical traveltimes for a 1D Earth model.
 
+        :type spherical: bool
+        :param spherical: calculate distances on a sphere rather than the
+            WGS84 ellipsoid, see `pyatoa.utils.srcrcv.gcd_and_baz_array`
         :rtype: pandas.core.frame.DataFrame
         :return: separate dataframe with distance and backazimuth columns, that
             may be used as a lookup table
@@ -902,34 +1349,72 @@ class Inspector(InspectorPlotter):
         if self.sources.empty or self.receivers.empty:
             return []
 
-        srcrcv_dict = {"event": [], "network": [], "station": [],
-                       "distance_km": [], "backazimuth": []
-                       }
-
-        for eid, elat, elon, edpth in zip(self.sources.index.to_numpy(),
-                                          self.sources.latitude.to_numpy(),
-                                          self.sources.longitude.to_numpy(),
-                                          self.sources.depth_km.to_numpy()
-                                          ):
-            for rid, rlat, rlon in zip(self.receivers.index,
-                                       self.receivers.latitude.to_numpy(),
-                                       self.receivers.longitude.to_numpy()
-                                       ):
-                gcd, _, baz = gps2dist_azimuth(lat1=elat, lon1=elon,
-                                               lat2=rlat, lon2=rlon,
-                                               )
-                net, sta = rid
-                srcrcv_dict["event"].append(eid)
-                srcrcv_dict["network"].append(net)
-                srcrcv_dict["station"].append(sta)
-                srcrcv_dict["distance_km"].append(gcd * 1E-3)
-                srcrcv_dict["backazimuth"].append(baz)
-
-        self._srcrcv = pd.DataFrame(srcrcv_dict)
-
-
-
-
-
-
-
+        # All sources against all receivers, sources varying slowest
+        gcd, baz = gcd_and_baz_array(
+            src_lat=self.sources.latitude.to_numpy()[:, None],
+            src_lon=self.sources.longitude.to_numpy()[:, None],
+            rcv_lat=self.receivers.latitude.to_numpy(),
+            rcv_lon=self.receivers.longitude.to_numpy(),
+            spherical=spherical
+        )
+        nsrc, nrcv = gcd.shape
+        self._srcrcv = pd.DataFrame({
+            "event": np.repeat(self.sources.index.to_numpy(), nrcv),
+            "network": np.tile(
+                self.receivers.index.get_level_values("network"), nsrc),
+            "station": np.tile(
+                self.receivers.index.get_level_values("station"), nsrc),
+            "distance_km": gcd.ravel(),
+            "backazimuth": baz.ravel()
+        })
+
+
+def read_dataset(dsfid, srcrcv=True, windows=True, skip=None, collected=None,
+                 verbose=False):
+    """
+    Read source, receiver and window information from a single dataset. Kept
+    at the module level so that datasets can be read in parallel processes
+    by Inspector.discover.
+
+    :type dsfid: str
+    :param dsfid: fid of the dataset
+    :type srcrcv: bool
+    :param srcrcv: gather source-receiver information
+    :type windows: bool
+    :param windows: gather window information
+    :type skip: list of tuple
+    :param skip: (iteration, step) groups of this dataset that have already
+        been collected and should not be read again
+    :type collected: dict
+    :param collected: {event: set of (iteration, step)} already collected by
+        an Inspector, used if `skip` is not given
+    :type verbose: bool
+    :param verbose: print information about missing data
+    :rtype: dict
+    :return: keys 'source', 'receivers', 'windows' (DataFrames or None) and
+        'groups' (list of (iteration, step) in the dataset), or None if the
+        dataset could not be opened
+    """
+    result = {"source": None, "receivers": None, "windows": None,
+              "groups": []}
+    try:
+        with pyasdf.ASDFDataSet(dsfid, mode="r") as ds:
+            if srcrcv:
+                result["source"], result["receivers"] = \
+                    Inspector._get_srcrcv_from_dataset(ds)
+            if windows:
+                if skip is None and collected:
+                    skip = collected.get(format_event_name(ds))
+                try:
+                    result["windows"], result["groups"] = \
+                        Inspector._get_windows_from_dataset(ds, skip=skip,
+                                                            verbose=verbose)
+                except AttributeError as e:
+                    if verbose:
+                        print("error reading dataset: "
+                              "missing auxiliary data")
+            return result
+    except OSError:
+        if verbose:
+            print(f"error reading dataset: already open")
+        return None
@@ -7,6 +7,7 @@ import obspy
 import pyflex
 import warnings
 import pyadjoint
+import numpy as np
 from obspy.signal.filter import envelope
 
 from pyatoa import logger
@@ -14,12 +15,16 @@ from pyatoa.core.config import Config
 from pyatoa.core.gatherer import Gatherer, GathererNoDataException
 from pyatoa.utils.form import channel_code
 from pyatoa.utils.process import is_preprocessed
-from pyatoa.utils.asdf.load import load_windows, load_adjsrcs
-from pyatoa.utils.window import reject_on_global_amplitude_ratio
+from pyatoa.utils.asdf.load import (load_windows, load_adjsrcs,
+                                    load_phase_arrivals)
+from pyatoa.utils.window import (WindowSelector, window_criteria,
+                                 reject_on_global_amplitude_ratio)
 from pyatoa.utils.srcrcv import gcd_and_baz
-from pyatoa.utils.asdf.add import add_misfit_windows, add_adjoint_sources
-from pyatoa.utils.process import (default_process, trim_streams, zero_pad,
-                                  match_npts)
+from pyatoa.utils.adjoint import BATCH_ADJ_SRC_TYPES, calculate_adjoint_sources
+from pyatoa.utils.asdf.add import (add_misfit_windows, add_adjoint_sources,
+                                   add_phase_arrivals)
+from pyatoa.utils.process import (default_process, zero_pad, resample,
+                                  trim_and_pad)
 
 from pyatoa.visuals.mgmt_plot import ManagerPlotter
 
@@ -205,6 +210,15 @@ class Manager:
         else:
             return None
 
+    @property
+    def misfit_only(self):
+        """
+        Return True if adjoint sources were measured without adjoint source
+        time series, i.e. by measure(misfit_only=True)
+        """
+        return bool(self.adjsrcs) and any(_.adjoint_source is None for _ in
+                                          self.adjsrcs.values())
+
     def check(self):
         """
         (Re)check the stats of the workflow and data within the Manager.
@@ -338,6 +352,7 @@ class Manager:
         from copy import deepcopy
 
         assert(self.adjsrcs is not None), f"No adjoint sources to write"
+        assert(not self.misfit_only), f"Adjoint sources are misfit only"
 
         for adj in self.adjsrcs.values():
             fid = f"{adj.network}.{adj.station}.{adj.component}.adj"
@@ -452,6 +467,10 @@ class Manager:
             mgmt = Manager()
             mgmt.flow() == mgmt.standardize().preprocess().window().measure()
 
+        .. note::
+            If the kwarg `misfit_only` is True, only the misfit is measured and
+            no adjoint sources are calculated or saved, see measure()
+
         :raises ManagerError: for any controlled exceptions
         """
         force = kwargs.get("force", False)
@@ -462,12 +481,13 @@ class Manager:
         overwrite = kwargs.get("overwrite", None)
         which = kwargs.get("which", "both")
         save = kwargs.get("save", True)
+        misfit_only = kwargs.get("misfit_only", False)
 
         self.standardize(standardize_to=standardize_to, force=force)
         self.preprocess(overwrite=overwrite, which=which, **kwargs)
         self.window(fix_windows=fix_windows, iteration=iteration,
                     step_count=step_count, force=force, save=save)
-        self.measure(force=force, save=save)
+        self.measure(force=force, save=save, misfit_only=misfit_only)
 
     def gather(self, code=None, choice=None, **kwargs):
         """
@@ -584,23 +604,23 @@ class Manager:
         if dt_st > 0:
             self.st_obs = zero_pad(self.st_obs, dt_st, before=True, after=False)
 
-        # Match sampling rates
         if standardize_to == "syn":
-            self.st_obs.resample(self.st_syn[0].stats.sampling_rate)
+            st_const, st_change = self.st_syn, self.st_obs
         else:
-            self.st_syn.resample(self.st_obs[0].stats.sampling_rate)
+            st_const, st_change = self.st_obs, self.st_syn
 
-        # Match start and endtimes
-        self.st_obs, self.st_syn = trim_streams(
-            st_a=self.st_obs, st_b=self.st_syn,
-            force={"obs": "a", "syn": "b"}[standardize_to]
-            )
+        # Match sampling rates, polyphase resampling if rates allow
+        st_change = resample(st_change, st_const[0].stats.sampling_rate)
 
-        # Match the number of samples 
-        self.st_obs, self.st_syn = match_npts(
-            st_a=self.st_obs, st_b=self.st_syn,
-            force={"obs": "a", "syn": "b"}[standardize_to]
-            )
+        # Match start and endtimes and the number of samples
+        st_change = trim_and_pad(st_change,
+                                 starttime=st_const[0].stats.starttime,
+                                 npts=st_const[0].stats.npts)
+
+        if standardize_to == "syn":
+            self.st_obs = st_change
+        else:
+            self.st_syn = st_change
 
         # Determine if synthetics start before the origintime
         if self.event is not None:
@@ -624,7 +644,9 @@ class Manager:
         .. note::
             Default preprocessing can be overwritten using a
             user-defined function that takes Manager and choice as inputs
-            and outputs an ObsPy Stream object.
+            and outputs an ObsPy Stream object. For example
+            `pyatoa.utils.process.batch_process` processes all traces of a
+            stream at once as 2D arrays.
 
         .. note::
             Documented kwargs only apply to default preprocessing.
@@ -653,6 +675,9 @@ class Manager:
             bool convolve_with_stf:
                 Convolve synthetic data with a Gaussian source time function if
                 a half duration is provided.
+            bool batch:
+                Detrend, taper and filter all traces at once as 2D arrays
+                rather than trace by trace. Defaults to False
         """
         if not self.inv and not self.config.synthetics_only:
             raise ManagerError("cannot preprocess, no inventory")
@@ -699,7 +724,10 @@ class Manager:
         .. note::
             * Windows are stored as dictionaries of pyflex.Window objects.
             * All windows are saved into the ASDFDataSet, even if retrieved.
-            * STA/LTA information is collected and stored internally.
+            * STA/LTA information is collected and stored internally, unless
+              windows are fixed, in which case it is calculated on plotting.
+            * Criteria of fixed windows are recalculated for all windows of
+              the station at once, without Pyflex.
 
         :type fix_windows: bool
         :param fix_windows: do not pick new windows, but load windows from the
@@ -740,21 +768,13 @@ class Manager:
             # dataset for windows under the current iteration/step_count
             return_previous = False
 
-        # Synthetic STA/LTA as Pyflex WindowSelector.calculate_preliminaries()
-        for comp in self.config.component_list:
-            try:
-                self.staltas[comp] = pyflex.stalta.sta_lta(
-                    data=envelope(self.st_syn.select(component=comp)[0].data),
-                    dt=self.st_syn.select(component=comp)[0].stats.delta,
-                    min_period=self.config.min_period
-                )
-            except IndexError:
-                continue
-
-        # Find misfit windows, from a dataset or through window selection
+        # Find misfit windows, from a dataset or through window selection.
+        # STA/LTA is only needed for fixed windows if plotting, see plot()
         if fix_windows:
+            self.staltas = {}
             self.retrieve_windows(iteration, step_count, return_previous)
         else:
+            self.calculate_staltas()
             self.select_windows_plus()
 
         if save:
@@ -763,6 +783,22 @@ class Manager:
 
         return self
 
+    def calculate_staltas(self):
+        """
+        Calculate the STA/LTA of the synthetic waveforms for each component,
+        as in Pyflex WindowSelector.calculate_preliminaries(), used for
+        plotting
+        """
+        for comp in self.config.component_list:
+            try:
+                self.staltas[comp] = pyflex.stalta.sta_lta(
+                    data=envelope(self.st_syn.select(component=comp)[0].data),
+                    dt=self.st_syn.select(component=comp)[0].stats.delta,
+                    min_period=self.config.min_period
+                )
+            except IndexError:
+                continue
+
     def retrieve_windows(self, iteration, step_count, return_previous):
         """
         Mid-level window selection function that retrieves windows from a 
@@ -789,25 +825,32 @@ class Manager:
                                )
 
         # Recalculate window criteria for new values for cc, tshift, dlnA etc...
+        # for all windows of the station at once
         logger.debug("recalculating window criteria")
+        obs, syn, index, wins = [], [], [], []
         for comp, windows_ in windows.items():
             try:
-                d = self.st_obs.select(component=comp)[0].data
-                s = self.st_syn.select(component=comp)[0].data
-                for w, win in enumerate(windows_):
-                    # Post the old and new values to the logger for sanity check
-                    logger.debug(f"{comp}{w}_old - "
-                                 f"cc:{win.max_cc_value:.2f} / "
-                                 f"dt:{win.cc_shift:.1f} / "
-                                 f"dlnA:{win.dlnA:.2f}")
-                    win._calc_criteria(d, s)
-                    logger.debug(f"{comp}{w}_new - "
-                                 f"cc:{win.max_cc_value:.2f} / "
-                                 f"dt:{win.cc_shift:.1f} / "
-                                 f"dlnA:{win.dlnA:.2f}")
+                obs.append(self.st_obs.select(component=comp)[0].data)
+                syn.append(self.st_syn.select(component=comp)[0].data)
             # IndexError thrown when trying to access an empty Stream
             except IndexError:
                 continue
+            index += [len(obs) - 1] * len(windows_)
+            wins += [(f"{comp}{w}", win) for w, win in enumerate(windows_)]
+
+        if wins:
+            criteria = window_criteria(
+                obs=np.vstack(obs), syn=np.vstack(syn),
+                left=[win.left for _, win in wins],
+                right=[win.right for _, win in wins], index=np.array(index)
+            )
+            for (tag, win), cc, shift, dlna in zip(wins, *criteria):
+                # Post the old and new values to the logger for sanity check
+                logger.debug(f"{tag}_old - cc:{win.max_cc_value:.2f} / "
+                             f"dt:{win.cc_shift:.1f} / dlnA:{win.dlnA:.2f}")
+                win.max_cc_value, win.cc_shift, win.dlnA = cc, shift, dlna
+                logger.debug(f"{tag}_new - cc:{win.max_cc_value:.2f} / "
+                             f"dt:{win.cc_shift:.1f} / dlnA:{win.dlnA:.2f}")
 
         self.windows = windows
         self.stats.nwin = sum(len(_) for _ in self.windows.values())
@@ -831,9 +874,22 @@ class Manager:
             We could potentially deal with this by zero-padding the
             waveforms, and running select_windows() again, but for now we just
             raise a ManagerError and allow processing to continue
+
+        .. note::
+            Phase arrivals are calculated once per source-receiver pair and
+            stored in the dataset, if available, so that TauP is not called
+            again for subsequent evaluations, e.g. during a line search
         """
         logger.info(f"running Pyflex w/ map: {self.config.pyflex_preset}")
 
+        # Phase arrivals do not change during an inversion, try the dataset
+        net, sta = self.st_obs[0].stats.network, self.st_obs[0].stats.station
+        arrivals_path = f"{self.config.pyflex_config.earth_model}/{net}_{sta}"
+        ttimes = None
+        if self.ds is not None:
+            ttimes = load_phase_arrivals(self.ds, arrivals_path)
+        save_ttimes = ttimes is None
+
         nwin, window_dict, reject_dict = 0, {}, {}
         for comp in self.config.component_list:
             try:
@@ -846,10 +902,10 @@ class Manager:
             # Pyflex throws a TauP warning from ObsPy #2280, ignore that
             with warnings.catch_warnings():
                 warnings.simplefilter("ignore", UserWarning)
-                ws = pyflex.WindowSelector(observed=obs, synthetic=syn,
-                                           config=self.config.pyflex_config,
-                                           event=self.event,
-                                           station=self.inv)
+                ws = WindowSelector(observed=obs, synthetic=syn,
+                                    config=self.config.pyflex_config,
+                                    event=self.event, station=self.inv,
+                                    ttimes=ttimes)
                 try:
                     windows = ws.select_windows()
                 except (IndexError, pyflex.PyflexError):
@@ -857,6 +913,9 @@ class Manager:
                     raise ManagerError("Cannot window, most likely because "
                                        "the source-receiver distance is too "
                                        "small w.r.t the minimum period")
+            # Reuse arrivals for the remaining components
+            if ws.ttimes:
+                ttimes = ws.ttimes
 
             # Suppress windows that contain low-amplitude signals
             if self.config.win_amp_ratio > 0:
@@ -877,11 +936,15 @@ class Manager:
             logger.info(f"{len(windows)} window(s) selected for comp {comp}")
             nwin += len(windows)
 
+        if save_ttimes and ttimes and self.ds is not None and \
+                self.config.save_to_ds:
+            add_phase_arrivals(ttimes, self.ds, arrivals_path)
+
         self.windows = window_dict
         self.rejwins = reject_dict
         self.stats.nwin = nwin
 
-    def measure(self, force=False, save=True):
+    def measure(self, force=False, save=True, misfit_only=False):
         """
         Measure misfit and calculate adjoint sources using PyAdjoint.
 
@@ -898,11 +961,26 @@ class Manager:
             Tape (2010) Eq. 6, the total summed misfit will need to be scaled by 
             the number of misfit windows chosen in Manager.window().
 
+        .. note::
+            Batched adjoint source types, e.g. Config.adj_src_type
+            'cc_traveltime_misfit_batch', are calculated for all windows at
+            once by pyatoa.utils.adjoint rather than by Pyadjoint.
+
+        .. note::
+            With `misfit_only`, Pyadjoint still measures misfit per window but
+            does not assemble adjoint source time series, so AdjointSource
+            objects only carry the misfit. These cannot be saved or written to
+            disk. Useful for line search trial steps where only the misfit is
+            required.
+
         :type force: bool
         :param force: ignore flag checks and run function, useful if e.g.
             external preprocessing is used that doesn't meet flag criteria
         :type save: bool
         :param save: save adjoint sources to ASDFDataSet
+        :type misfit_only: bool
+        :param misfit_only: only calculate the misfit, do not calculate or save
+            adjoint sources
         """
         self.check()
 
@@ -919,31 +997,37 @@ class Manager:
         # Create list of windows needed for Pyadjoint
         adjoint_windows = self._format_windows()
 
-        # Run Pyadjoint to retrieve adjoint source objects
-        total_misfit, adjoint_sources = 0, {}
-        for comp, adj_win in adjoint_windows.items():
-            try:
-                adj_src = pyadjoint.calculate_adjoint_source(
-                    adj_src_type=self.config.adj_src_type,
-                    config=self.config.pyadjoint_config,
-                    observed=self.st_obs.select(component=comp)[0],
-                    synthetic=self.st_syn.select(component=comp)[0],
-                    window=adj_win, plot=False
-                    )
-
-                # Re-format component name to reflect SPECFEM convention
-                adj_src.component = f"{channel_code(adj_src.dt)}X{comp}"
-
-                # Save adjoint sources in dictionary object. Sum total misfit
-                adjoint_sources[comp] = adj_src
-                logger.info(f"{adj_src.misfit:.3f} misfit for comp {comp}")
-                total_misfit += adj_src.misfit
-            except IndexError:
-                continue
+        # Run Pyadjoint, or the batched equivalent, to retrieve adjoint sources
+        if self.config.adj_src_type in BATCH_ADJ_SRC_TYPES:
+            adjoint_sources = calculate_adjoint_sources(
+                st_obs=self.st_obs, st_syn=self.st_syn,
+                windows=adjoint_windows, config=self.config.pyadjoint_config,
+                adj_src_type=self.config.adj_src_type,
+                adjoint_src=not misfit_only
+            )
+        else:
+            adjoint_sources = {}
+            for comp, adj_win in adjoint_windows.items():
+                try:
+                    adjoint_sources[comp] = pyadjoint.calculate_adjoint_source(
+                        adj_src_type=self.config.adj_src_type,
+                        config=self.config.pyadjoint_config,
+                        observed=self.st_obs.select(component=comp)[0],
+                        synthetic=self.st_syn.select(component=comp)[0],
+                        window=adj_win, adjoint_src=not misfit_only,
+                        plot=False
+                        )
+                except IndexError:
+                    continue
+
+        for comp, adj_src in adjoint_sources.items():
+            # Re-format component name to reflect SPECFEM convention
+            adj_src.component = f"{channel_code(adj_src.dt)}X{comp}"
+            logger.info(f"{adj_src.misfit:.3f} misfit for comp {comp}")
 
         # Save adjoint source internally and to dataset
         self.adjsrcs = adjoint_sources
-        if save:
+        if save and not misfit_only:
             self.save_adjsrcs()
 
         # Run check to get total misfit
@@ -968,7 +1052,8 @@ class Manager:
                            "will not save windows")
         else:
             logger.debug("saving misfit windows to ASDFDataSet")
-            add_misfit_windows(self.windows, self.ds, path=self.config.aux_path)
+            add_misfit_windows(self.windows, self.ds, path=self.config.aux_path,
+                               columnar=self.config.columnar_windows)
 
     def save_adjsrcs(self):
         """
@@ -982,6 +1067,9 @@ class Manager:
                            "adjoint sources")
         elif not self.adjsrcs:
             logger.warning("Manager has no adjoint sources to save")
+        elif self.misfit_only:
+            logger.warning("adjoint sources were measured misfit only, "
+                           "will not save adjoint sources")
         elif not self.config.save_to_ds:
             logger.warning("config parameter save_to_ds is set False, "
                            "will not save adjoint sources")
@@ -1055,6 +1143,10 @@ class Manager:
                                           self.event is None):
             raise ManagerError("cannot plot map, no event and/or inv found")
 
+        # STA/LTA is not calculated when windows are fixed, add for plotting
+        if choice in ["wav", "both"] and self.windows and not self.staltas:
+            self.calculate_staltas()
+
         mp = ManagerPlotter(mgmt=self)
         if choice == "wav":
             mp.plot_wav(show=show, save=save, **kwargs)
@@ -4,16 +4,21 @@ with a SeisFlows workflow. Includes multiprocessing functionality to run Pyatoa
 processing in parallel.
 """
 import os
+import json
+import time
 import pyatoa
 import logging
 import warnings
+import numpy as np
 from glob import glob
 from copy import deepcopy
+from functools import partial
 from pyasdf import ASDFDataSet
 from pyatoa.utils.images import merge_pdfs
 from pyatoa.utils.read import read_station_codes
 from pyatoa.utils.asdf.clean import clean_dataset
-from concurrent.futures import ProcessPoolExecutor
+from pyatoa.utils.asdf.add import consolidate_misfit_windows
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 
 class IO(dict):
@@ -70,7 +75,80 @@ class IO(dict):
         self[key] = value
 
     def __getattr__(self, key):
-        return self[key]
+        # AttributeError is required for pickling, e.g. for multiprocessing
+        try:
+            return self[key]
+        except KeyError as e:
+            raise AttributeError(key) from e
+
+
+class DeferredDataSet(ASDFDataSet):
+    """
+    A read-only ASDFDataSet used by parallel station workers. Reads are made
+    directly from the dataset, while write calls are recorded so that they
+    can be replayed, in order, by the single process that owns the writeable
+    dataset handle. Being an ASDFDataSet, it is treated the same as the
+    dataset of the serial workflow, e.g. by Config.write() and
+    format_event_name().
+
+    .. note::
+        HDF5 does not allow a file to be written to while other processes are
+        reading from it, so workers open the dataset in read-only mode and
+        defer all writing to Pyaflowa.process_event()
+    """
+    def __init__(self, filename, **kwargs):
+        """
+        Kwargs passed to pyasdf.ASDFDataSet
+
+        :type filename: str
+        :param filename: path to an existing dataset, opened read-only
+        """
+        self.calls = []
+        super().__init__(filename, mode="r", **kwargs)
+
+    def add_quakeml(self, *args, **kwargs):
+        """Record a call to ASDFDataSet.add_quakeml()"""
+        self.calls.append(("add_quakeml", args, kwargs))
+
+    def add_stationxml(self, *args, **kwargs):
+        """Record a call to ASDFDataSet.add_stationxml()"""
+        self.calls.append(("add_stationxml", args, kwargs))
+
+    def add_waveforms(self, *args, **kwargs):
+        """Record a call to ASDFDataSet.add_waveforms()"""
+        self.calls.append(("add_waveforms", args, kwargs))
+
+    def add_auxiliary_data(self, *args, **kwargs):
+        """Record a call to ASDFDataSet.add_auxiliary_data()"""
+        self.calls.append(("add_auxiliary_data", args, kwargs))
+
+    # Exceptions raised by pyasdf when the data is already in the dataset
+    _DUPLICATE_ERRORS = {"add_quakeml": ValueError, "add_stationxml": TypeError}
+
+    @staticmethod
+    def replay(calls, ds):
+        """
+        Replay the recorded write calls onto a writeable dataset. Exceptions
+        that are normally caught when writing duplicate data are ignored, any
+        other failed write is logged and skipped so that the remaining calls
+        are still written.
+
+        :type calls: list of tuple
+        :param calls: recorded (method name, args, kwargs) write calls
+        :type ds: pyasdf.ASDFDataSet
+        :param ds: dataset to write the recorded data into
+        """
+        for method, args, kwargs in calls:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                try:
+                    getattr(ds, method)(*args, **kwargs)
+                except Exception as e:
+                    if isinstance(e, DeferredDataSet._DUPLICATE_ERRORS.get(
+                            method, ())):
+                        continue
+                    pyatoa.logger.warning(f"deferred {method} failed: "
+                                          f"{type(e).__name__}: {e}")
 
 
 class PathStructure:
@@ -325,7 +403,8 @@ class Pyaflowa:
         self.map_corners = map_corners
         self.log_level = log_level
 
-    def process_event(self, source_name, codes=None, **kwargs):
+    def process_event(self, source_name, codes=None, max_workers=1,
+                      misfit_only=False, **kwargs):
         """
         The main processing function for Pyaflowa misfit quantification.
 
@@ -336,54 +415,264 @@ class Pyaflowa:
 
         Kwargs passed to pyatoa.Manager.flow() function.
 
+        .. note::
+            With `misfit_only`, e.g. for line search trial steps, no adjoint
+            sources are calculated, and neither adjoint sources nor the
+            STATIONS_ADJOINT file are written to the dataset or disk. Only
+            the misfit is returned.
+
         :type source_name: str
         :param source_name: event id to be used for data gathering, processing
         :type codes: list of str
         :param codes: list of station codes to be used for processing. If None,
             will read station codes from the provided STATIONS file
+        :type max_workers: int
+        :param max_workers: number of parallel processes used to process
+            stations. Defaults to 1, which processes stations in serial. If
+            None, automatically determined by system number of processors.
+        :type misfit_only: bool
+        :param misfit_only: only measure misfit, do not calculate or write
+            adjoint sources. Defaults to False
         :rtype: float
         :return: the total scaled misfit collected during the processing chain
         """
         # Create the event specific configurations and attribute container (io)
         io = self.setup(source_name)
-       
-        # Allow user to provide a list of codes, else read from station file 
+
+        # Allow user to provide a list of codes, else read from station file
         if codes is None:
-            codes = read_station_codes(io.paths.stations_file, 
+            codes = read_station_codes(io.paths.stations_file,
                                        loc="??", cha="HH?")
 
-        # Open the dataset as a context manager and process all events in serial
+        if max_workers == 1:
+            # Open the dataset as a context manager and process all stations in
+            # serial
+            with ASDFDataSet(io.paths.dsfid) as ds:
+                mgmt = pyatoa.Manager(ds=ds, config=io.config)
+                for code in codes:
+                    mgmt_out, io = self.process_station(
+                        mgmt=mgmt, code=code, io=io, misfit_only=misfit_only,
+                        **kwargs)
+        else:
+            io = self.multi_station_process(codes=codes, io=io,
+                                            max_workers=max_workers,
+                                            misfit_only=misfit_only, **kwargs)
+
+        # Columnar windows are written per station, merge them into a single
+        # array for this iteration/step once all stations have been processed
+        if io.config.columnar_windows:
+            with ASDFDataSet(io.paths.dsfid) as ds:
+                consolidate_misfit_windows(ds, path=io.config.aux_path)
+
+        scaled_misfit = self.finalize(io, misfit_only=misfit_only)
+
+        return scaled_misfit
+
+    def multi_station_process(self, codes, io, max_workers=None, **kwargs):
+        """
+        Use concurrent futures to run process_station() in parallel for all
+        stations of a single event.
+
+        Each worker processes a station on its own Manager, which reads from
+        the event dataset in read-only mode. Everything a worker would have
+        written to the dataset is returned to the main process, which is the
+        only process that writes to the dataset. Writes and output statistics
+        are collected in the order of `codes` so that the dataset and misfit
+        are the same as for serial processing.
+
+        Kwargs passed to pyatoa.Manager.flow() function.
+
+        :type codes: list of str
+        :param codes: list of station codes to be used for processing
+        :type io: pyatoa.core.pyaflowa.IO
+        :param io: dict-like container that contains processing information
+        :type max_workers: int
+        :param max_workers: maximum number of parallel processes to use. If
+            None, automatically determined by system number of processors.
+        :rtype: pyatoa.core.pyaflowa.IO
+        :return: the IO attribute class with statistics from all stations
+        """
+        # Event information only needs to be gathered (and saved) once, rather
+        # than once per worker
         with ASDFDataSet(io.paths.dsfid) as ds:
             mgmt = pyatoa.Manager(ds=ds, config=io.config)
-            for code in codes:
-                mgmt_out, io = self.process_station(mgmt=mgmt, code=code,
-                                                    io=io, **kwargs)
+            try:
+                mgmt.gather(choice=["event"])
+            except pyatoa.ManagerError as e:
+                io.logger.warning(e)
+            event = mgmt.event
 
-        scaled_misfit = self.finalize(io)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(
+                partial(self._process_station_worker, io=io, event=event,
+                        **kwargs), codes)
+            )
 
-        return scaled_misfit
-        
-    def multi_event_process(self, source_names, max_workers=None, **kwargs):
+        # Single writer: sequentially write all station data into the dataset
+        with ASDFDataSet(io.paths.dsfid) as ds:
+            for io_sta, calls in results:
+                DeferredDataSet.replay(calls=calls, ds=ds)
+                for key in ["misfit", "nwin", "stations", "processed",
+                            "exceptions"]:
+                    io[key] += io_sta[key]
+                io.plot_fids += io_sta.plot_fids
+
+        return io
+
+    def _process_station_worker(self, code, io, event=None, **kwargs):
+        """
+        Process a single station on a fresh Manager whose dataset writes are
+        deferred. Called in parallel by multi_station_process()
+
+        :type code: str
+        :param code: Pyatoa station code, NN.SSS.LL.CCC
+        :type io: pyatoa.core.pyaflowa.IO
+        :param io: dict-like object that contains the necessary information
+            to process the station
+        :type event: obspy.core.event.Event
+        :param event: event gathered by the main process
+        :rtype: tuple (pyatoa.core.pyaflowa.IO, list)
+        :return: a station-specific IO object with output statistics, and the
+            list of write calls to be replayed onto the dataset
+        """
+        io_sta = IO(paths=io.paths, logger=io.logger, config=io.config)
+        with DeferredDataSet(io.paths.dsfid) as ds:
+            mgmt = pyatoa.Manager(ds=ds, config=io.config, event=event)
+            _, io_sta = self.process_station(mgmt=mgmt, code=code, io=io_sta,
+                                             **kwargs)
+            calls = ds.calls
+
+        # Loggers and Managers are not sent back to the main process
+        io_sta.logger = None
+
+        return io_sta, calls
+
+    def multi_event_process(self, source_names, max_workers=None,
+                            event_kwargs=None, timings_fid=None, **kwargs):
         """
-        Use concurrent futures to run the process() function in parallel.
+        Use concurrent futures to run the process_event() function in parallel.
         This is a multiprocessing function, meaning multiple instances of Python
         will be instantiated in parallel.
 
+        Events are scheduled longest-job-first so that large events submitted
+        late do not dominate the total wall time. Job lengths are estimated by
+        estimate_event_costs(). A failed event does not stop the remaining
+        events from being processed, it simply returns a misfit of None.
+
+        A summary of the cost estimate, wall time, misfit and status of each
+        event is merged into a JSON file, which is also used to estimate
+        event costs for subsequent runs.
+
         :type source_names: list of str
-        :param solver_dir: a list of all the source names to process. each will
-            be passed to process()
+        :param source_names: a list of all the source names to process. each
+            will be passed to process_event()
         :type max_workers: int
         :param max_workers: maximum number of parallel processes to use. If
             None, automatically determined by system number of processors.
+        :type event_kwargs: dict of dict
+        :param event_kwargs: event-specific kwargs passed to process_event(),
+            keyed by source name. These override the general kwargs for
+            the given event.
+        :type timings_fid: str
+        :param timings_fid: path to the JSON file that stores per-event wall
+            times. Defaults to 'timings.json' in the logs directory.
+        :rtype: dict
+        :return: scaled misfit for each event, keyed by source name
         """
-        misfits = {}
+        event_kwargs = event_kwargs or {}
+        if timings_fid is None:
+            timings_fid = os.path.join(self.path_structure.logs, "timings.json")
+
+        costs = self.estimate_event_costs(source_names, timings_fid=timings_fid)
+
+        # Submission order dictates the order in which workers pick up events
+        order = sorted(source_names, key=lambda s: costs[s], reverse=True)
+
+        results = {}
         with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            for source_name, misfit in zip(
-                    source_names, executor.map(self.process_event,
-                                               source_names, kwargs)):
-                misfits[os.path.basename(source_name)] = misfit
+            futures = {}
+            for source_name in order:
+                kwargs_ = {**kwargs, **event_kwargs.get(source_name, {})}
+                future = executor.submit(self._timed_process_event,
+                                         source_name, **kwargs_)
+                futures[future] = source_name
+            for future in as_completed(futures):
+                source_name = futures[future]
+                try:
+                    misfit, wall_time = future.result()
+                    status = "success"
+                except Exception as e:
+                    misfit, wall_time = None, None
+                    status = f"error: {e}"
+                results[source_name] = {"cost": costs[source_name],
+                                        "wall_time_s": wall_time,
+                                        "misfit": misfit, "status": status}
+
+        # Return and write summary in the order that events were given
+        summary = {os.path.basename(s): results[s] for s in source_names}
+        self._write_multi_event_summary(summary, timings_fid)
+
+        return {name: vals["misfit"] for name, vals in summary.items()}
+
+    def estimate_event_costs(self, source_names, timings_fid=None):
+        """
+        Estimate the relative processing cost of each event. The estimate is
+        the number of stations in the STATIONS file multiplied by the trace
+        length given by the Config start and end pads. If wall times from a
+        previous run exist, these are used directly, and estimates for events
+        without timings are scaled to units of seconds using the median ratio
+        of wall time to estimate.
+
+        :type source_names: list of str
+        :param source_names: source names to estimate costs for
+        :type timings_fid: str
+        :param timings_fid: path to the JSON file written by a previous
+            multi_event_process() call, if it does not exist it is ignored
+        :rtype: dict
+        :return: estimated cost for each event, keyed by source name
+        """
+        timings = {}
+        if timings_fid is not None and os.path.exists(timings_fid):
+            with open(timings_fid, "r") as f:
+                timings = {key: vals["wall_time_s"] for key, vals in
+                           json.load(f).items() if vals["wall_time_s"]}
+
+        trace_length = self.config.start_pad + self.config.end_pad
+        estimates = {}
+        for source_name in source_names:
+            stations_file = self.path_structure.stations_file.format(
+                source_name=source_name)
+            try:
+                with open(stations_file, "r") as f:
+                    nsta = len([_ for _ in f.readlines() if _.strip()])
+            except OSError:
+                nsta = 1
+            estimates[source_name] = nsta * trace_length
+
+        # Convert estimates to seconds if any previous timings are available
+        ratios = [timings[os.path.basename(s)] / estimates[s] for s in
+                  source_names if os.path.basename(s) in timings]
+        rate = float(np.median(ratios)) if ratios else 1.
+
+        costs = {}
+        for source_name in source_names:
+            costs[source_name] = timings.get(os.path.basename(source_name),
+                                             estimates[source_name] * rate)
+        return costs
+
+    def _timed_process_event(self, source_name, **kwargs):
+        """
+        Run process_event() and keep track of the wall time it took.
+        Called in parallel by multi_event_process()
 
-        return misfits
+        :type source_name: str
+        :param source_name: event id to be used for data gathering, processing
+        :rtype: tuple (float, float)
+        :return: the scaled misfit, and wall time in seconds
+        """
+        start = time.time()
+        misfit = self.process_event(source_name, **kwargs)
+        return misfit, time.time() - start
 
     def setup(self, source_name):
         """
@@ -440,13 +729,16 @@ class Pyaflowa:
 
         return io
 
-    def finalize(self, io):
+    def finalize(self, io, misfit_only=False):
         """
         Wrapper for any finalization procedures after a single event workflow
         Returns total misfit calculated during process()
 
         :type io: pyatoa.core.pyaflowa.IO
         :param io: dict-like container that contains processing information
+        :type misfit_only: bool
+        :param misfit_only: no adjoint sources were written, so do not write
+            the STATIONS_ADJOINT file
         :rtype: float or None
         :param: the scaled event-misfit, i.e. total raw misfit divided by
             number of windows. If no stations were processed, returns None 
@@ -454,7 +746,8 @@ class Pyaflowa:
             give the false impression of 0 misfit which is wrong.
         """
         self._make_event_pdf_from_station_pdfs(io)
-        self._write_specfem_stations_adjoint_to_disk(io)
+        if not misfit_only:
+            self._write_specfem_stations_adjoint_to_disk(io)
         self._output_final_log_summary(io)
 
         if io.misfit:
@@ -463,7 +756,7 @@ class Pyaflowa:
         else:
             return None
 
-    def process_station(self, mgmt, code, io, **kwargs):
+    def process_station(self, mgmt, code, io, misfit_only=False, **kwargs):
         """
         Process a single seismic station for a given event. Return processed
         manager and status describing outcome of processing. Multiple error 
@@ -489,6 +782,9 @@ class Pyaflowa:
             whether previously gathered windows will be used to evaluate the 
             current set of synthetics. First passed through an internal check
             function that evaluates a few criteria before continuing.
+        :type misfit_only: bool
+        :param misfit_only: passed to the Manager flow function, only measure
+            misfit and do not write adjoint sources to disk
         :rtype tuple: (pyatoa.core.manager.Manager, pyatoa.core.pyaflowa.IO)
         :return: a processed manager class, and the IO attribute class
         """
@@ -510,7 +806,7 @@ class Pyaflowa:
             # Need to update fix window kwarg based on position in inversion
             kwargs = self._check_fix_windows(**kwargs)
 
-            mgmt.flow(**kwargs)
+            mgmt.flow(misfit_only=misfit_only, **kwargs)
             status = 1
         except pyatoa.ManagerError as e:
             io.logger.warning(e)
@@ -542,7 +838,8 @@ class Pyaflowa:
             io.processed += 1
 
             # SPECFEM wants adjsrcs for each comp, regardless if it has data
-            mgmt.write_adjsrcs(path=io.paths.adjsrcs, write_blanks=True)
+            if not misfit_only:
+                mgmt.write_adjsrcs(path=io.paths.adjsrcs, write_blanks=True)
 
         return mgmt, io
 
@@ -647,6 +944,44 @@ class Pyaflowa:
                 if check in adjoint_stations:
                     f_out.write(line)
 
+    def _write_multi_event_summary(self, summary, fid):
+        """
+        Write the per-event summary of multi_event_process() to a JSON file
+        and to the log, so that job balancing can be checked and the wall
+        times can be used to schedule the next run.
+
+        .. note::
+            The summary is merged into an existing file, so that events that
+            were not part of this run keep their previous timings. Events
+            that failed in this run keep their previous entry, if any.
+
+        :type summary: dict of dict
+        :param summary: cost estimate, wall time, misfit and status per event
+        :type fid: str
+        :param fid: path to the output JSON file
+        """
+        timings = {}
+        if os.path.exists(fid):
+            with open(fid, "r") as f:
+                timings = json.load(f)
+        for name, vals in summary.items():
+            if vals["status"] == "success" or name not in timings:
+                timings[name] = vals
+
+        if os.path.dirname(fid) and not os.path.exists(os.path.dirname(fid)):
+            os.makedirs(os.path.dirname(fid))
+        with open(fid, "w") as f:
+            json.dump(timings, f, indent=4)
+
+        str_out = (f"{'SOURCE NAME':<20}{'COST':>12}{'WALL TIME [s]':>16}  "
+                   f"STATUS\n")
+        for name, vals in summary.items():
+            wall_time = vals["wall_time_s"] or np.nan
+            str_out += (f"{name:<20}{vals['cost']:>12.1f}{wall_time:>16.1f}  "
+                        f"{vals['status']}\n")
+        pyatoa.logger.info(f"\n{'=' * 80}\n\nMULTI EVENT SUMMARY\n\n"
+                           f"{'=' * 80}\n{str_out}")
+
     def _make_event_pdf_from_station_pdfs(self, io):
         """
         Combine a list of single source-receiver PDFS into a single PDF file
@@ -0,0 +1,79 @@
+"""
+Benchmark local filesystem lookups through the InternalFetcher, comparing
+glob.glob against the in-memory DirectoryIndex. Builds a SEED-style waveform
+directory of ~50k empty files in a temporary directory and times the
+directory lookups for every station, as would happen when processing an event.
+The repeated pass corresponds to subsequent iterations or step counts, where
+glob patterns have already been compiled. On local disks both approaches are
+limited by pattern matching; on networked filesystems (e.g. Lustre) glob is
+additionally limited by metadata requests, which the index avoids.
+
+Usage:
+    python benchmark_directory_index.py [n_stations] [n_days]
+"""
+import os
+import re
+import sys
+import glob
+import fnmatch
+import time
+import shutil
+import tempfile
+from pyatoa.core.gatherer import DirectoryIndex
+
+n_sta = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+n_days = int(sys.argv[2]) if len(sys.argv) > 2 else 33
+year, networks, channels = 2018, ["NZ", "XX"], ["HHE", "HHN", "HHZ"]
+dir_template = "{year}/{net}/{sta}/{cha}*"
+fid_template = "{net}.{sta}.{loc}.{cha}*{year}.{jday:0>3}"
+
+path = tempfile.mkdtemp()
+try:
+    # Generate the directory structure
+    codes = []
+    for i in range(n_sta):
+        net, sta = networks[i % len(networks)], f"S{i:04d}"
+        codes.append((net, sta))
+        for cha in channels:
+            dir_ = os.path.join(path, str(year), net, sta, f"{cha}.D")
+            os.makedirs(dir_)
+            for jday in range(1, n_days + 1):
+                fid = f"{net}.{sta}.10.{cha}.D.{year}.{jday:0>3}"
+                open(os.path.join(dir_, fid), "w").close()
+    print(f"{n_sta * len(channels) * n_days} files in {path}")
+
+    patterns = [os.path.join(dir_template, fid_template).format(
+                    year=year, net=net, sta=sta, loc="*", cha="HH?", jday=jday)
+                for net, sta in codes for jday in [n_days // 2]]
+
+    def timed_lookups(lookup):
+        """Time a cold pass (empty pattern caches) and a repeated pass"""
+        fnmatch._compile_pattern.cache_clear()
+        re.purge()
+        times = []
+        for _ in range(2):
+            tstart = time.time()
+            results = [lookup(p) for p in patterns]
+            times.append(time.time() - tstart)
+        return results, times
+
+    result_glob, time_glob = timed_lookups(
+        lambda p: glob.glob(os.path.join(path, p)))
+
+    tstart = time.time()
+    index = DirectoryIndex(path)
+    time_build = time.time() - tstart
+    result_index, time_index = timed_lookups(index.glob)
+    tstart = time.time()
+    index.is_stale()
+    time_stale = time.time() - tstart
+
+    assert([sorted(_) for _ in result_glob] ==
+           [sorted(_) for _ in result_index])
+    print(f"{len(patterns)} lookups (first pass / repeated pass)")
+    print(f"glob:              {time_glob[0]:.3f}s / {time_glob[1]:.3f}s")
+    print(f"index lookups:     {time_index[0]:.3f}s / {time_index[1]:.3f}s")
+    print(f"index build:       {time_build:.3f}s")
+    print(f"index validation:  {time_stale:.3f}s")
+finally:
+    shutil.rmtree(path)
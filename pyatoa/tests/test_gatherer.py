@@ -1,14 +1,19 @@
 """
 Test the functionalities of the Pyatoa Gatherer class
 """
+import io
+import os
+import glob
 import pytest
-from obspy import read_events
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from obspy import read, read_events, read_inventory, Stream, UTCDateTime
 from obspy.clients.fdsn import Client
 from pyasdf import ASDFDataSet
 from pyatoa import Config
 from pyatoa.core.gatherer import (ExternalGetter, InternalFetcher, Gatherer,
-                                  get_gcmt_moment_tensor, append_focal_mechanism
-                                  )
+                                  DirectoryIndex, get_gcmt_moment_tensor,
+                                  append_focal_mechanism)
 
 
 @pytest.fixture
@@ -63,6 +68,125 @@ def config():
                   step_count=0, synthetics_only=False, save_to_ds=False)
 
 
+class FDSNStandInHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for the FDSN dataselect and station webservices which
+    answers bulk (POST) requests from a Stream and Inventory held by the
+    server. Allows testing external gathering without internet access.
+    """
+    def do_POST(self):
+        """
+        Answer a bulk request with MiniSEED or StationXML. Responds with 503
+        while `server.fail` is non-zero, and with 500 if a station in
+        `server.broken` is requested
+        """
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        body = body.decode()
+        self.server.requests.append((self.path, body))
+
+        lines = [_.split() for _ in body.splitlines() if _.strip() and
+                 "=" not in _]
+        if self.server.fail:
+            self.server.fail -= 1
+            return self._respond(503)
+        if self.server.broken.intersection([_[1] for _ in lines]):
+            return self._respond(500)
+
+        buffer = io.BytesIO()
+        if "dataselect" in self.path:
+            st = Stream()
+            for net, sta, loc, cha, start, end in lines:
+                st += self.server.st.select(
+                    network=net, station=sta, location=loc.replace("--", ""),
+                    channel=cha).slice(UTCDateTime(start), UTCDateTime(end))
+            if not st:
+                return self._respond(204)
+            st.write(buffer, format="MSEED")
+        else:
+            inv = None
+            for net, sta, loc, cha, start, end in lines:
+                inv_sta = self.server.inv.select(
+                    network=net, station=sta, location=loc.replace("--", ""),
+                    channel=cha)
+                if not inv_sta.networks:
+                    continue
+                inv = inv_sta if inv is None else inv + inv_sta
+            if inv is None:
+                return self._respond(204)
+            inv.write(buffer, format="STATIONXML")
+        self._respond(200, buffer.getvalue())
+
+    def _respond(self, status, data=b""):
+        """
+        Send a response with the given HTTP status code and content
+        """
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        """
+        Keep test output clean
+        """
+        pass
+
+
+@pytest.fixture
+def fdsn_server():
+    """
+    Local stand-in FDSN webservice serving copies of the NZ.BFZ observed
+    waveforms and StationXML under five different station names.
+    """
+    st_bfz = read("./test_data/test_obs_data_NZ_BFZ_2018p130600.ascii")
+    inv = read_inventory("./test_data/test_dataless_NZ_BFZ.xml")
+
+    st = Stream()
+    sta_bfz = inv[0][0]
+    inv[0].stations = []
+    for sta in ["BFZ", "TS1", "TS2", "TS3", "TS4"]:
+        st_sta = st_bfz.copy()
+        for tr in st_sta:
+            tr.stats.station = sta
+            tr.data = tr.data.astype("int32")
+        st += st_sta
+        sta_copy = sta_bfz.copy()
+        sta_copy.code = sta
+        inv[0].stations.append(sta_copy)
+
+    server = HTTPServer(("127.0.0.1", 0), FDSNStandInHandler)
+    server.st, server.inv = st, inv
+    server.fail, server.broken, server.requests = 0, set(), []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def bulk_codes():
+    """
+    Station codes served by the stand-in FDSN webservice
+    """
+    return [f"NZ.{sta}.??.HH?" for sta in ["BFZ", "TS1", "TS2", "TS3", "TS4"]]
+
+
+@pytest.fixture
+def bulk_getter(config, origintime, fdsn_server):
+    """
+    An external getter querying the stand-in FDSN webservice
+    """
+    host, port = fdsn_server.server_address
+    ext_get = ExternalGetter()
+    ext_get.origintime = origintime
+    ext_get.ds = None
+    ext_get.config = config
+    ext_get.Client = Client(base_url=f"http://{host}:{port}",
+                            _discover_services=False)
+    return ext_get
+
+
 @pytest.fixture
 def internal_fetcher(config, origintime):
     """
@@ -150,6 +274,79 @@ def test_obs_waveform_get(external_getter, code):
     assert stats.station == sta
 
 
+def test_obs_waveform_get_bulk(bulk_getter, bulk_codes, fdsn_server):
+    """
+    Ensure that bulk waveform queries are chunked and return all stations
+    """
+    st = bulk_getter.obs_waveform_get_bulk(bulk_codes, chunk_size=2)
+    assert(len(st) == 15)
+    assert(len(fdsn_server.requests) == 3)
+    for tr in st:
+        assert(tr.stats.starttime >= bulk_getter.origintime -
+               bulk_getter.config.start_pad)
+
+
+def test_station_get_bulk(bulk_getter, bulk_codes, fdsn_server):
+    """
+    Ensure that bulk station queries are chunked and return all stations
+    """
+    inv = bulk_getter.station_get_bulk(bulk_codes, chunk_size=3)
+    assert(len(inv.select(network="NZ").get_contents()["stations"]) == 5)
+    assert(len(fdsn_server.requests) == 2)
+
+
+def test_bulk_get_retry_and_partial(bulk_getter, bulk_codes, fdsn_server):
+    """
+    Ensure that bulk requests are retried while the service is unavailable,
+    and that a station which makes requests fail does not lose data of the
+    rest of its chunk
+    """
+    fdsn_server.fail = 2
+    st = bulk_getter.obs_waveform_get_bulk(bulk_codes, backoff=0)
+    assert(len(st) == 15)
+    assert(len(fdsn_server.requests) == 3)
+
+    # Retries exhausted, chunk is split until only the broken station is left
+    fdsn_server.requests = []
+    fdsn_server.broken = {"TS2"}
+    st = bulk_getter.obs_waveform_get_bulk(bulk_codes, retries=1, backoff=0)
+    assert(len(st) == 12)
+    assert(not st.select(station="TS2"))
+
+    # Service unavailable for longer than the retries, chunk is not split
+    fdsn_server.requests = []
+    fdsn_server.broken = set()
+    fdsn_server.fail = 5
+    st = bulk_getter.obs_waveform_get_bulk(bulk_codes, retries=2, backoff=0)
+    assert(st is None)
+    assert(len(fdsn_server.requests) == 3)
+    fdsn_server.fail = 0
+
+    # No data for any station returns None rather than raising
+    assert(bulk_getter.obs_waveform_get_bulk(["XX.ABC.??.HH?"]) is None)
+
+
+def test_gather_obs_bulk(tmpdir, bulk_getter, bulk_codes, config,
+                         origintime):
+    """
+    Ensure that bulk gathering saves all stations to a dataset, and respects
+    the minimum number of data items required to save a station
+    """
+    gatherer = Gatherer(config=Config(event_id="2018p130600"),
+                        origintime=origintime)
+    gatherer.Client = bulk_getter.Client
+    with ASDFDataSet(os.path.join(tmpdir, "test_dataset.h5")) as ds:
+        gatherer.ds = ds
+        counts = gatherer.gather_obs_bulk(bulk_codes + ["NZ.XYZ.??.HH?"],
+                                          chunk_size=2, return_count=4)
+        assert(counts["NZ.XYZ.??.HH?"] == 0)
+        for code in bulk_codes:
+            assert(counts[code] == 4)
+            assert(code.split(".??")[0] in ds.waveforms.list())
+            sta_tag = code.split(".??")[0]
+            assert(len(ds.waveforms[sta_tag][config.observed_tag]) == 3)
+
+
 def test_asdf_event_fetch(internal_fetcher, dataset_fid):
     """
     Get event from an ASDFDataSet.
@@ -226,6 +423,29 @@ def test_fetch_syn_by_dir(internal_fetcher, code):
     assert len(st) == 3
 
 
+def test_directory_index(tmpdir):
+    """
+    Ensure that the in-memory directory index returns the same results as glob
+    and that it notices when files are added
+    """
+    path = "./test_data"
+    index = DirectoryIndex(path)
+    for pattern in ["2018/NZ/BFZ/HH?*/NZ.BFZ.*.HH?*2018.049",
+                    "*/NZ/*/HHZ/*", "BFZ.NZ/RESP.NZ.BFZ.*.HH?",
+                    "NZ.BFZ.*Z.sem?", "test_*.xml", "nonexistent/*"]:
+        for subdir in ["test_mseeds", "test_seed", "synthetics", ""]:
+            check = glob.glob(os.path.join(path, subdir, pattern))
+            result = index.glob(os.path.join(subdir, pattern))
+            assert(sorted(map(os.path.abspath, check)) == sorted(result))
+
+    index = DirectoryIndex(tmpdir)
+    assert(not index.is_stale())
+    tmpdir.mkdir("2018").join("NZ.BFZ.10.HHZ.D.2018.049").write("")
+    assert(index.is_stale())
+    index.build()
+    assert(len(index.glob("2018/NZ.BFZ.*")) == 1)
+
+
 def test_obs_waveform_fetch(internal_fetcher, dataset_fid, code):
     """
     Test the mid level fetching function which chooses whether to search via
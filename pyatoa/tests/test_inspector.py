@@ -0,0 +1,191 @@
+"""
+Test the functionalities of the Inspector class
+"""
+import os
+import shutil
+import pytest
+import numpy as np
+import pandas as pd
+from pyasdf import ASDFDataSet
+from obspy.geodetics import gps2dist_azimuth
+from pyatoa import Inspector
+
+
+@pytest.fixture
+def dataset_dir(tmpdir):
+    """
+    A directory containing a copy of the test ASDFDataSet, with adjoint source
+    misfit stored under the parameter name used by the current Pyadjoint
+    """
+    dsfid = os.path.join(tmpdir, "2018p130600.h5")
+    shutil.copy("./test_data/test_ASDFDataSet.h5", dsfid)
+    with ASDFDataSet(dsfid) as ds:
+        adjsrcs = ds.auxiliary_data.AdjointSources.i01.s00
+        for tag in adjsrcs.list():
+            data, parameters = adjsrcs[tag].data[()], adjsrcs[tag].parameters
+            parameters["misfit"] = parameters.pop("misfit_value")
+            del adjsrcs[tag]
+            ds.add_auxiliary_data(data=data, data_type="AdjointSources",
+                                  parameters=parameters, path=f"i01/s00/{tag}")
+    return tmpdir
+
+
+def add_step(dsfid, step):
+    """
+    Copy the windows and adjoint sources of the first step of a dataset into a
+    new step, mimicking a line search evaluation
+    """
+    with ASDFDataSet(dsfid) as ds:
+        for aux in ["MisfitWindows", "AdjointSources"]:
+            group = ds.auxiliary_data[aux].i01.s00
+            for tag in group.list():
+                ds.add_auxiliary_data(data=group[tag].data[()], data_type=aux,
+                                      parameters=group[tag].parameters,
+                                      path=f"i01/{step}/{tag}")
+
+
+def test_discover_cache(dataset_dir):
+    """
+    Ensure that discover() writes a persistent cache, that unmodified datasets
+    are read back from the cache, and that only new iteration/step groups of
+    modified datasets are collected
+    """
+    cache = os.path.join(dataset_dir, "inspector.pkl")
+    insp = Inspector(verbose=False).discover(path=dataset_dir, cache=cache)
+    assert(os.path.exists(cache))
+    assert(not insp.windows.empty)
+    nwin = len(insp.windows)
+
+    insp_cached = Inspector(verbose=False)
+    insp_cached.discover(path=dataset_dir, cache=cache)
+    assert(insp_cached.windows.equals(insp.windows))
+    assert(insp_cached.sources.equals(insp.sources))
+
+    add_step(os.path.join(dataset_dir, "2018p130600.h5"), "s01")
+
+    insp_new = Inspector(verbose=False)
+    insp_new.discover(path=dataset_dir, cache=cache)
+    assert(len(insp_new.windows) == 2 * nwin)
+    assert(len(insp_new.isolate(iteration="i01", step_count="s01")) == nwin)
+
+
+def test_discover_parallel(dataset_dir):
+    """
+    Ensure that reading datasets in parallel results in the same dataframes as
+    reading them in serial
+    """
+    shutil.copy(os.path.join(dataset_dir, "2018p130600.h5"),
+                os.path.join(dataset_dir, "2018p130600_copy.h5"))
+
+    insp_serial = Inspector(verbose=False).discover(path=dataset_dir)
+    insp_parallel = Inspector(verbose=False).discover(path=dataset_dir,
+                                                      max_workers=2)
+    for attr in ["windows", "sources", "receivers"]:
+        assert(getattr(insp_parallel, attr).equals(
+            getattr(insp_serial, attr)))
+    assert(len(insp_serial.events) == 2)
+
+
+def test_isolate(dataset_dir):
+    """
+    Ensure that isolate selects the same rows as comparing column values and
+    that remembered queries are invalidated when windows change
+    """
+    insp = Inspector(verbose=False).discover(path=dataset_dir)
+    windows = insp.windows
+
+    df = insp.isolate(iteration="i01", step_count="s00", component="Z")
+    assert(df.equals(windows[windows.component == "Z"]))
+    assert(insp.isolate(station="XXX").empty)
+    assert(insp.isolate().equals(windows))
+
+    # Replacing the windows must not return remembered rows
+    insp.windows = windows[windows.component != "Z"].reset_index(drop=True)
+    assert(insp.isolate(iteration="i01", step_count="s00",
+                        component="Z").empty)
+
+
+def test_misfit_incremental(dataset_dir):
+    """
+    Ensure that misfit calculated before new windows are discovered is updated
+    to match misfit calculated from scratch
+    """
+    insp = Inspector(verbose=False).discover(path=dataset_dir)
+    for level in ["station", "event", "step"]:
+        insp.misfit(level=level)
+    assert(len(insp.models) == 1)
+
+    add_step(os.path.join(dataset_dir, "2018p130600.h5"), "s01")
+    insp.discover(path=dataset_dir)
+    assert(insp.misfit().index.tolist() == [("i01", "s00"), ("i01", "s01")])
+
+    insp_new = Inspector(verbose=False).discover(path=dataset_dir)
+    for level in ["station", "event", "step"]:
+        assert(insp.misfit(level=level).equals(insp_new.misfit(level=level)))
+    assert(insp.models.equals(insp_new.models))
+
+
+def test_compact(dataset_dir):
+    """
+    Ensure that a compact Inspector stores labels as categoricals and
+    measurements in single precision, uses less memory, and calculates the
+    same misfit as the default Inspector, also when new windows are collected
+    """
+    insp = Inspector(verbose=False).discover(path=dataset_dir)
+    insp_compact = Inspector(verbose=False, compact=True).discover(
+        path=dataset_dir)
+
+    assert(insp_compact.windows.station.dtype == "category")
+    assert(insp_compact.windows.misfit.dtype == "float32")
+    assert(insp_compact.footprint()["windows"] < insp.footprint()["windows"])
+
+    add_step(os.path.join(dataset_dir, "2018p130600.h5"), "s01")
+    insp_compact.misfit()
+    for insp_ in [insp, insp_compact]:
+        insp_.discover(path=dataset_dir)
+    assert(insp_compact.windows.iteration.dtype == "category")
+    assert(len(insp_compact.isolate(step_count="s01")) ==
+           len(insp.isolate(step_count="s01")))
+    for level in ["station", "event", "step"]:
+        misfit, misfit_compact = (insp.misfit(level=level),
+                                  insp_compact.misfit(level=level))
+        assert(misfit_compact.index.tolist() == misfit.index.tolist())
+        np.testing.assert_allclose(misfit_compact.misfit, misfit.misfit,
+                                   rtol=1E-5)
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "feather"])
+def test_save_read_columnar(dataset_dir, fmt):
+    """
+    Ensure that Parquet and Feather files are written and read back with the
+    same contents and column types, for both default and compact Inspectors
+    """
+    pytest.importorskip("pyarrow")
+    for compact in [False, True]:
+        insp = Inspector(verbose=False, compact=compact).discover(
+            path=dataset_dir)
+        insp.save(path=dataset_dir, fmt=fmt, tag="columnar")
+
+        insp_read = Inspector(tag="columnar", verbose=False)
+        insp_read.read(path=dataset_dir)
+        for attr in ["windows", "sources", "receivers"]:
+            pd.testing.assert_frame_equal(getattr(insp_read, attr),
+                                          getattr(insp, attr))
+
+
+def test_srcrcv(dataset_dir):
+    """
+    Ensure that the source-receiver table contains all source-receiver pairs
+    with the same distances and backazimuths as calculated per pair
+    """
+    insp = Inspector(verbose=False).discover(path=dataset_dir)
+    srcrcv = insp.srcrcv
+    assert(len(srcrcv) == len(insp.sources) * len(insp.receivers))
+
+    for row in srcrcv.itertuples():
+        src = insp.sources.loc[row.event]
+        rcv = insp.receivers.loc[(row.network, row.station)]
+        gcd, _, baz = gps2dist_azimuth(lat1=src.latitude, lon1=src.longitude,
+                                       lat2=rcv.latitude, lon2=rcv.longitude)
+        assert(row.distance_km == pytest.approx(gcd * 1E-3, abs=1E-3))
+        assert(row.backazimuth == pytest.approx(baz, abs=1E-6))
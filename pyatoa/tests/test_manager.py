@@ -8,6 +8,9 @@ import numpy as np
 from pyasdf import ASDFDataSet
 from pyatoa import Config, Manager, logger
 from pyatoa.core.manager import ManagerError
+from pyatoa.utils.asdf.add import consolidate_misfit_windows
+from pyatoa.utils.asdf.load import (load_windows, window_parameters,
+                                    get_window_index)
 from obspy import read, read_events, read_inventory
 
 
@@ -193,6 +196,58 @@ def test_preprocess_rotate_to_rtz(mgmt_pre):
     assert(float(f"{mgmt_pre.baz:.2f}") == 3.21)
 
 
+def test_preprocess_cache_observed(tmpdir, mgmt_pre, config, st_obs,
+                                   st_syn, event, inv):
+    """
+    Processed observed waveforms should only be stored in the dataset if
+    requested by the Config, and reused by subsequent Managers with matching
+    processing parameters and instrument responses
+    """
+    def cache_tags(ds):
+        if "NZ.BFZ" not in ds.waveforms.list():
+            return []
+        tags = ds.waveforms["NZ_BFZ"].get_waveform_tags()
+        return [_ for _ in tags if _.startswith("observed_processed_")]
+
+    with ASDFDataSet(os.path.join(tmpdir, "test_dataset.h5")) as ds:
+        # Caching is off by default
+        mgmt = Manager(config=config, event=event, st_obs=st_obs.copy(),
+                       st_syn=st_syn.copy(), inv=inv, ds=ds)
+        mgmt.standardize().preprocess()
+        assert(not cache_tags(ds))
+
+        config.cache_observed = True
+        mgmt_pre.ds = ds
+        mgmt_pre.standardize().preprocess()
+        assert(len(cache_tags(ds)) == 1)
+
+        # A new Manager with the same parameters loads the cached stream, which
+        # is flagged as processed without a processing history
+        mgmt = Manager(config=config, event=event, st_obs=st_obs.copy(),
+                       st_syn=st_syn.copy(), inv=inv, ds=ds)
+        mgmt.standardize().preprocess()
+        for tr_a, tr_b in zip(mgmt_pre.st_obs, mgmt.st_obs):
+            np.testing.assert_allclose(tr_a.data, tr_b.data)
+            assert(tr_b.stats.processed_tag == cache_tags(ds)[0])
+            assert(not tr_b.stats.get("processing"))
+        assert(mgmt.stats.obs_processed)
+
+        # Changing a processing parameter creates a new cache entry
+        mgmt = Manager(config=config, event=event, st_obs=st_obs.copy(),
+                       st_syn=st_syn.copy(), inv=inv, ds=ds)
+        mgmt.standardize().preprocess(water_level=30)
+        assert(len(cache_tags(ds)) == 2)
+
+        # Changing the instrument response creates a new cache entry
+        inv_new = inv.copy()
+        for cha in inv_new[0][0]:
+            cha.response.response_stages[0].stage_gain *= 2
+        mgmt = Manager(config=config, event=event, st_obs=st_obs.copy(),
+                       st_syn=st_syn.copy(), inv=inv_new, ds=ds)
+        mgmt.standardize().preprocess()
+        assert(len(cache_tags(ds)) == 3)
+
+
 def test_preprocess_overwrite(mgmt_pre):
     """
     Apply an overwriting preprocessing function to ensure functionality works
@@ -275,6 +330,79 @@ def test_save_and_retrieve_windows(tmpdir, mgmt_post):
                         getattr(saved_windows[comp][w], "dlnA"))
 
 
+def test_save_and_retrieve_columnar_windows(tmpdir, mgmt_post):
+    """
+    Save windows in the columnar layout, consolidate them, and ensure that
+    they are read back the same as windows saved in the default layout
+    """
+    with ASDFDataSet(os.path.join(tmpdir, "test_dataset.h5")) as ds:
+        mgmt_post.ds = ds
+        mgmt_post.config.iteration = 0
+        mgmt_post.config.step_count = 0
+        mgmt_post.config.save_to_ds = True
+        mgmt_post.save_windows()  # default layout saved to 'i00/s00'
+        mgmt_post.config.step_count = 1
+        mgmt_post.config.columnar_windows = True
+        mgmt_post.save_windows()  # columnar layout saved to 'i00/s01'
+        assert(ds.auxiliary_data.MisfitWindows.i00.s01.list() == ["NZ_BFZ"])
+
+        # Rewriting a station replaces its rows in the consolidated array
+        consolidate_misfit_windows(ds, path="i00/s01")
+        mgmt_post.save_windows()
+        consolidate_misfit_windows(ds, path="i00/s01")
+        assert(ds.auxiliary_data.MisfitWindows.i00.s01.list() == ["windows"])
+
+        windows = ds.auxiliary_data.MisfitWindows.i00
+        default = dict(window_parameters(windows.s00, "NZ", "BFZ"))
+        columnar = dict(window_parameters(windows.s01, "NZ", "BFZ"))
+        assert(default.keys() == columnar.keys())
+        for tag, parameters in columnar.items():
+            for key, value in parameters.items():
+                if isinstance(value, float):
+                    assert(value == pytest.approx(default[tag][key]))
+                else:
+                    assert(value == default[tag][key])
+
+        # Windows are retrieved as Pyflex Windows for a given station
+        assert(not window_parameters(windows.s01, station="XXX"))
+        window_dict = load_windows(ds, net="NZ", sta="BFZ", iteration=0,
+                                   step_count=1)
+        for comp in mgmt_post.windows:
+            for w, window in enumerate(mgmt_post.windows[comp]):
+                for attr in ["left", "right", "cc_shift", "channel_id"]:
+                    assert(getattr(window, attr) ==
+                           getattr(window_dict[comp][w], attr))
+
+
+def test_window_index(tmpdir, mgmt_post):
+    """
+    Ensure the per-dataset window index returns station windows and is
+    invalidated when new windows are written
+    """
+    with ASDFDataSet(os.path.join(tmpdir, "test_dataset.h5")) as ds:
+        mgmt_post.ds = ds
+        mgmt_post.config.iteration = 1
+        mgmt_post.config.step_count = 0
+        mgmt_post.config.save_to_ds = True
+        mgmt_post.save_windows()
+
+        index = get_window_index(ds)
+        assert(get_window_index(ds) is index)
+        assert(index.steps == [(1, 0)])
+        nwin = sum(len(_) for _ in mgmt_post.windows.values())
+        assert(len(index.get(1, 0, "NZ", "BFZ")) == nwin)
+        assert(index.get(1, 0, "NZ", "XXX") == [])
+        assert(index.get(1, 1, "NZ", "BFZ") == [])
+
+        # Writing windows for a new step invalidates the index
+        mgmt_post.config.step_count = 1
+        mgmt_post.save_windows()
+        assert(index.steps == [(1, 0), (1, 1)])
+        assert(len(index.get(1, 1, "NZ", "BFZ")) == nwin)
+        assert(index.previous(1, 1) == ("i01", "s00"))
+        assert(index.previous(1, 2) == ("i01", "s01"))
+
+
 def test_save_adjsrcs(tmpdir, mgmt_post):
     """
     Checks that adjoint sources can be written to dataset and will match the 
@@ -301,3 +429,43 @@ def test_format_windows(mgmt_post):
             for value in values:
                 assert(isinstance(value, float))
 
+
+
+def test_measure_misfit_only(tmpdir, mgmt_post):
+    """
+    Check that misfit only measurements match the full measurement but do not
+    create adjoint sources that can be saved
+    """
+    misfit = mgmt_post.stats.misfit
+    with ASDFDataSet(os.path.join(tmpdir, "test_dataset.h5")) as ds:
+        mgmt_post.ds = ds
+        mgmt_post.stats.misfit = 0
+        mgmt_post.measure(misfit_only=True)
+
+        assert(mgmt_post.misfit_only)
+        assert(mgmt_post.stats.misfit == pytest.approx(misfit))
+        for adjsrc in mgmt_post.adjsrcs.values():
+            assert(adjsrc.adjoint_source is None)
+        assert(not hasattr(ds.auxiliary_data, "AdjointSources"))
+
+
+def test_measure_misfit_only_inspector(tmpdir, mgmt_post):
+    """
+    Check that windows saved alongside misfit only measurements, which have no
+    adjoint sources, can still be collected by the Inspector
+    """
+    from pyatoa import Inspector
+
+    with ASDFDataSet(os.path.join(tmpdir, "test_dataset.h5")) as ds:
+        mgmt_post.ds = ds
+        mgmt_post.config.iteration = 1
+        mgmt_post.config.step_count = 0
+        mgmt_post.config.save_to_ds = True
+        mgmt_post.write()
+        mgmt_post.save_windows()
+        mgmt_post.measure(misfit_only=True)
+        assert(not hasattr(ds.auxiliary_data, "AdjointSources"))
+
+    insp = Inspector(verbose=False).discover(path=tmpdir)
+    assert(len(insp.windows) == mgmt_post.stats.nwin)
+    assert(insp.windows.misfit.isnull().all())
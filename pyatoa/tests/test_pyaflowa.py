@@ -0,0 +1,250 @@
+"""
+Test the Pyaflowa workflow class and its parallel processing functionalities,
+for stations of a single event and for multiple events
+"""
+import os
+import json
+import pytest
+import numpy as np
+from pyasdf import ASDFDataSet
+from obspy import read_events
+from pyatoa import Config, logger
+from pyatoa.core.pyaflowa import Pyaflowa, DeferredDataSet
+from pyatoa.utils.form import format_event_name
+
+
+# Turn off the logger for tests
+logger.propogate = False
+logger.setLevel("CRITICAL")
+
+SOURCE_NAME = "2018p130600"
+CODES = ["NZ.BFZ.??.HH?", "NZ.XYZ.??.HH?"]
+
+
+@pytest.fixture
+def config():
+    """
+    Config for the first function evaluation, gathering data only from the
+    test data directories
+    """
+    return Config(iteration=1, step_count=0, client=None)
+
+
+def make_pyaflowa(workdir, config, source_names=(SOURCE_NAME,)):
+    """
+    Create a standalone Pyaflowa working directory that reads waveforms,
+    responses and synthetics from the test data. Each source gets a STATIONS
+    file and a dataset which already contains the event.
+    """
+    for source_name in source_names:
+        os.makedirs(os.path.join(workdir, source_name), exist_ok=True)
+        with open(os.path.join(workdir, source_name, "STATIONS"), "w") as f:
+            f.write("BFZ NZ -40.6796 176.2462 283.0 0.0\n")
+            f.write("XYZ NZ -40.0000 176.0000 0.0 0.0\n")
+
+        os.makedirs(os.path.join(workdir, "datasets"), exist_ok=True)
+        dsfid = os.path.join(workdir, "datasets", f"{source_name}.h5")
+        with ASDFDataSet(dsfid) as ds:
+            ds.add_quakeml(
+                read_events("./test_data/test_catalog_2018p130600.xml"))
+
+    return Pyaflowa(structure="standalone", config=config, plot=False,
+                    log_level="CRITICAL", workdir=str(workdir),
+                    responses=os.path.abspath("./test_data/test_seed"),
+                    waveforms=os.path.abspath("./test_data/test_mseeds"),
+                    synthetics=os.path.abspath("./test_data/synthetics"))
+
+
+def dataset_contents(dsfid):
+    """
+    Collect the waveform tags, StationXML, events and the full auxiliary data
+    layout of a dataset. Window and adjoint source data are included so that
+    datasets can be compared item by item.
+    """
+    contents = {"waveforms": {}, "auxiliary_data": {}}
+    with ASDFDataSet(dsfid, mode="r") as ds:
+        contents["events"] = len(ds.events)
+        for sta in ds.waveforms.list():
+            contents["waveforms"][sta] = sorted(ds.waveforms[sta].list())
+
+        def walk(group, path):
+            for tag in group.list():
+                item = group[tag]
+                if hasattr(item, "list"):
+                    walk(item, f"{path}/{tag}")
+                elif path.split("/")[1] in ["MisfitWindows", "AdjointSources"]:
+                    contents["auxiliary_data"][f"{path}/{tag}"] = (
+                        item.data[()], item.parameters)
+                else:
+                    contents["auxiliary_data"][f"{path}/{tag}"] = None
+
+        walk(ds.auxiliary_data, "")
+
+    return contents
+
+
+def test_deferred_dataset(tmpdir):
+    """
+    Ensure that the deferred dataset is treated as an ASDFDataSet, reads
+    from the file, and records writes rather than making them
+    """
+    dsfid = os.path.join(tmpdir, f"{SOURCE_NAME}.h5")
+    cat = read_events("./test_data/test_catalog_2018p130600.xml")
+    with ASDFDataSet(dsfid) as ds:
+        ds.add_quakeml(cat)
+
+    with DeferredDataSet(dsfid) as ds:
+        assert(isinstance(ds, ASDFDataSet))
+        assert(format_event_name(ds) == SOURCE_NAME)
+        assert(len(ds.events) == 1)
+        ds.add_quakeml(cat)
+        ds.add_auxiliary_data(data=np.zeros(3), data_type="Test",
+                              path="test", parameters={})
+        calls = ds.calls
+    assert([_[0] for _ in calls] == ["add_quakeml", "add_auxiliary_data"])
+
+    with ASDFDataSet(dsfid) as ds:
+        assert(not ds.auxiliary_data.list())
+        # The duplicate event is ignored, the auxiliary data is written
+        DeferredDataSet.replay(calls=calls, ds=ds)
+        assert(len(ds.events) == 1)
+        assert(ds.auxiliary_data.list() == ["Test"])
+
+
+def test_process_event_parallel(tmpdir, config):
+    """
+    Ensure that processing stations in parallel results in the same misfit
+    and the same dataset contents as processing them in serial
+    """
+    results = {}
+    for max_workers in [1, 2]:
+        workdir = os.path.join(tmpdir, f"workers_{max_workers}")
+        pyaflowa = make_pyaflowa(workdir, config)
+        misfit = pyaflowa.process_event(SOURCE_NAME, codes=CODES,
+                                        max_workers=max_workers)
+        results[max_workers] = (misfit, dataset_contents(
+            os.path.join(workdir, "datasets", f"{SOURCE_NAME}.h5")))
+
+    misfit_serial, contents_serial = results[1]
+    misfit_parallel, contents_parallel = results[2]
+
+    assert(misfit_serial is not None)
+    assert(misfit_parallel == pytest.approx(misfit_serial))
+    assert(contents_parallel["events"] == contents_serial["events"])
+    assert(contents_parallel["waveforms"] == contents_serial["waveforms"])
+
+    aux_serial = contents_serial["auxiliary_data"]
+    aux_parallel = contents_parallel["auxiliary_data"]
+    assert(list(aux_parallel.keys()) == list(aux_serial.keys()))
+    assert(any(_.startswith("/MisfitWindows") for _ in aux_serial))
+    for path, item in aux_serial.items():
+        if item is None:
+            assert(aux_parallel[path] is None)
+            continue
+        data, parameters = item
+        np.testing.assert_allclose(aux_parallel[path][0], data)
+        assert(aux_parallel[path][1].keys() == parameters.keys())
+        for key, val in parameters.items():
+            if isinstance(val, (float, np.floating)):
+                assert(aux_parallel[path][1][key] == pytest.approx(val))
+            else:
+                assert(aux_parallel[path][1][key] == val)
+
+
+class RecordingPyaflowa(Pyaflowa):
+    """
+    Pyaflowa that records the order in which events are processed instead of
+    processing them, used to test multi-event scheduling
+    """
+    def process_event(self, source_name, misfit=1., fail=False, **kwargs):
+        with open(os.path.join(self.path_structure.workdir, "order.txt"),
+                  "a") as f:
+            f.write(f"{source_name}\n")
+        if fail:
+            raise ValueError("processing failed")
+        return misfit
+
+
+def make_multi_event(workdir, config, nstations):
+    """
+    Create a standalone working directory with a STATIONS file of a given
+    length for each event, which sets the estimated cost of each event
+    """
+    for source_name, nsta in nstations.items():
+        os.makedirs(os.path.join(workdir, source_name))
+        with open(os.path.join(workdir, source_name, "STATIONS"), "w") as f:
+            f.write("BFZ NZ -40.6796 176.2462 283.0 0.0\n" * nsta)
+
+    return RecordingPyaflowa(structure="standalone", config=config,
+                             plot=False, workdir=str(workdir))
+
+
+def read_order(workdir):
+    """Return the order in which a RecordingPyaflowa processed events"""
+    with open(os.path.join(workdir, "order.txt"), "r") as f:
+        return f.read().split()
+
+
+def test_estimate_event_costs(tmpdir, config):
+    """
+    Ensure that event costs scale with the number of stations, and that
+    previous wall times are used and set the scale of other estimates
+    """
+    pyaflowa = make_multi_event(tmpdir, config, {"A": 1, "B": 3, "C": 2})
+    costs = pyaflowa.estimate_event_costs(["A", "B", "C"])
+    assert(costs["B"] == pytest.approx(3 * costs["A"]))
+    assert(costs["C"] == pytest.approx(2 * costs["A"]))
+
+    timings_fid = os.path.join(tmpdir, "timings.json")
+    with open(timings_fid, "w") as f:
+        json.dump({"A": {"wall_time_s": 10.}}, f)
+    costs = pyaflowa.estimate_event_costs(["A", "B", "C"],
+                                          timings_fid=timings_fid)
+    assert(costs == pytest.approx({"A": 10., "B": 30., "C": 20.}))
+
+
+def test_multi_event_process(tmpdir, config):
+    """
+    Ensure that events are processed longest-job-first with their own kwargs,
+    and that a failed event does not stop other events from being processed
+    """
+    pyaflowa = make_multi_event(tmpdir, config, {"A": 1, "B": 3, "C": 2})
+    timings_fid = os.path.join(tmpdir, "timings.json")
+    misfits = pyaflowa.multi_event_process(
+        ["A", "B", "C"], max_workers=1, timings_fid=timings_fid, misfit=2.,
+        event_kwargs={"B": {"fail": True}, "C": {"misfit": 5.}})
+
+    assert(read_order(tmpdir) == ["B", "C", "A"])
+    assert(misfits == {"A": 2., "B": None, "C": 5.})
+
+    with open(timings_fid, "r") as f:
+        timings = json.load(f)
+    assert(list(timings.keys()) == ["A", "B", "C"])
+    assert(timings["A"]["status"] == timings["C"]["status"] == "success")
+    assert(timings["B"]["status"].startswith("error"))
+    assert(timings["B"]["wall_time_s"] is None)
+
+
+def test_multi_event_timings_merge(tmpdir, config, monkeypatch):
+    """
+    Ensure that a partial rerun keeps the timings of events that were not
+    rerun or that failed, and that timings can be written to the working
+    directory
+    """
+    monkeypatch.chdir(tmpdir)
+    pyaflowa = make_multi_event(tmpdir, config, {"A": 1, "B": 3, "C": 2})
+    pyaflowa.multi_event_process(["A", "B", "C"], max_workers=1,
+                                 timings_fid="timings.json")
+    with open("timings.json", "r") as f:
+        timings = json.load(f)
+
+    pyaflowa.multi_event_process(["A", "B"], max_workers=1,
+                                 timings_fid="timings.json",
+                                 event_kwargs={"B": {"fail": True}})
+    with open("timings.json", "r") as f:
+        timings_rerun = json.load(f)
+
+    assert(timings_rerun.keys() == timings.keys())
+    assert(timings_rerun["B"] == timings["B"])
+    assert(timings_rerun["C"] == timings["C"])
+    assert(timings_rerun["A"]["wall_time_s"] is not None)
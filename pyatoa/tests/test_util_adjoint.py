@@ -0,0 +1,110 @@
+"""
+Test the batched misfit and adjoint source utilities against Pyadjoint
+"""
+import pytest
+import pyadjoint
+import numpy as np
+from pyadjoint.utils import window_taper
+from obspy import read, read_events, read_inventory
+from pyatoa import Config, Manager, logger
+from pyatoa.utils import adjoint
+
+
+# Turn off the logger for tests
+logger.propogate = False
+logger.setLevel("CRITICAL")
+
+
+@pytest.fixture
+def mgmt():
+    """
+    A Manager for station NZ.BFZ and event 2018p130600 (GeoNet event id) that
+    has been processed and windowed
+    """
+    mgmt = Manager(
+        config=Config(event_id="2018p130600", client="GEONET"),
+        event=read_events("./test_data/test_catalog_2018p130600.xml")[0],
+        st_obs=read("./test_data/test_obs_data_NZ_BFZ_2018p130600.ascii"),
+        st_syn=read("./test_data/test_syn_data_NZ_BFZ_2018p130600.ascii"),
+        inv=read_inventory("./test_data/test_dataless_NZ_BFZ.xml")
+    )
+    mgmt.standardize().preprocess().window()
+    return mgmt
+
+
+@pytest.mark.parametrize("taper_type", ["hann", "cos", "cos_p10"])
+def test_window_taper(taper_type):
+    """
+    Check that batched window tapers match Pyadjoint for varying lengths
+    """
+    npts = np.arange(2, 250)
+    for taper_percentage in [0., 0.05, 0.3, 1.]:
+        tapers = adjoint.window_taper(npts, taper_percentage, taper_type)
+        for n, taper in zip(npts, tapers):
+            check = window_taper(np.ones(n), taper_percentage, taper_type)
+            assert(np.allclose(taper[:n], check))
+            assert(not taper[n:].any())
+
+    with pytest.raises(ValueError):
+        adjoint.window_taper(npts, 0.3, "boxcar")
+
+
+@pytest.mark.parametrize("measure_type", ["dt", "am"])
+def test_calculate_adjoint_sources(mgmt, measure_type):
+    """
+    Check that batched adjoint sources match Pyadjoint for all components
+    """
+    mgmt.config.pyadjoint_config.measure_type = measure_type
+    windows = mgmt._format_windows()
+    assert(windows)
+
+    adjsrcs = adjoint.calculate_adjoint_sources(
+        st_obs=mgmt.st_obs, st_syn=mgmt.st_syn, windows=windows,
+        config=mgmt.config.pyadjoint_config
+    )
+    for comp, adj_win in windows.items():
+        check = pyadjoint.calculate_adjoint_source(
+            adj_src_type="cc_traveltime_misfit",
+            config=mgmt.config.pyadjoint_config,
+            observed=mgmt.st_obs.select(component=comp)[0],
+            synthetic=mgmt.st_syn.select(component=comp)[0],
+            window=adj_win, plot=False
+        )
+        assert(adjsrcs[comp].misfit == pytest.approx(check.misfit))
+        assert(np.allclose(adjsrcs[comp].adjoint_source, check.adjoint_source,
+                           atol=1E-12 * np.abs(check.adjoint_source).max()))
+
+
+def test_calculate_adjoint_sources_misfit_only(mgmt):
+    """
+    Check that misfit only measurements do not assemble adjoint sources
+    """
+    windows = mgmt._format_windows()
+    adjsrcs = adjoint.calculate_adjoint_sources(
+        st_obs=mgmt.st_obs, st_syn=mgmt.st_syn, windows=windows,
+        config=mgmt.config.pyadjoint_config
+    )
+    adjsrcs_misfit = adjoint.calculate_adjoint_sources(
+        st_obs=mgmt.st_obs, st_syn=mgmt.st_syn, windows=windows,
+        config=mgmt.config.pyadjoint_config, adjoint_src=False
+    )
+    for comp, adjsrc in adjsrcs_misfit.items():
+        assert(adjsrc.adjoint_source is None)
+        assert(adjsrc.misfit == adjsrcs[comp].misfit)
+
+
+def test_manager_measure_batch(mgmt):
+    """
+    Check that the batched adjoint source type is selected through the Config
+    and gives the same misfit as Pyadjoint
+    """
+    mgmt.measure()
+    misfit = mgmt.stats.misfit
+
+    mgmt.config.adj_src_type = "cc_traveltime_misfit_batch"
+    mgmt.stats.misfit = 0
+    mgmt.measure()
+    assert(mgmt.stats.misfit == pytest.approx(misfit))
+    for comp, adjsrc in mgmt.adjsrcs.items():
+        assert(adjsrc.adj_src_type == "cc_traveltime_misfit")
+        assert(adjsrc.component[-1] == comp)
@@ -131,3 +131,166 @@ def test_match_npts(st_obs, st_syn):
     :return:
     """
     pass
+
+
+def test_remove_instrument_response(tmpdir, st_obs, inv):
+    """
+    Ensure that response removal with cached response spectra matches ObsPy,
+    both when evaluated fresh and when read back from the on-disk cache
+    """
+    st_check = st_obs.copy()
+    st_check.remove_response(inventory=inv, output="DISP", water_level=60)
+
+    process.clear_response_cache()
+    st_fresh = process.remove_instrument_response(
+        st_obs.copy(), inv=inv, output="DISP", water_level=60, cache_dir=tmpdir
+    )
+    assert(len(tmpdir.listdir()) == len(st_obs))
+
+    process.clear_response_cache()
+    st_disk = process.remove_instrument_response(
+        st_obs.copy(), inv=inv, output="DISP", water_level=60, cache_dir=tmpdir
+    )
+
+    for tr_check, tr_fresh, tr_disk in zip(st_check, st_fresh, st_disk):
+        np.testing.assert_allclose(tr_fresh.data, tr_check.data)
+        np.testing.assert_allclose(tr_disk.data, tr_check.data)
+
+
+def test_stf_convolve(st_syn):
+    """
+    Ensure that frequency domain convolution with cached source time function
+    spectra matches time domain convolution, including traces shorter than
+    the source time function
+    """
+    process.clear_stf_cache()
+    sampling_rate = st_syn[0].stats.sampling_rate
+
+    st_short = st_syn.copy()
+    st_short[0].data = st_short[0].data[:100]
+    for half_duration in [1., 5.]:
+        for st in [st_syn, st_short]:
+            st_conv = process.stf_convolve(st, half_duration=half_duration,
+                                           time_shift=1.)
+            stf = process._gaussian_stf(half_duration, sampling_rate)
+            for tr, tr_conv in zip(st, st_conv):
+                np.testing.assert_allclose(
+                    tr_conv.data, np.convolve(tr.data, stf, mode="same"),
+                    atol=1E-12 * np.abs(tr.data).max())
+                assert(tr_conv.stats.starttime == tr.stats.starttime + 1.)
+
+    # Only the long source time function is convolved in the frequency domain,
+    # components of equal length share a single cached spectrum
+    assert(len(process._STF_CACHE) == 1)
+
+
+def test_batch_detrend_taper_and_filter(st_obs):
+    """
+    Ensure that batched detrending, tapering and filtering match the
+    equivalent ObsPy Stream methods
+    """
+    st_check = st_obs.copy()
+    st_check.detrend("simple").detrend("demean").taper(0.05)
+    st_check.detrend("simple").taper(0.2, side="left")
+    st_check.filter("bandpass", freqmin=1/30, freqmax=1/10, corners=4,
+                    zerophase=True)
+
+    st_batch = process.batch_detrend_taper(st_obs.copy(), 0.05)
+    st_batch = process.batch_detrend_taper(st_batch, 0.2, side="left",
+                                           demean=False)
+    st_batch = process.filters(st_batch, min_period=10, max_period=30,
+                               corners=4, batch=True)
+
+    for tr_check, tr_batch in zip(st_check, st_batch):
+        np.testing.assert_allclose(tr_batch.data, tr_check.data,
+                                   atol=1E-12 * np.abs(tr_check.data).max())
+    assert(process.is_preprocessed(st_batch))
+
+
+def test_batch_process(mgmt_pre):
+    """
+    Ensure that the batched preprocessing engine matches default processing
+    """
+    mgmt_pre.standardize()
+    for choice in ["obs", "syn"]:
+        st_default = process.default_process(mgmt_pre, choice=choice)
+        st_batch = process.batch_process(mgmt_pre, choice=choice)
+        for tr_default, tr_batch in zip(st_default, st_batch):
+            assert(tr_batch.id == tr_default.id)
+            np.testing.assert_allclose(
+                tr_batch.data, tr_default.data,
+                atol=1E-9 * np.abs(tr_default.data).max())
+
+
+def test_filter_and_taper_cache(st_obs):
+    """
+    Ensure that filter designs and taper windows are evaluated once for traces
+    sharing sampling rate and length, and that cached filtering and tapering
+    match ObsPy
+    """
+    process.clear_filter_cache()
+    st_check = st_obs.copy().filter("bandpass", freqmin=1/30, freqmax=1/10,
+                                    corners=4, zerophase=True).taper(0.05)
+
+    for _ in range(2):
+        st = process.filters(st_obs.copy(), min_period=10, max_period=30,
+                             corners=4)
+        st = process.hann_taper(st, max_percentage=0.05)
+    for tr_check, tr in zip(st_check, st):
+        np.testing.assert_allclose(tr.data, tr_check.data,
+                                   atol=1E-12 * np.abs(tr_check.data).max())
+
+    info = process.cache_info()
+    for name in ["filter", "taper"]:
+        assert(info[name] == {"hits": 2 * len(st_obs) - 1, "misses": 1,
+                              "size": 1})
+
+    process.clear_filter_cache()
+    assert(process.cache_info()["filter"] == {"hits": 0, "misses": 0,
+                                              "size": 0})
+
+
+def test_resample(st_obs, st_syn):
+    """
+    Ensure that polyphase resampling matches ObsPy's frequency domain
+    resampling in the passband, that the anti-aliasing filter is designed once
+    per ratio, and that rates without a small rational ratio fall back to ObsPy
+    """
+    process.clear_filter_cache()
+    sampling_rate = st_syn[0].stats.sampling_rate
+    st_obs = process.filters(st_obs, min_period=10, max_period=30)
+    st_check = st_obs.copy().resample(sampling_rate)
+    st_poly = process.resample(st_obs.copy(), sampling_rate)
+    assert(process.cache_info()["resample"]["misses"] == 1)
+
+    for tr_check, tr_poly in zip(st_check, st_poly):
+        assert(tr_poly.stats.sampling_rate == tr_check.stats.sampling_rate)
+        assert(tr_poly.stats.npts == tr_check.stats.npts)
+        assert("polyphase" in tr_poly.stats.processing[-1])
+        # Compare away from the edges, where the two methods differ
+        i = tr_check.stats.npts // 10
+        np.testing.assert_allclose(tr_poly.data[i:-i], tr_check.data[i:-i],
+                                   atol=1E-3 * np.abs(tr_check.data).max())
+
+    st_fft = process.resample(st_obs.copy(), sampling_rate=np.pi)
+    assert("polyphase" not in st_fft[0].stats.processing[-1])
+
+
+def test_trim_and_pad(st_obs, st_syn):
+    """
+    Ensure that trimming and padding in a single step results in the same
+    traces as ObsPy's padded trim, for windows extending past either end
+    """
+    st_obs.resample(st_syn[0].stats.sampling_rate)
+    tr = st_obs[0]
+    npts = st_syn[0].stats.npts
+    for shift in [-100, 0, 100, tr.stats.npts - 10]:
+        starttime = tr.stats.starttime + shift * tr.stats.delta
+        tr_check = tr.copy().trim(
+            starttime, starttime + (npts - 1) * tr.stats.delta, pad=True,
+            fill_value=0, nearest_sample=True)
+        tr_out = process.trim_and_pad(
+            st_obs.copy(), starttime=starttime, npts=npts)[0]
+        assert(tr_out.stats.starttime == starttime)
+        assert(tr_out.stats.npts == npts)
+        np.testing.assert_array_equal(tr_out.data, tr_check.data)
@@ -0,0 +1,119 @@
+"""
+Test the functionalities of the file reading utilities
+"""
+import os
+import pytest
+import numpy as np
+from obspy import Stream, UTCDateTime
+from pyatoa.utils import read
+
+
+@pytest.fixture
+def sem_fid():
+    """
+    Two-column Specfem3D ASCII synthetic seismogram for station NZ.BFZ
+    """
+    return "./test_data/synthetics/NZ.BFZ.BXE.semd"
+
+
+def test_read_sem(sem_fid):
+    """
+    Ensure that two-column ASCII files are read in correctly
+    """
+    times, data = np.loadtxt(sem_fid, unpack=True)
+    origintime = UTCDateTime("2018-02-18T07:43:48.127644Z")
+    st = read.read_sem(sem_fid, origintime=origintime)
+
+    assert(len(st) == 1)
+    assert(st[0].id == "NZ.BFZ..BXE")
+    assert(st[0].stats.npts == len(data))
+    assert(st[0].stats.starttime == origintime + times[0])
+    np.testing.assert_array_equal(st[0].data, data)
+
+
+def test_read_sem_comma_format(tmpdir, sem_fid):
+    """
+    Newer Specfem versions write comma separated values with Fortran repeat
+    values, e.g. '2*0.0000', ensure these are read the same as two columns
+    """
+    times, data = np.loadtxt(sem_fid, unpack=True)
+    lines = []
+    for t, d in zip(times, data):
+        if t == d:
+            lines.append(f"2*{t}")
+        else:
+            lines.append(f"{t},{d}")
+    fid = os.path.join(tmpdir, os.path.basename(sem_fid))
+    with open(fid, "w") as f:
+        f.write("\n".join(lines))
+
+    st = read.read_sem(fid)
+    np.testing.assert_array_equal(st[0].data, data)
+
+
+def test_read_sem_dir(sem_fid):
+    """
+    Read all synthetic seismograms from a directory in one call
+    """
+    st = read.read_sem_dir(os.path.dirname(sem_fid))
+    assert(len(st) == 3)
+    assert(sorted(tr.stats.channel for tr in st) == ["BXE", "BXN", "BXZ"])
+
+
+@pytest.fixture
+def specfem_output(tmpdir, sem_fid):
+    """
+    Write the ASCII test synthetics out as Specfem Seismic Unix and Specfem2D
+    binary files, with the station placed second in a two-station STATIONS
+    file and a dummy station filling the other trace
+    """
+    path = os.path.dirname(sem_fid)
+    with open(os.path.join(tmpdir, "STATIONS"), "w") as f:
+        f.write("AAA XX 0.0 0.0 0.0 0.0\n")
+        f.write("BFZ NZ -40.6796 176.2462 283.0 0.0\n")
+
+    for cmp, specfem_cmp in zip("ENZ", "xyz"):
+        times, data = np.loadtxt(os.path.join(path, f"NZ.BFZ.BX{cmp}.semd"),
+                                 unpack=True)
+        data = data.astype("f4")
+        traces = np.zeros(2, dtype=[("header", read.SU_HEADER_DTYPE),
+                                    ("data", "f4", (len(data),))])
+        traces["header"]["tracl"] = [2, 1]
+        traces["header"]["delrt"] = round(times[0] * 1E3)
+        traces["header"]["ns"] = len(data)
+        traces["header"]["dt"] = round((times[1] - times[0]) * 1E6)
+        traces["data"][0] = data
+        traces.tofile(os.path.join(tmpdir, f"0_d{specfem_cmp}_SU"))
+
+        np.vstack([np.zeros_like(data), data]).tofile(
+            os.path.join(tmpdir, f"U{specfem_cmp}_file_single_d.bin"))
+
+    return tmpdir
+
+
+def test_read_specfem_su_and_binary(specfem_output, sem_fid):
+    """
+    Ensure that Seismic Unix and binary Specfem seismograms produce the same
+    traces as their ASCII counterparts
+    """
+    st_sem = read.read_sem_dir(os.path.dirname(sem_fid))
+    stations = os.path.join(specfem_output, "STATIONS")
+
+    st_su, st_bin = Stream(), Stream()
+    for cmp in "xyz":
+        st_su += read.read_specfem_su(
+            os.path.join(specfem_output, f"0_d{cmp}_SU"), stations,
+            station="BFZ")
+        st_bin += read.read_specfem_binary(
+            os.path.join(specfem_output, f"U{cmp}_file_single_d.bin"),
+            stations, delta=st_sem[0].stats.delta,
+            time_offset=st_sem[0].stats.time_offset, station="BFZ")
+
+    for st in [st_su, st_bin]:
+        assert(len(st) == 3)
+        for tr_sem, tr in zip(st_sem, st):
+            assert(tr.id == tr_sem.id)
+            assert(tr.stats.starttime == tr_sem.stats.starttime)
+            assert(tr.stats.delta == tr_sem.stats.delta)
+            assert(tr.stats.npts == tr_sem.stats.npts)
+            np.testing.assert_allclose(tr.data, tr_sem.data, rtol=1E-6)
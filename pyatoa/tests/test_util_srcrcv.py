@@ -0,0 +1,64 @@
+"""
+Test the functionalities of the source-receiver utilities
+"""
+import pytest
+import warnings
+import numpy as np
+from pyasdf import ASDFDataSet
+from obspy.geodetics import gps2dist_azimuth
+from pyatoa.utils import srcrcv
+
+
+@pytest.fixture
+def coordinates():
+    """
+    Random source and receiver coordinates, including coincident, equatorial,
+    antipodal and dateline-crossing pairs
+    """
+    rng = np.random.default_rng(123)
+    lat1, lon1 = rng.uniform(-90, 90, 500), rng.uniform(-180, 180, 500)
+    lat2, lon2 = rng.uniform(-90, 90, 500), rng.uniform(-180, 180, 500)
+    lat1[:4], lon1[:4] = [10., 0., 0., -40.], [20., 10., 0., 175.]
+    lat2[:4], lon2[:4] = [10., 0., 0., -41.], [20., 30., 180., -175.]
+    return lat1, lon1, lat2, lon2
+
+
+def test_gcd_and_baz_array(coordinates):
+    """
+    Ensure that vectorized distances and backazimuths match ObsPy's
+    gps2dist_azimuth, and that the spherical approximation is close
+    """
+    # Antipodal pairs warn about the unstable Vincenty solution
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected = np.array([gps2dist_azimuth(*_) for _ in zip(*coordinates)])
+        gcd, baz = srcrcv.gcd_and_baz_array(*coordinates)
+
+    np.testing.assert_allclose(gcd, expected[:, 0] * 1E-3, atol=1E-3)
+    np.testing.assert_allclose((baz - expected[:, 2] + 180) % 360 - 180, 0,
+                               atol=1E-6)
+
+    gcd_sph, _ = srcrcv.gcd_and_baz_array(*coordinates, spherical=True)
+    np.testing.assert_allclose(gcd_sph, gcd, rtol=1E-2)
+
+    # Coordinates broadcast to all source-receiver pairs
+    lat1, lon1, lat2, lon2 = coordinates
+    gcd, _ = srcrcv.gcd_and_baz_array(lat1[4:7, None], lon1[4:7, None],
+                                      lat2[4:9], lon2[4:9])
+    assert(gcd.shape == (3, 5))
+    assert(gcd[2, 4] == srcrcv.gcd_and_baz_array(lat1[6], lon1[6],
+                                                 lat2[8], lon2[8])[0])
+
+
+def test_sort_by_backazimuth():
+    """
+    Ensure stations are sorted by the backazimuth calculated for each station
+    """
+    with ASDFDataSet("./test_data/test_ASDFDataSet.h5", mode="r") as ds:
+        stations = srcrcv.sort_by_backazimuth(ds)
+        bazs = [srcrcv.gcd_and_baz(ds.events[0],
+                                   ds.waveforms[_].StationXML[0][0])[1]
+                for _ in stations]
+        stations_ccw = srcrcv.sort_by_backazimuth(ds, clockwise=False)
+    assert(stations == stations_ccw[::-1])
+    assert(bazs == sorted(bazs))
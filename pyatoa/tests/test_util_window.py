@@ -0,0 +1,142 @@
+"""
+Test the functionalities of the window utilities
+"""
+import os
+import pytest
+import pyflex
+import numpy as np
+from pyflex.window import Window
+from pyasdf import ASDFDataSet
+from obspy import read, read_events, read_inventory
+from pyatoa import Config
+from pyatoa.utils import window
+from pyatoa.utils.asdf.add import add_phase_arrivals
+from pyatoa.utils.asdf.load import load_phase_arrivals
+
+
+@pytest.fixture
+def st_obs():
+    """
+    Raw observed waveforms from station NZ.BFZ.HH? for New Zealand event
+    2018p130600 (GeoNet event id)
+    """
+    return read("./test_data/test_obs_data_NZ_BFZ_2018p130600.ascii")
+
+
+@pytest.fixture
+def event():
+    """
+    Event for New Zealand based event with GeoNet Event ID: 2018p130600
+    """
+    return read_events("./test_data/test_catalog_2018p130600.xml")[0]
+
+
+@pytest.fixture
+def inv():
+    """
+    StationXML information for station NZ.BFZ.HH?
+    """
+    return read_inventory("./test_data/test_dataless_NZ_BFZ.xml")
+
+
+def test_window_criteria(st_obs):
+    """
+    Ensure that vectorized window criteria match those calculated by Pyflex,
+    for windows on different components and of different lengths
+    """
+    obs = np.vstack([tr.data for tr in st_obs]).astype(float)
+    syn = np.roll(obs, 25, axis=1) * 0.5
+    npts = obs.shape[1]
+    left = np.array([100, 1000, 5000, 2000, npts - 50])
+    right = np.array([300, 1200, 9000, 2100, npts + 50])
+    index = np.array([0, 0, 1, 2, 2])
+
+    max_cc_value, cc_shift, dlna = window.window_criteria(obs, syn, left,
+                                                          right, index)
+    for i in range(len(left)):
+        win = Window(left=left[i], right=right[i], center=0, dt=1,
+                     time_of_first_sample=0, min_period=1, channel_id="")
+        win._calc_criteria(obs[index[i]], syn[index[i]])
+        assert(cc_shift[i] == win.cc_shift)
+        np.testing.assert_allclose(max_cc_value[i], win.max_cc_value)
+        np.testing.assert_allclose(dlna[i], win.dlnA)
+
+
+def test_phase_arrivals():
+    """
+    Ensure that phase arrivals are only calculated once per source depth and
+    distance, and that the cache cannot be modified through returned values
+    """
+    window.clear_phase_arrival_cache()
+    ttimes = window.phase_arrivals(source_depth_in_km=20.,
+                                   distance_in_degree=5.)
+    assert(ttimes[0]["name"] == "P")
+    assert(ttimes == sorted(ttimes, key=lambda _: _["time"]))
+
+    ttimes[0]["time"] = 0
+    assert(window.phase_arrivals(20., 5.)[0]["time"] > 0)
+    assert(len(window._PHASE_ARRIVAL_CACHE) == 1)
+
+    window.phase_arrivals(20., 5., earth_model="iasp91")
+    assert(len(window._PHASE_ARRIVAL_CACHE) == 2)
+
+
+def test_window_selector_ttimes(st_obs, event, inv):
+    """
+    Ensure that the WindowSelector calculates the same arrivals as Pyflex,
+    and uses precomputed arrivals if given
+    """
+    config = Config().pyflex_config
+    tr = st_obs.select(component="Z")[0]
+    kwargs = dict(observed=tr, synthetic=tr, config=config, event=event,
+                  station=inv)
+
+    ws_check = pyflex.WindowSelector(**kwargs)
+    ws_check.calculate_ttimes()
+    ws = window.WindowSelector(**kwargs)
+    ws.calculate_ttimes()
+    assert(ws.ttimes == ws_check.ttimes)
+
+    ttimes = [{"time": 1., "name": "P"}]
+    ws = window.WindowSelector(ttimes=ttimes, **kwargs)
+    ws.calculate_ttimes()
+    assert(ws.ttimes == ttimes)
+
+
+def test_window_selector_no_taup(st_obs, event, inv, monkeypatch):
+    """
+    Ensure that the WindowSelector does not load a TauP model if arrivals are
+    given, and selects the same windows as Pyflex
+    """
+    config = Config().pyflex_config
+    tr = st_obs.select(component="Z")[0]
+    kwargs = dict(observed=tr, synthetic=tr, config=config, event=event,
+                  station=inv)
+
+    ws_check = pyflex.WindowSelector(**kwargs)
+    windows_check = ws_check.select_windows()
+
+    def no_taup(*args, **kwargs):
+        raise AssertionError("TauP model loaded")
+    monkeypatch.setattr(pyflex.window_selector, "TauPyModel", no_taup)
+    monkeypatch.setattr(window, "TauPyModel", no_taup)
+    monkeypatch.setattr(window, "_TAUP_MODELS", {})
+
+    ws = window.WindowSelector(ttimes=ws_check.ttimes, **kwargs)
+    windows = ws.select_windows()
+    assert(len(windows) == len(windows_check))
+    for win, win_check in zip(windows, windows_check):
+        assert(win.left == win_check.left)
+        assert(win.right == win_check.right)
+
+
+def test_phase_arrivals_dataset(tmpdir):
+    """
+    Ensure that phase arrivals can be saved to and loaded from a dataset
+    """
+    ttimes = window.phase_arrivals(20., 5.)
+    with ASDFDataSet(os.path.join(tmpdir, "test.h5")) as ds:
+        assert(load_phase_arrivals(ds, "ak135/NZ_BFZ") is None)
+        add_phase_arrivals(ttimes, ds, "ak135/NZ_BFZ")
+        assert(load_phase_arrivals(ds, "ak135/NZ_BFZ") == ttimes)
+        assert(load_phase_arrivals(ds, "iasp91/NZ_BFZ") is None)
@@ -0,0 +1,327 @@
+"""
+Batched misfit measurements and adjoint sources, as an alternative to the
+per-window loops of Pyadjoint. All windows of a station are gathered into a
+single zero padded array, so that tapering, cross correlation and adjoint
+source assembly are done once for every window at the same time.
+
+Currently implements the cross correlation traveltime misfit
+('cc_traveltime_misfit' in Pyadjoint), including the amplitude anomaly misfit
+if the Pyadjoint Config `measure_type` is 'am'.
+"""
+import numpy as np
+from pyadjoint.adjoint_source import AdjointSource
+from pyatoa.utils.calculate import xcorr
+
+try:
+    from scipy.integrate import simpson
+except ImportError:
+    from scipy.integrate import simps as simpson
+
+
+# Pyatoa Config adj_src_types that are calculated here rather than Pyadjoint,
+# and the Pyadjoint adjoint source type they are equivalent to
+BATCH_ADJ_SRC_TYPES = {"cc_traveltime_misfit_batch": "cc_traveltime_misfit"}
+
+
+def window_taper(npts, taper_percentage, taper_type="hann"):
+    """
+    Vectorized version of pyadjoint.utils.window_taper(), returning the taper
+    of many windows with different lengths at once.
+
+    :type npts: np.ndarray
+    :param npts: number of samples in each window
+    :type taper_percentage: float
+    :param taper_percentage: total percentage of taper in decimal
+    :type taper_type: str
+    :param taper_type: 'hann', 'cos' or 'cos_p10'
+    :rtype: np.ndarray
+    :return: 2D array with the taper of each window as a row, zero padded to
+        the length of the longest window
+    :raises ValueError: if the taper type is not available
+    """
+    npts = np.asarray(npts, dtype=int)
+    taper_percentage = float(taper_percentage)
+    if taper_percentage in [0., 1.]:
+        frac = (npts * taper_percentage / 2.).astype(int)
+    else:
+        frac = (npts * taper_percentage / 2. + .5).astype(int)
+
+    # Position of each sample along a full taper of 2 * frac samples
+    samples = np.arange(npts.max())
+    left = samples < frac[:, None]
+    right = samples >= (npts - frac)[:, None]
+    j = np.where(left, samples, samples - (npts - 2 * frac)[:, None])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = j / (2 * frac - 1)[:, None]
+
+    taper_type = taper_type.lower()
+    if taper_type == "hann":
+        values = 0.5 - 0.5 * np.cos(2. * np.pi * x)
+    elif taper_type == "cos":
+        values = np.cos(np.pi * x - np.pi / 2.)
+    elif taper_type == "cos_p10":
+        values = 1. - np.cos(np.pi * x) ** 10
+    else:
+        raise ValueError(f"Window taper '{taper_type}' not supported, must be "
+                         f"'hann', 'cos' or 'cos_p10'")
+
+    taper = np.where(left | right, values, 1.)
+    taper[samples >= npts[:, None]] = 0.
+
+    return taper
+
+
+def cc_traveltime_misfit(obs, syn, left, npts, dt, index=None,
+                         taper_percentage=0.3, taper_type="hann",
+                         use_cc_error=True, dt_sigma_min=1.0,
+                         dlna_sigma_min=0.5, measure_type="dt",
+                         adjoint_src=True):
+    """
+    Batched cross correlation traveltime misfit, following Pyadjoint's
+    'cc_traveltime_misfit'. Windows are tapered, cross correlated in the
+    frequency domain and their adjoint sources assembled all at once.
+
+    .. note::
+        Windows of the same row are assumed not to overlap, as is the case
+        for windows picked by Pyflex
+
+    :type obs: np.ndarray
+    :param obs: observed data, 1D, or 2D with one row per component
+    :type syn: np.ndarray
+    :param syn: synthetic data, same shape as `obs`
+    :type left: np.ndarray
+    :param left: first sample of each window
+    :type npts: np.ndarray
+    :param npts: number of samples in each window
+    :type dt: float
+    :param dt: sampling interval of the data in seconds
+    :type index: np.ndarray
+    :param index: if `obs` and `syn` are 2D, the row that each window belongs
+        to. Defaults to the zeroth row
+    :type measure_type: str
+    :param measure_type: 'dt' for traveltime misfit or 'am' for amplitude
+        misfit, as in the Pyadjoint Config
+    :type adjoint_src: bool
+    :param adjoint_src: assemble adjoint sources, if False only measure misfit
+    :rtype: dict
+    :return: per window measurements 'tshift', 'dlna', 'sigma_dt',
+        'sigma_dlna' and 'misfit', and 'adjoint_source', which has the same
+        shape as `obs` and is not time reversed. None if not `adjoint_src`
+    """
+    obs, syn = np.atleast_2d(obs), np.atleast_2d(syn)
+    left = np.asarray(left, dtype=int)
+    npts = np.asarray(npts, dtype=int)
+    if index is None:
+        index = np.zeros(len(left), dtype=int)
+    index = np.asarray(index, dtype=int)
+    if measure_type not in ["dt", "am"]:
+        raise ValueError(f"measure type must be 'dt' or 'am', not "
+                         f"'{measure_type}'")
+    adjoint_source = np.zeros(obs.shape) if adjoint_src else None
+    if not len(left):
+        return {"tshift": np.array([]), "dlna": np.array([]),
+                "sigma_dt": np.array([]), "sigma_dlna": np.array([]),
+                "misfit": np.array([]), "adjoint_source": adjoint_source}
+
+    # Gather the tapered window segments, zero padded to a common length
+    samples = np.arange(npts.max())
+    idx = left[:, None] + samples
+    valid = (samples < npts[:, None]) & (idx < obs.shape[1])
+    idx = np.minimum(idx, obs.shape[1] - 1)
+    taper = window_taper(npts, taper_percentage, taper_type)
+    d = np.where(valid, obs[index[:, None], idx], 0) * taper
+    s = np.where(valid, syn[index[:, None], idx], 0) * taper
+
+    cc, lags = xcorr(d, s, npts)
+    ishift = lags[cc.argmax(axis=1)]
+    tshift = ishift * dt
+    dlna = 0.5 * np.log((d ** 2).sum(axis=1) / (s ** 2).sum(axis=1))
+
+    if use_cc_error:
+        sigma_dt, sigma_dlna = _cc_error(d, s, npts, ishift, dlna, dt,
+                                         dt_sigma_min, dlna_sigma_min)
+    else:
+        sigma_dt, sigma_dlna = np.ones(len(left)), np.ones(len(left))
+
+    if measure_type == "dt":
+        misfit = 0.5 * (tshift / sigma_dt) ** 2
+    else:
+        misfit = 0.5 * (dlna / sigma_dlna) ** 2
+
+    if adjoint_src:
+        if measure_type == "dt":
+            dsdt = _gradient(s, npts, dt)
+            norm = _simpson(dsdt * dsdt, npts, dt)
+            adj = dsdt * (tshift / norm / sigma_dt ** 2)[:, None]
+        else:
+            norm = _simpson(s * s, npts, dt)
+            adj = -1. * s * (dlna / norm / sigma_dlna ** 2)[:, None]
+        rows = np.broadcast_to(index[:, None], idx.shape)
+        adjoint_source[rows[valid], idx[valid]] = adj[valid]
+
+    return {"tshift": tshift, "dlna": dlna, "sigma_dt": sigma_dt,
+            "sigma_dlna": sigma_dlna, "misfit": misfit,
+            "adjoint_source": adjoint_source}
+
+
+def calculate_adjoint_sources(st_obs, st_syn, windows, config,
+                              adj_src_type="cc_traveltime_misfit_batch",
+                              adjoint_src=True):
+    """
+    Batched equivalent of calling pyadjoint.calculate_adjoint_source() for
+    each component. All windows of all components are measured at once.
+
+    .. note::
+        Streams are expected to be standardized, i.e. all traces share the
+        same sampling rate and number of samples
+
+    :type st_obs: obspy.core.stream.Stream
+    :param st_obs: observed waveforms
+    :type st_syn: obspy.core.stream.Stream
+    :param st_syn: synthetic waveforms
+    :type windows: dict of list of lists
+    :param windows: [left, right] window borders in seconds, keyed by
+        component, as returned by Manager._format_windows()
+    :type config: pyadjoint.Config
+    :param config: Pyadjoint Config controlling tapering, errors and the
+        measurement type
+    :type adj_src_type: str
+    :param adj_src_type: batched adjoint source type, see
+        BATCH_ADJ_SRC_TYPES
+    :type adjoint_src: bool
+    :param adjoint_src: calculate adjoint sources, if False the returned
+        AdjointSource objects only carry the misfit
+    :rtype: dict of pyadjoint.AdjointSource
+    :return: adjoint sources keyed by component
+    """
+    if adj_src_type != "cc_traveltime_misfit_batch":
+        raise NotImplementedError(f"No batched adjoint source type "
+                                  f"'{adj_src_type}'")
+
+    obs, syn, traces, index, left, npts = [], [], {}, [], [], []
+    for comp, windows_ in windows.items():
+        try:
+            tr_obs = st_obs.select(component=comp)[0]
+            tr_syn = st_syn.select(component=comp)[0]
+        # IndexError thrown when trying to access an empty Stream
+        except IndexError:
+            continue
+        traces[comp] = tr_obs
+        obs.append(tr_obs.data)
+        syn.append(tr_syn.data)
+
+        # Window borders in samples, following Pyadjoint
+        dt = tr_syn.stats.delta
+        for left_border, right_border in windows_:
+            index.append(len(obs) - 1)
+            left.append(int(np.floor(left_border / dt)))
+            npts.append(int(np.floor((right_border - left_border) / dt)) + 1)
+
+    if not traces:
+        return {}
+
+    result = cc_traveltime_misfit(
+        obs=np.vstack(obs), syn=np.vstack(syn), left=left, npts=npts, dt=dt,
+        index=index, taper_percentage=config.taper_percentage,
+        taper_type=config.taper_type, use_cc_error=config.use_cc_error,
+        dt_sigma_min=config.dt_sigma_min, dlna_sigma_min=config.dlna_sigma_min,
+        measure_type=config.measure_type, adjoint_src=adjoint_src
+    )
+    misfits = np.bincount(np.asarray(index, dtype=int),
+                          weights=result["misfit"], minlength=len(traces))
+
+    adjsrcs = {}
+    for i, (comp, tr) in enumerate(traces.items()):
+        if adjoint_src:
+            adjoint_source = result["adjoint_source"][i][::-1].copy()
+        else:
+            adjoint_source = None
+        adjsrcs[comp] = AdjointSource(
+            BATCH_ADJ_SRC_TYPES[adj_src_type], misfit=float(misfits[i]),
+            dt=tr.stats.delta, min_period=config.min_period,
+            max_period=config.max_period, component=tr.stats.channel,
+            adjoint_source=adjoint_source, network=tr.stats.network,
+            station=tr.stats.station, location=tr.stats.location,
+            starttime=tr.stats.starttime
+        )
+
+    return adjsrcs
+
+
+def _cc_error(d, s, npts, ishift, dlna, dt, dt_sigma_min, dlna_sigma_min):
+    """
+    Vectorized version of Pyadjoint's cross correlation traveltime and
+    amplitude anomaly errors, assuming uncorrelated noise. Arguments as in
+    cc_traveltime_misfit()
+
+    :rtype: tuple of np.ndarray
+    :return: traveltime error and amplitude anomaly error of each window
+    """
+    # Synthetics corrected by the time shift, and the amplitude anomaly
+    samples = np.arange(d.shape[1])
+    src = samples - ishift[:, None]
+    valid = (samples < npts[:, None]) & (src >= 0) & (src < npts[:, None])
+    src = np.clip(src, 0, d.shape[1] - 1)
+    s_cc_dt = np.where(valid, s[np.arange(len(s))[:, None], src], 0)
+    s_cc_dtdlna = np.exp(dlna)[:, None] * s_cc_dt
+    s_cc_vel = _gradient(s_cc_dtdlna, npts, dt)
+
+    sigma_top = ((d - s_cc_dtdlna) ** 2).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma_dt = np.sqrt(sigma_top / (s_cc_vel ** 2).sum(axis=1))
+        sigma_dlna = np.sqrt(sigma_top / (s_cc_dt ** 2).sum(axis=1))
+
+    # Errors may not go below the user-defined minimum values
+    sigma_dt = np.where((sigma_dt < dt_sigma_min) | np.isnan(sigma_dt),
+                        dt_sigma_min, sigma_dt)
+    sigma_dlna = np.where((sigma_dlna < dlna_sigma_min) | np.isnan(sigma_dlna),
+                          dlna_sigma_min, sigma_dlna)
+
+    return sigma_dt, sigma_dlna
+
+
+def _gradient(x, npts, dt):
+    """
+    np.gradient() along each row of a zero padded array, with one-sided
+    differences at the last valid sample of each row, and zeros beyond it
+
+    :type x: np.ndarray
+    :param x: 2D array with time series as rows
+    :type npts: np.ndarray
+    :param npts: number of valid samples in each row, at least 2
+    :type dt: float
+    :param dt: sample spacing
+    :rtype: np.ndarray
+    :return: time derivative of each row
+    """
+    rows = np.arange(len(x))
+    grad = np.zeros(x.shape)
+    grad[:, 1:-1] = (x[:, 2:] - x[:, :-2]) / (2 * dt)
+    grad[:, 0] = (x[:, 1] - x[:, 0]) / dt
+    grad[rows, npts - 1] = (x[rows, npts - 1] - x[rows, npts - 2]) / dt
+    grad[np.arange(x.shape[1]) >= npts[:, None]] = 0.
+
+    return grad
+
+
+def _simpson(y, npts, dx):
+    """
+    Simpson's rule integration of each row of a zero padded array over its
+    valid samples, as scipy.integrate.simpson(). Rows are integrated in
+    groups of equal length because padding changes the integration weights.
+
+    :type y: np.ndarray
+    :param y: 2D array with time series as rows
+    :type npts: np.ndarray
+    :param npts: number of valid samples in each row
+    :type dx: float
+    :param dx: sample spacing
+    :rtype: np.ndarray
+    :return: integral of each row
+    """
+    integral = np.empty(len(y))
+    for n in np.unique(npts):
+        rows = npts == n
+        integral[rows] = simpson(y[rows, :n], dx=dx, axis=1)
+
+    return integral
@@ -5,12 +5,37 @@ add new auxiliary data structures to existing ASDF datasets
 """
 import warnings
 import numpy as np
+from pyatoa.utils.asdf.load import clear_window_index
 
 
-def add_misfit_windows(windows, ds, path):
+# Columns of the columnar MisfitWindows layout, one row per window. Times are
+# stored as POSIX timestamps. Phase arrivals are not stored in this layout
+WINDOW_DTYPE = np.dtype([
+    ("channel_id", "S32"), ("left_index", "i8"), ("right_index", "i8"),
+    ("center_index", "i8"), ("dt", "f8"), ("min_period", "f8"),
+    ("time_of_first_sample", "f8"), ("max_cc_value", "f8"),
+    ("cc_shift_in_samples", "i8"), ("cc_shift_in_seconds", "f8"),
+    ("dlnA", "f8"), ("absolute_starttime", "f8"), ("absolute_endtime", "f8"),
+    ("relative_starttime", "f8"), ("relative_endtime", "f8"),
+    ("window_weight", "f8")
+])
+
+# Tag of the single array holding all windows of an iteration/step
+COLUMNAR_WINDOWS_TAG = "windows"
+
+
+def add_misfit_windows(windows, ds, path, columnar=False):
     """
     Write Pyflex misfit windows into the auxiliary data of an ASDFDataSet
 
+    .. note::
+        By default each window is stored as its own auxiliary data object,
+        e.g. MisfitWindows/i01/s00/NZ_BFZ_Z_0. If `columnar` is set, all
+        windows of a station are stored as a single structured array with
+        one row per window, e.g. MisfitWindows/i01/s00/NZ_BFZ, which can later
+        be merged into a single array for the entire iteration/step with
+        `consolidate_misfit_windows`
+
     :type windows: dict of list of pyflex.Window
     :param windows: dictionary of lists of window objects with keys
         corresponding to components related to each window
@@ -18,7 +43,24 @@ def add_misfit_windows(windows, ds, path):
     :param ds: ASDF data set to save windows to
     :type path: str
     :param path: internal pathing to save location of auxiliary data
+    :type columnar: bool
+    :param columnar: store windows as structured arrays rather than one
+        auxiliary data object per window
     """
+    clear_window_index(ds, path)
+    if columnar:
+        array = windows_to_array(windows)
+        codes = {tuple(_.decode().split(".")[:2]) for _ in array["channel_id"]}
+        for net, sta in sorted(codes):
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                ds.add_auxiliary_data(
+                    data=array[_station_mask(array, net, sta)],
+                    data_type="MisfitWindows", parameters={},
+                    path=f"{path}/{net}_{sta}"
+                )
+        return
+
     # Save windows by component
     for comp in windows.keys():
         for i, win in enumerate(windows[comp]):
@@ -50,6 +92,91 @@ def add_misfit_windows(windows, ds, path):
                                       )
 
 
+def windows_to_array(windows):
+    """
+    Convert Pyflex misfit windows into a structured array for the columnar
+    MisfitWindows layout
+
+    :type windows: dict of list of pyflex.Window
+    :param windows: dictionary of lists of window objects with keys
+        corresponding to components related to each window
+    :rtype: np.ndarray
+    :return: structured array with dtype WINDOW_DTYPE, one row per window
+    """
+    rows = []
+    for comp in windows.keys():
+        for win in windows[comp]:
+            rows.append((
+                win.channel_id, win.left, win.right, win.center, win.dt,
+                win.min_period, win.time_of_first_sample.timestamp,
+                win.max_cc_value, win.cc_shift, win.cc_shift_in_seconds,
+                win.dlnA, win.absolute_starttime.timestamp,
+                win.absolute_endtime.timestamp, win.relative_starttime,
+                win.relative_endtime, win.weight
+            ))
+
+    return np.array(rows, dtype=WINDOW_DTYPE)
+
+
+def consolidate_misfit_windows(ds, path):
+    """
+    Merge all columnar MisfitWindows arrays of a given iteration/step, which
+    are written per station, into a single array tagged 'windows', so that
+    the dataset contains one window object per iteration/step. Rows of
+    stations that have been rewritten since the last consolidation replace
+    their previously consolidated rows.
+
+    :type ds: pyasdf.ASDFDataSet
+    :param ds: ASDF data set containing columnar windows
+    :type path: str
+    :param path: internal pathing of the windows, e.g. 'i01/s00'
+    """
+    try:
+        windows = ds.auxiliary_data.MisfitWindows
+        for tag in path.split("/"):
+            windows = windows[tag]
+    except (KeyError, AttributeError):
+        return
+
+    # Default layout tags are NET_STA_COMP_N, columnar tags are NET_STA
+    station_tags = [_ for _ in windows.list() if len(_.split("_")) == 2]
+    if not station_tags:
+        return
+
+    clear_window_index(ds, path)
+    arrays = []
+    if COLUMNAR_WINDOWS_TAG in windows.list():
+        array = windows[COLUMNAR_WINDOWS_TAG].data[()]
+        for tag in station_tags:
+            array = array[~_station_mask(array, *tag.split("_"))]
+        arrays.append(array)
+        del windows[COLUMNAR_WINDOWS_TAG]
+    for tag in station_tags:
+        arrays.append(windows[tag].data[()])
+        del windows[tag]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        ds.add_auxiliary_data(data=np.concatenate(arrays),
+                              data_type="MisfitWindows", parameters={},
+                              path=f"{path}/{COLUMNAR_WINDOWS_TAG}")
+
+
+def _station_mask(array, network, station):
+    """
+    Boolean mask selecting the rows of a columnar window array that belong to
+    a given network and station
+
+    :type array: np.ndarray
+    :param array: structured array with dtype WINDOW_DTYPE
+    :rtype: np.ndarray
+    :return: boolean mask
+    """
+    prefix = f"{network}.{station}.".encode()
+
+    return np.char.startswith(array["channel_id"], prefix)
+
+
 def add_adjoint_sources(adjsrcs, ds, path, time_offset):
     """
     Writes the adjoint source to an ASDF file.
@@ -120,3 +247,27 @@ def add_adjoint_sources(adjsrcs, ds, path, time_offset):
                                   parameters=parameters
                                   )
 
+
+
+def add_phase_arrivals(ttimes, ds, path):
+    """
+    Write theoretical phase arrivals of a source-receiver pair into the
+    auxiliary data of an ASDFDataSet, e.g. PhaseArrivals/ak135/NZ_BFZ, so that
+    subsequent evaluations can skip the TauP calculation
+
+    :type ttimes: list of dict
+    :param ttimes: phase arrivals with keys 'time' and 'name', in the format
+        of pyflex.WindowSelector.ttimes
+    :type ds: pyasdf.ASDFDataSet
+    :param ds: ASDF data set to save phase arrivals to
+    :type path: str
+    :param path: internal pathing to save location of auxiliary data
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        ds.add_auxiliary_data(
+            data=np.array([_["time"] for _ in ttimes], dtype="f8"),
+            data_type="PhaseArrivals",
+            parameters={"phases": ",".join(_["name"] for _ in ttimes)},
+            path=path
+        )
@@ -4,6 +4,7 @@ All functions work with the dataset as an input and act in-place on the
 dataset so no returns
 """
 from pyatoa.utils.form import format_iter, format_step
+from pyatoa.utils.asdf.load import clear_window_index
 
 
 def clean_dataset(ds, iteration=None, step_count=None, fix_windows=False):
@@ -80,7 +81,8 @@ def del_auxiliary_data(ds, iteration=None, step_count=None, retain=None,
     """
     iter_tag = format_iter(iteration)
     step_tag = format_step(step_count)
-    
+    clear_window_index(ds)
+
     for aux in ds.auxiliary_data.list():
         # Check if auxiliary data tag matches optional lists
         if retain and aux in retain:
@@ -1,6 +1,7 @@
 """
 Functions for extracting information from a Pyasdf ASDFDataSet object
 """
+import weakref
 from pyatoa import logger
 from obspy import UTCDateTime
 from fnmatch import filter as fnf
@@ -18,6 +19,10 @@ def load_windows(ds, net, sta, iteration, step_count, return_previous=False):
     search, new step), will try to search the previous step, which may or 
     may not be contained in the previous iteration. 
 
+    Windows are looked up through a WindowIndex that is built once per
+    dataset handle, so that retrieving the windows of each station of an
+    event does not require scanning all windows in the dataset.
+
     Returns windows as Pyflex Window objects which can be used in Pyadjoint or
     in the Pyatoa workflow.
 
@@ -45,26 +50,18 @@ def load_windows(ds, net, sta, iteration, step_count, return_previous=False):
     # Ensure the tags are properly formatted
     iteration = format_iter(iteration)
     step_count = format_step(step_count)
-    windows = ds.auxiliary_data.MisfitWindows
+    index = get_window_index(ds)
 
-    window_dict = {}    
+    window_dict = {}
     if return_previous:
         # Retrieve windows from previous iter/step
-        prev_windows = previous_windows(windows=windows, iteration=iteration,
-                                        step_count=step_count
-                                        )
-        window_dict = dataset_windows_to_pyflex_windows(windows=prev_windows,
-                                                        network=net, station=sta
-                                                        )
-    else:
-        if hasattr(windows, iteration) and \
-                            hasattr(windows[iteration], step_count):
-            # Attempt to retrieve windows from the given iter/step
-            logger.debug(f"searching for windows in {iteration}{step_count}")
-            window_dict = dataset_windows_to_pyflex_windows(
-                windows=windows[iteration][step_count], network=net, 
-                station=sta
-                )
+        iteration, step_count = index.previous(iteration, step_count)
+    logger.debug(f"searching for windows in {iteration}{step_count}")
+    window_list = index.get(iteration, step_count, net, sta)
+    if window_list:
+        window_dict = parameters_to_pyflex_windows(window_list)
+    logger.debug(f"{len(window_list)} window(s) found in dataset for "
+                 f"{net}.{sta}")
 
     return window_dict
 
@@ -117,6 +114,63 @@ def load_adjsrcs(ds, net, sta, iteration, step_count):
     return adjsrc_dict
 
 
+def load_auxiliary_parameters(ds, data_type, tag):
+    """
+    Return the parameters of a single auxiliary data object with a known tag,
+    e.g. a window or adjoint source of a given iteration and step.
+
+    .. note::
+        pyasdf accessors list and sort the entire group on every item access,
+        which makes reading every item of a large group quadratic. Items are
+        instead read with ASDFDataSet._get_auxiliary_data(), which is private
+        API of the pinned pyasdf==0.7.2. If it is not available, the public
+        accessors are used.
+
+    :type ds: pyasdf.ASDFDataSet
+    :param ds: dataset containing the auxiliary data
+    :type data_type: str
+    :param data_type: path to the auxiliary data group,
+        e.g. 'MisfitWindows/i01/s00'
+    :type tag: str
+    :param tag: tag of the auxiliary data object, e.g. 'NZ_BFZ_Z_0'
+    :rtype: dict
+    :return: parameters of the auxiliary data object
+    """
+    if hasattr(ds, "_get_auxiliary_data"):
+        return ds._get_auxiliary_data(data_type, tag).parameters
+
+    group = ds.auxiliary_data
+    for name in data_type.split("/"):
+        group = group[name]
+    return group[tag].parameters
+
+
+def load_phase_arrivals(ds, path):
+    """
+    Returns theoretical phase arrivals previously saved into an ASDFDataSet
+    with `pyatoa.utils.asdf.add.add_phase_arrivals`
+
+    :type ds: pyasdf.ASDFDataSet
+    :param ds: ASDF dataset that may contain a PhaseArrivals subgroup
+    :type path: str
+    :param path: internal pathing to the phase arrivals, e.g. 'ak135/NZ_BFZ'
+    :rtype: list of dict or None
+    :return: phase arrivals with keys 'time' and 'name', in the format of
+        pyflex.WindowSelector.ttimes, or None if none are saved under `path`
+    """
+    try:
+        arrivals = ds.auxiliary_data.PhaseArrivals
+        for tag in path.split("/"):
+            arrivals = arrivals[tag]
+    except (AttributeError, KeyError):
+        return None
+
+    times = arrivals.data[()]
+    names = arrivals.parameters["phases"].split(",")
+
+    return [{"time": float(t), "name": n} for t, n in zip(times, names)]
+
+
 def dataset_windows_to_pyflex_windows(windows, network, station):
     """
     Convert the parameter dictionary of an ASDFDataSet MisfitWindow into a 
@@ -134,42 +188,149 @@ def dataset_windows_to_pyflex_windows(windows, network, station):
     :return: dictionary of window attributes in the same format that Pyflex 
         outputs
     """
-    window_dict, _num_windows = {}, 0
-    for window_name in windows.list():
-        net, sta, comp, n = window_name.split("_")
-
-        # Check the title of the misfit window to see if applicable
-        if (net == network) and (sta == station):
-            par = windows[window_name].parameters
-
-            # Create a Pyflex Window object
-            window = Window(
-                left=par["left_index"], right=par["right_index"],
-                center=par["center_index"], dt=par["dt"],
-                time_of_first_sample=UTCDateTime(par["time_of_first_sample"]),
-                min_period=par["min_period"], channel_id=par["channel_id"]
-            )
-
-            # We cant initiate these parameters so set them after the fact
-            # If data changed, should recalculate with Window._calc_criteria()
-            setattr(window, "dlnA", par["dlnA"])
-            setattr(window, "cc_shift", par["cc_shift_in_samples"])
-            setattr(window, "max_cc_value", par["max_cc_value"])
-
-            # Save windows into the dictionary labelled by component
-            if comp in window_dict.keys():
-                # Either append to existing entry
-                window_dict[comp] += [window]
-            else:
-                # Or create the first entry
-                window_dict[comp] = [window]
-            _num_windows += 1
-
-    logger.debug(f"{_num_windows} window(s) found in dataset for "
+    window_list = window_parameters(windows, network, station)
+    logger.debug(f"{len(window_list)} window(s) found in dataset for "
                  f"{network}.{station}")
+
+    return parameters_to_pyflex_windows(window_list)
+
+
+def parameters_to_pyflex_windows(window_list):
+    """
+    Convert MisfitWindow parameter dictionaries into a dictionary of Pyflex
+    Window objects, in the same format as Manager.windows
+
+    :type window_list: list of tuple
+    :param window_list: list of (window name, parameter dictionary) as
+        returned by `window_parameters`
+    :rtype: dict
+    :return: dictionary of Pyflex Windows keyed by component
+    """
+    window_dict = {}
+    for window_name, par in window_list:
+        comp = window_name.split("_")[2]
+
+        # Create a Pyflex Window object
+        window = Window(
+            left=par["left_index"], right=par["right_index"],
+            center=par["center_index"], dt=par["dt"],
+            time_of_first_sample=UTCDateTime(par["time_of_first_sample"]),
+            min_period=par["min_period"], channel_id=par["channel_id"]
+        )
+
+        # We cant initiate these parameters so set them after the fact
+        # If data changed, should recalculate with Window._calc_criteria()
+        setattr(window, "dlnA", par["dlnA"])
+        setattr(window, "cc_shift", par["cc_shift_in_samples"])
+        setattr(window, "max_cc_value", par["max_cc_value"])
+
+        # Save windows into the dictionary labelled by component
+        if comp in window_dict.keys():
+            # Either append to existing entry
+            window_dict[comp] += [window]
+        else:
+            # Or create the first entry
+            window_dict[comp] = [window]
+
     return window_dict
 
 
+def window_parameters(windows, network=None, station=None):
+    """
+    Return the parameter dictionaries of all MisfitWindows of a given
+    iteration and step, optionally for a single network/station. Handles both
+    the default layout (one auxiliary data object per window) and the
+    columnar layout (structured arrays with one row per window, see
+    `pyatoa.utils.asdf.add.add_misfit_windows`), returning parameters of the
+    columnar layout in the format of the default layout, i.e. with times as
+    str. Columnar windows do not contain phase arrivals.
+
+    :type windows: pyasdf.utils.AuxiliaryDataAccessor
+    :param windows: ds.auxiliary_data.MisfitWindows[iter][step]
+    :type network: str
+    :param network: only return windows for this network
+    :type station: str
+    :param station: only return windows for this station
+    :rtype: list of tuple
+    :return: list of (window name, parameter dictionary), with window names
+        following the default layout, e.g. NZ_BFZ_Z_0
+    """
+    window_list = []
+    for records in _group_windows(windows, network, station).values():
+        window_list += _resolve_records(windows, records)
+
+    return window_list
+
+
+def _group_windows(windows, network=None, station=None):
+    """
+    Group the MisfitWindows of a given iteration and step by station.
+    Parameters of the default layout are not read until they are needed (see
+    `_resolve_records`), so that grouping only requires parsing window names,
+    whereas columnar arrays are read and converted to parameters directly.
+
+    :type windows: pyasdf.utils.AuxiliaryDataAccessor
+    :param windows: ds.auxiliary_data.MisfitWindows[iter][step]
+    :type network: str
+    :param network: only return windows for this network
+    :type station: str
+    :param station: only return windows for this station
+    :rtype: dict
+    :return: {(net, sta): [[window name, parameters or None], ...]}
+    """
+    stations, counts = {}, {}
+    for tag in windows.list():
+        parts = tag.split("_")
+        if len(parts) == 4:
+            # Default layout, one window per auxiliary data object
+            if (network is not None and parts[0] != network) or \
+                    (station is not None and parts[1] != station):
+                continue
+            stations.setdefault(tuple(parts[:2]), []).append([tag, None])
+            continue
+        # Columnar layout, per station arrays are tagged NET_STA
+        if len(parts) == 2 and (
+                (network is not None and parts[0] != network) or
+                (station is not None and parts[1] != station)):
+            continue
+        array = windows[tag].data[()]
+        for row in array:
+            par = {name: row[name].item() for name in array.dtype.names}
+            par["channel_id"] = par["channel_id"].decode()
+            net, sta, loc, cha = par["channel_id"].split(".")
+            if (network is not None and net != network) or \
+                    (station is not None and sta != station):
+                continue
+            for key in ["time_of_first_sample", "absolute_starttime",
+                        "absolute_endtime"]:
+                par[key] = str(UTCDateTime(par[key]))
+            key = f"{net}_{sta}_{cha[-1]}"
+            counts[key] = counts.get(key, -1) + 1
+            stations.setdefault((net, sta), []).append(
+                [f"{key}_{counts[key]}", par])
+
+    return stations
+
+
+def _resolve_records(windows, records):
+    """
+    Read the parameters of grouped window records that have not been read
+    yet, in place, and return them as (window name, parameters) tuples
+
+    :type windows: pyasdf.utils.AuxiliaryDataAccessor
+    :param windows: ds.auxiliary_data.MisfitWindows[iter][step]
+    :type records: list of list
+    :param records: [window name, parameters or None] from `_group_windows`
+    :rtype: list of tuple
+    :return: list of (window name, parameter dictionary)
+    """
+    for record in records:
+        if record[1] is None:
+            record[1] = windows[record[0]].parameters
+
+    return [tuple(record) for record in records]
+
+
 def previous_windows(windows, iteration, step_count):
     """
     Given an iteration and step count, find windows from the previous step
@@ -201,6 +362,31 @@ def previous_windows(windows, iteration, step_count):
         for s_ in s:
             iters.append((int(i[1:]), int(s_[1:])))
 
+    prev_iter, prev_step = _previous_step(iters, iteration, step_count)
+
+    return windows[prev_iter][prev_step]
+
+
+def _previous_step(iters, iteration, step_count):
+    """
+    Find the iteration and step that precede a given iteration and step
+
+    :type iters: list of tuple
+    :param iters: (iteration, step_count) integers available in the dataset,
+        in the order they were written
+    :type iteration: int or str
+    :param iteration: the current iteration
+    :type step_count: int or str
+    :param step_count: the current step count
+    :rtype: tuple of str
+    :return: formatted previous iteration and step count, e.g. ('i01', 's00')
+    """
+    # Ensure we're working with integer values for indexing, e.g. 's00' -> 0
+    if isinstance(iteration, str):
+        iteration = int(iteration[1:])
+    if isinstance(step_count, str):
+        step_count = int(step_count[1:])
+
     current = (iteration, step_count)
     if current in iters:
         # If windows have already been added to the auxiliary data
@@ -222,4 +408,156 @@ def previous_windows(windows, iteration, step_count):
 
     logger.debug(f"most recent windows: {prev_iter}{prev_step}")
 
-    return windows[prev_iter][prev_step]
+    return prev_iter, prev_step
+
+
+class WindowIndex:
+    """
+    An index of the MisfitWindows of a dataset mapping (iteration, step,
+    network, station) to window parameters. Each iteration/step is indexed
+    the first time it is queried, so that the windows of a single station can
+    be retrieved without scanning all windows in the dataset. Indices are
+    attached to a dataset handle with `get_window_index` and must be
+    invalidated with `clear_window_index` whenever windows are written.
+    """
+    def __init__(self, ds):
+        """
+        :type ds: pyasdf.ASDFDataSet
+        :param ds: dataset containing MisfitWindows auxiliary data
+        """
+        self.ds = ds
+        self.stations = {}
+        self._steps = None
+
+    @property
+    def windows(self):
+        """Accessor for the MisfitWindows, which may not exist yet"""
+        return self.ds.auxiliary_data.MisfitWindows
+
+    @property
+    def steps(self):
+        """
+        Available (iteration, step) integers in the order they were written
+
+        :rtype: list of tuple
+        :return: e.g. [(1, 0), (1, 1), (2, 0)]
+        """
+        if self._steps is None:
+            self._steps = []
+            if "MisfitWindows" in self.ds.auxiliary_data.list():
+                for i in self.windows.list():
+                    for s in self.windows[i].list():
+                        # Skip windows not saved by iteration/step
+                        try:
+                            self._steps.append((int(i[1:]), int(s[1:])))
+                        except ValueError:
+                            continue
+        return self._steps
+
+    def previous(self, iteration, step_count):
+        """
+        Formatted iteration and step count that precede the given ones, see
+        `previous_windows`
+
+        :type iteration: int or str
+        :param iteration: the current iteration
+        :type step_count: int or str
+        :param step_count: the current step count
+        :rtype: tuple of str
+        :return: previous iteration and step count, e.g. ('i01', 's00')
+        """
+        return _previous_step(self.steps, iteration, step_count)
+
+    def get(self, iteration, step_count, network=None, station=None):
+        """
+        Return the windows of a single station for a given iteration/step, or
+        all windows of the iteration/step if no station is given
+
+        :type iteration: int or str
+        :param iteration: iteration, will be formatted by the function
+        :type step_count: int or str
+        :param step_count: step count, will be formatted by the function
+        :type network: str
+        :param network: network code
+        :type station: str
+        :param station: station code
+        :rtype: list of tuple
+        :return: list of (window name, parameter dictionary), empty if no
+            windows are found
+        """
+        key = (format_iter(iteration), format_step(step_count))
+        if key not in self.stations:
+            if (int(key[0][1:]), int(key[1][1:])) in self.steps:
+                self.stations[key] = _group_windows(
+                    self.windows[key[0]][key[1]])
+            else:
+                self.stations[key] = {}
+
+        if network is None and station is None:
+            records = [record for records in self.stations[key].values()
+                       for record in records]
+        else:
+            records = self.stations[key].get((network, station), [])
+        if not records:
+            return []
+
+        data_type = f"MisfitWindows/{key[0]}/{key[1]}"
+        for record in records:
+            if record[1] is None:
+                record[1] = load_auxiliary_parameters(self.ds, data_type,
+                                                      record[0])
+
+        return [tuple(record) for record in records]
+
+    def clear(self, path=None):
+        """
+        Invalidate the index, e.g. after windows have been written
+
+        :type path: str
+        :param path: only invalidate a given iteration/step, e.g. 'i01/s00'.
+            If None, the entire index is invalidated
+        """
+        self._steps = None
+        if path is None:
+            self.stations = {}
+        else:
+            self.stations.pop(tuple(path.split("/")[:2]), None)
+
+
+# Window indices of open dataset handles, keyed by the id of the handle
+_WINDOW_INDICES = {}
+
+
+def get_window_index(ds):
+    """
+    Return the WindowIndex attached to a dataset handle, creating it if
+    necessary. Indices are dropped when their handle is garbage collected.
+
+    :type ds: pyasdf.ASDFDataSet
+    :param ds: dataset containing MisfitWindows auxiliary data
+    :rtype: pyatoa.utils.asdf.load.WindowIndex
+    :return: window index for this dataset handle
+    """
+    key = id(ds)
+    if key in _WINDOW_INDICES and _WINDOW_INDICES[key][0]() is ds:
+        return _WINDOW_INDICES[key][1]
+
+    # Weak references so that the index does not keep the handle alive
+    ref = weakref.ref(ds, lambda _, key=key: _WINDOW_INDICES.pop(key, None))
+    _WINDOW_INDICES[key] = (ref, WindowIndex(weakref.proxy(ds)))
+
+    return _WINDOW_INDICES[key][1]
+
+
+def clear_window_index(ds, path=None):
+    """
+    Invalidate the WindowIndex of a dataset handle, must be called whenever
+    MisfitWindows are written or deleted
+
+    :type ds: pyasdf.ASDFDataSet
+    :param ds: dataset whose index should be invalidated
+    :type path: str
+    :param path: only invalidate a given iteration/step, e.g. 'i01/s00'
+    """
+    if id(ds) in _WINDOW_INDICES:
+        _WINDOW_INDICES[id(ds)][1].clear(path)
@@ -7,6 +7,7 @@ import os
 import json
 import numpy as np
 from pyatoa.utils.form import format_event_name
+from pyatoa.utils.asdf.load import window_parameters
 from pyatoa.utils.write import write_adj_src_to_ascii
 
 
@@ -103,9 +104,7 @@ def write_windows(ds, path="./"):
     windows = ds.auxiliary_data.MisfitWindows
     for model in windows.list():
         for step in windows[model].list():
-            window_dict = {}
-            for win in windows[model][step].list():
-                window_dict[win] = windows[model][step][win].parameters
+            window_dict = dict(window_parameters(windows[model][step]))
             with open(os.path.join(path, 
                       f"windows_{model}{step}.json"), "w") as f:
                 json.dump(window_dict, f, cls=WindowEncoder, indent=4, 
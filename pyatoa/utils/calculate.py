@@ -2,6 +2,7 @@
 Custom math functions for faster calculations in other parts of Pyatoa
 """
 import numpy as np
+from scipy.fft import rfft, irfft, next_fast_len
 
 
 def abs_max(array):
@@ -128,3 +129,34 @@ def vrl(d, s1, s2):
     return np.log(np.trapz((d - s1) ** 2) / (np.trapz(d - s2) ** 2))
 
 
+
+
+def xcorr(a, b, npts=None):
+    """
+    Cross correlate each row of `a` with the same row of `b` in the frequency
+    domain. Equivalent to np.correlate(a, b, mode="full") for each row, but
+    all rows are correlated at once. Rows may be zero padded to a common
+    length, in which case lags beyond the length of each row are set to -inf
+    so that they are never picked as the maximum.
+
+    :type a: np.ndarray
+    :param a: 2D array, one row per time series
+    :type b: np.ndarray
+    :param b: 2D array, same shape as `a`
+    :type npts: np.ndarray
+    :param npts: number of valid samples in each row, if None all samples
+        are valid
+    :rtype: tuple of np.ndarray
+    :return: cross correlation of each row for lags -(n - 1) to (n - 1), and
+        the lags in samples, where n is the number of columns
+    """
+    nmax = a.shape[1]
+    nfft = next_fast_len(2 * nmax - 1, real=True)
+    cc = irfft(rfft(a, nfft, axis=1) * np.conj(rfft(b, nfft, axis=1)), nfft,
+               axis=1)
+    cc = np.concatenate([cc[:, nfft - nmax + 1:], cc[:, :nmax]], axis=1)
+    lags = np.arange(-nmax + 1, nmax)
+    if npts is not None:
+        cc[np.abs(lags) >= np.asarray(npts)[:, None]] = -np.inf
+
+    return cc, lags
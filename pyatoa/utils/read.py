@@ -4,6 +4,8 @@ These are meant to be standalone functions so they may repeat some functionality
 found elsewhere in the package.
 """
 import os
+import re
+import glob
 import numpy as np
 from obspy import Stream, Trace, UTCDateTime, Inventory
 from obspy.core.inventory.network import Network
@@ -61,30 +63,15 @@ def read_sem(path, origintime=None, location='', precision=4):
     """
     # This was tested up to SPECFEM3D Cartesian git version 6895e2f7
     try:
-        times = np.loadtxt(fname=path, usecols=0)
-        data = np.loadtxt(fname=path, usecols=1)
+        times, data = np.loadtxt(fname=path, unpack=True)
 
     # At some point in 2018, the Specfem developers changed how the ascii files
     # were formatted from two columns to comma separated values, and repeat
     # values represented as 2*value_float where value_float represents the data
     # value as a float
     except ValueError:
-        times, data = [], []
-        with open(path, 'r') as f:
-            lines = f.readlines()
-        for line in lines:
-            try:
-                time_, data_ = line.strip().split(',')
-            except ValueError:
-                if "*" in line:
-                    time_ = data_ = line.split('*')[-1]
-                else:
-                    raise ValueError
-            times.append(float(time_))
-            data.append(float(data_))
-
-        times = np.array(times)
-        data = np.array(data)
+        with open(path, "r") as f:
+            times, data = parse_sem_ascii(f.read())
 
     if origintime is None:
         print("No origintime given, setting to default 1970-01-01T00:00:00")
@@ -108,6 +95,270 @@ def read_sem(path, origintime=None, location='', precision=4):
     return st
 
 
+def parse_sem_ascii(text):
+    """
+    Parse the contents of a Specfem ASCII seismogram in a single pass.
+    Handles whitespace- or comma-separated columns, as well as Fortran
+    list-directed repeat values, e.g. '2*0.0000' which represents the same
+    value for both the time and data columns.
+
+    :type text: str
+    :param text: full contents of a .sem? file
+    :rtype: tuple of np.array
+    :return: (times, data) arrays
+    :raises ValueError: if the text cannot be parsed into two columns
+    """
+    text = text.replace(",", " ")
+    if "*" in text:
+        text = re.sub(r"(\d+)\*(\S+)",
+                      lambda m: " ".join([m.group(2)] * int(m.group(1))), text)
+    values = np.array(text.split(), dtype=float)
+    if values.size % 2:
+        raise ValueError("could not parse Specfem ASCII file into two columns")
+
+    return values[0::2], values[1::2]
+
+
+def read_sem_dir(path, origintime=None, location='', precision=4,
+                 fid_template="*.sem?"):
+    """
+    Read all Specfem3D ASCII seismograms in a directory, e.g. OUTPUT_FILES,
+    into a single Stream in one call.
+
+    :type path: str
+    :param path: directory containing .sem? files
+    :type origintime: obspy.UTCDateTime
+    :param origintime: UTCDatetime object for the origintime of the event
+    :type location: str
+    :param location: location value given to all traces
+    :type precision: int
+    :param precision: decimal precision used to determine sampling interval
+    :type fid_template: str
+    :param fid_template: glob pattern to select seismogram files within `path`
+    :rtype: obspy.core.stream.Stream
+    :return: stream containing all seismograms, one trace per file
+    """
+    if origintime is None:
+        print("No origintime given, setting to default 1970-01-01T00:00:00")
+        origintime = UTCDateTime("1970-01-01T00:00:00")
+
+    st = Stream()
+    for fid in sorted(glob.glob(os.path.join(path, fid_template))):
+        st += read_sem(fid, origintime=origintime, location=location,
+                       precision=precision)
+
+    return st
+
+
+# Trace header fields used from the 240 byte Seismic Unix (SEG-Y) trace header
+# that Specfem3D writes for each receiver (native byte order): receiver index,
+# recording delay [ms], number of samples and sampling interval [us]
+SU_HEADER_DTYPE = np.dtype({"names": ["tracl", "delrt", "ns", "dt"],
+                            "formats": ["i4", "i2", "u2", "u2"],
+                            "offsets": [0, 108, 114, 116],
+                            "itemsize": 240})
+
+# Specfem component naming conventions, Cartesian x/y/z map to E/N/Z
+SPECFEM_COMPONENTS = {"x": "E", "y": "N", "z": "Z"}
+
+
+def read_stations_file(path_to_stations):
+    """
+    Read the network and station names from a Specfem STATIONS file, in the
+    order that Specfem assigns receiver indices.
+
+    :type path_to_stations: str
+    :param path_to_stations: path to the STATIONS file
+    :rtype: list of tuple
+    :return: list of (network, station) tuples
+    """
+    stations = np.loadtxt(path_to_stations, dtype="str", ndmin=2)
+
+    return [(sta[1], sta[0]) for sta in stations]
+
+
+def _traces_to_stream(data, receivers, component, unit, delta, origintime,
+                      time_offset=0., location="", band_code="BX",
+                      network=None, station=None):
+    """
+    Build a Stream from rows of a (possibly memory-mapped) data array, with
+    header information matching that produced by `read_sem`. Only rows
+    matching `network` and `station`, if given, are copied out of the array.
+
+    :type data: np.ndarray
+    :param data: 2D array with one row per receiver
+    :type receivers: list of tuple
+    :param receivers: (network, station) for each row of `data`
+    :rtype: obspy.core.stream.Stream
+    :return: stream with one trace per selected receiver
+    """
+    st = Stream()
+    for row, (net, sta) in enumerate(receivers):
+        if (network is not None and net != network) or \
+                (station is not None and sta != station):
+            continue
+        stats = {"network": net, "station": sta, "location": location,
+                 "channel": f"{band_code}{component}",
+                 "starttime": origintime + time_offset,
+                 "npts": data.shape[1], "delta": delta,
+                 "mseed": {"dataquality": 'D'}, "time_offset": time_offset,
+                 "format": f"sem{unit}"
+                 }
+        st.append(Trace(data=np.array(data[row], dtype=np.float64),
+                        header=stats))
+
+    return st
+
+
+def _memmap_su(path):
+    """
+    Memory map a Specfem Seismic Unix file as a structured array with fields
+    'header' and 'data'. Assumes all traces have the same number of samples.
+
+    :type path: str
+    :param path: path to the SU file
+    :rtype: np.memmap
+    :return: one record per trace
+    """
+    npts = int(np.fromfile(path, dtype=SU_HEADER_DTYPE, count=1)[0]["ns"])
+
+    return np.memmap(path, mode="r", dtype=np.dtype(
+        [("header", SU_HEADER_DTYPE), ("data", "f4", (npts,))]))
+
+
+def read_su_receivers(path, stations):
+    """
+    Return the (network, station) of each trace in a Specfem Seismic Unix file
+    by reading only the receiver index of each trace header.
+
+    :type path: str
+    :param path: path to the SU file
+    :type stations: list of tuple or str
+    :param stations: path to the STATIONS file used in the simulation, or the
+        output of `read_stations_file`
+    :rtype: list of tuple
+    :return: (network, station) of each trace in the file
+    """
+    if isinstance(stations, str):
+        stations = read_stations_file(stations)
+
+    return [stations[i - 1] for i in _memmap_su(path)["header"]["tracl"]]
+
+
+def read_specfem_su(path, stations, origintime=None, time_offset=None,
+                    location='', band_code="BX", precision=6, network=None,
+                    station=None):
+    """
+    Read a Seismic Unix seismogram file written by Specfem3D (SU_FORMAT), one
+    file per processor and component, e.g. OUTPUT_FILES/0_dz_SU, using a
+    memory map so that only the requested traces are read from disk.
+
+    Traces are matched to stations using the receiver index stored in each
+    trace header (tracl), which refers to the line number of the STATIONS file.
+
+    :type path: str
+    :param path: path to the SU file, expected to be named
+        {iproc}_{unit}{component}_SU, e.g. '0_dx_SU'
+    :type stations: list of tuple or str
+    :param stations: path to the STATIONS file used in the simulation, or the
+        output of `read_stations_file`
+    :type origintime: obspy.UTCDateTime
+    :param origintime: UTCDatetime object for the origintime of the event
+    :type time_offset: float
+    :param time_offset: time of the first sample relative to the origin time,
+        in seconds. If None, taken from the recording delay in the trace header
+    :type location: str
+    :param location: location value for all traces
+    :type band_code: str
+    :param band_code: first two letters of the channel code
+    :type precision: int
+    :param precision: decimal precision of the sampling interval in seconds
+    :type network: str
+    :param network: only return traces for this network
+    :type station: str
+    :param station: only return traces for this station
+    :rtype: obspy.core.stream.Stream
+    :return: stream containing header and data info taken from the SU file
+    """
+    if isinstance(stations, str):
+        stations = read_stations_file(stations)
+
+    unit, component = re.search(r"_(\w)(\w)_SU$",
+                                os.path.basename(path)).groups()
+
+    traces = _memmap_su(path)
+    header = traces["header"][0]
+    receivers = [stations[i - 1] for i in traces["header"]["tracl"]]
+    delta = round(float(header["dt"]) * 1E-6, precision)
+    if time_offset is None:
+        time_offset = float(header["delrt"]) * 1E-3
+    if origintime is None:
+        origintime = UTCDateTime("1970-01-01T00:00:00")
+
+    return _traces_to_stream(data=traces["data"], receivers=receivers,
+                             component=SPECFEM_COMPONENTS.get(component,
+                                                              component),
+                             unit=unit, delta=delta,
+                             origintime=origintime, time_offset=time_offset,
+                             location=location, band_code=band_code,
+                             network=network, station=station)
+
+
+def read_specfem_binary(path, stations, delta, origintime=None,
+                        time_offset=0., location='', band_code="BX",
+                        network=None, station=None):
+    """
+    Read a binary seismogram file written by Specfem2D
+    (save_binary_seismograms_single/double), e.g.
+    OUTPUT_FILES/Uz_file_single_d.bin, using a memory map. These files
+    contain no header, only the seismograms of all receivers, one after
+    another in the order of the STATIONS file.
+
+    :type path: str
+    :param path: path to the binary file, expected to be named
+        U{component}_file_{single|double}_{unit}.bin
+    :type stations: list of tuple or str
+    :param stations: path to the STATIONS file used in the simulation, or the
+        output of `read_stations_file`
+    :type delta: float
+    :param delta: sampling interval of the seismograms in seconds
+    :type origintime: obspy.UTCDateTime
+    :param origintime: UTCDatetime object for the origintime of the event
+    :type time_offset: float
+    :param time_offset: time of the first sample relative to the origin time,
+        in seconds, i.e. Specfem's negative t0
+    :type location: str
+    :param location: location value for all traces
+    :type band_code: str
+    :param band_code: first two letters of the channel code
+    :type network: str
+    :param network: only return traces for this network
+    :type station: str
+    :param station: only return traces for this station
+    :rtype: obspy.core.stream.Stream
+    :return: stream containing header and data info taken from the file
+    """
+    if isinstance(stations, str):
+        stations = read_stations_file(stations)
+
+    component, precision, unit = re.search(
+        r"U(\w)_file_(single|double)_(\w)\.bin$", os.path.basename(path)
+    ).groups()
+    dtype = {"single": "f4", "double": "f8"}[precision]
+
+    data = np.memmap(path, mode="r", dtype=dtype).reshape(len(stations), -1)
+    if origintime is None:
+        origintime = UTCDateTime("1970-01-01T00:00:00")
+
+    return _traces_to_stream(data=data, receivers=stations,
+                             component=SPECFEM_COMPONENTS.get(component,
+                                                              component),
+                             unit=unit, delta=delta,
+                             origintime=origintime, time_offset=time_offset,
+                             location=location, band_code=band_code,
+                             network=network, station=station)
+
+
 def read_stations(path_to_stations):
     """
     Convert a Specfem3D STATIONS file into an ObsPy Inventory object.
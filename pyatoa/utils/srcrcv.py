@@ -5,9 +5,19 @@ or their corresponding representations in ObsPy
 import warnings
 import numpy as np
 from obspy.geodetics import gps2dist_azimuth
+from obspy.geodetics.base import WGS84_A, WGS84_F
 from obspy.core.event.source import Tensor
 
 
+# Mean radius of the Earth in km, used for spherical distances
+EARTH_RADIUS_KM = 6371.0
+
+# Vincenty's inverse formula, iterations and relative change in longitude on
+# the auxiliary sphere at which a source-receiver pair is considered converged
+VINCENTY_MAX_ITER = 100
+VINCENTY_TOL = 1E-9
+
+
 def seismic_moment(mt):
     """
     Return the seismic moment based on a moment tensor.
@@ -176,12 +186,140 @@ def gcd_and_baz(event, sta):
     :rtype: tuple (float, float)
     :return: (great circle distance in km, backazimuth in degrees)
     """
-    gcdist, _, baz = gps2dist_azimuth(lat1=event.preferred_origin().latitude,
-                                      lon1=event.preferred_origin().longitude,
-                                      lat2=sta.latitude,
-                                      lon2=sta.longitude
-                                      )
-    return gcdist * 1E-3, baz
+    gcdist, baz = gcd_and_baz_array(
+        src_lat=event.preferred_origin().latitude,
+        src_lon=event.preferred_origin().longitude,
+        rcv_lat=sta.latitude, rcv_lon=sta.longitude
+    )
+    return float(gcdist), float(baz)
+
+
+def gcd_and_baz_array(src_lat, src_lon, rcv_lat, rcv_lon, spherical=False):
+    """
+    Vectorized great circle distance and backazimuth for many source-receiver
+    pairs at once. Coordinate arrays are broadcast against one another, so
+    e.g. source coordinates of shape (N, 1) and receiver coordinates of
+    shape (M,) return the (N, M) distances and backazimuths of all pairs.
+
+    Distances are calculated on the WGS84 ellipsoid with Vincenty's inverse
+    formula, as done by ObsPy's `gps2dist_azimuth`, iterating on all pairs
+    at once. Pairs that do not converge (nearly antipodal points) are passed
+    to `gps2dist_azimuth` individually.
+
+    :type src_lat: float or np.array
+    :param src_lat: source latitude(s) in degrees
+    :type src_lon: float or np.array
+    :param src_lon: source longitude(s) in degrees
+    :type rcv_lat: float or np.array
+    :param rcv_lat: receiver latitude(s) in degrees
+    :type rcv_lon: float or np.array
+    :param rcv_lon: receiver longitude(s) in degrees
+    :type spherical: bool
+    :param spherical: calculate distances and backazimuths on a sphere with
+        radius `EARTH_RADIUS_KM`, which is faster but differs from ellipsoidal
+        distances by up to ~0.5%
+    :rtype: tuple (np.array, np.array)
+    :return: (great circle distance in km, backazimuth in degrees)
+    """
+    src_lat, src_lon, rcv_lat, rcv_lon = np.broadcast_arrays(
+        *[np.asarray(_, dtype=float) for _ in
+          [src_lat, src_lon, rcv_lat, rcv_lon]]
+    )
+    # Work on flattened arrays and return in the broadcast shape
+    shape = src_lat.shape
+    src_lat, src_lon, rcv_lat, rcv_lon = (
+        _.ravel() for _ in [src_lat, src_lon, rcv_lat, rcv_lon])
+    lat1, lon1, lat2, lon2 = (np.radians(_) for _ in
+                              [src_lat, src_lon, rcv_lat, rcv_lon])
+    # Difference in longitude wrapped to [-pi, pi)
+    omega = (lon2 - lon1 + np.pi) % (2 * np.pi) - np.pi
+
+    if spherical:
+        hav = (np.sin((lat2 - lat1) / 2) ** 2 +
+               np.cos(lat1) * np.cos(lat2) * np.sin(omega / 2) ** 2)
+        gcdist = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(hav, 0, 1)))
+        baz = np.arctan2(-np.sin(omega) * np.cos(lat1),
+                         np.cos(lat2) * np.sin(lat1) -
+                         np.sin(lat2) * np.cos(lat1) * np.cos(omega))
+        return gcdist.reshape(shape), (np.degrees(baz) % 360).reshape(shape)
+
+    b = WGS84_A * (1 - WGS84_F)
+    u1 = np.arctan((1 - WGS84_F) * np.tan(lat1))
+    u2 = np.arctan((1 - WGS84_F) * np.tan(lat2))
+    sin_u1, cos_u1, sin_u2, cos_u2 = (np.sin(u1), np.cos(u1), np.sin(u2),
+                                      np.cos(u2))
+
+    def vincenty_terms(dlon, i=slice(None)):
+        """Terms of Vincenty's formula for longitude differences of pairs i"""
+        sqr_sin_sigma = ((cos_u2[i] * np.sin(dlon)) ** 2 +
+                         (cos_u1[i] * sin_u2[i] -
+                          sin_u1[i] * cos_u2[i] * np.cos(dlon)) ** 2)
+        sin_sigma = np.sqrt(sqr_sin_sigma)
+        cos_sigma = sin_u1[i] * sin_u2[i] + cos_u1[i] * cos_u2[i] * np.cos(dlon)
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+        sin_alpha = cos_u1[i] * cos_u2[i] * np.sin(dlon) / sin_sigma
+        sqr_cos_alpha = 1 - sin_alpha ** 2
+        # Equatorial lines have no midpoint term
+        cos2sigma_m = np.where(
+            np.isclose(sqr_cos_alpha, 0), 0,
+            cos_sigma - 2 * sin_u1[i] * sin_u2[i] / sqr_cos_alpha
+        )
+        return (sqr_sin_sigma, sin_sigma, cos_sigma, sigma, sin_alpha,
+                sqr_cos_alpha, cos2sigma_m)
+
+    # Only pairs that have not converged are iterated on
+    dlon = omega.copy()
+    converged = np.zeros(omega.shape, dtype=bool)
+    active = np.arange(omega.size)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for _ in range(VINCENTY_MAX_ITER):
+            (_, sin_sigma, cos_sigma, sigma, sin_alpha, sqr_cos_alpha,
+             cos2sigma_m) = vincenty_terms(dlon[active], active)
+            c = WGS84_F / 16 * sqr_cos_alpha * (
+                    4 + WGS84_F * (4 - 3 * sqr_cos_alpha))
+            dlon_new = omega[active] + (1 - c) * WGS84_F * sin_alpha * (
+                sigma + c * sin_sigma * (
+                    cos2sigma_m + c * cos_sigma * (-1 + 2 * cos2sigma_m ** 2))
+            )
+            done = (dlon_new == 0) | (np.abs(
+                (dlon_new - dlon[active]) / dlon_new) <= VINCENTY_TOL)
+            dlon[active] = dlon_new
+            converged[active] = done
+            active = active[~done & np.isfinite(dlon_new)]
+            if not active.size:
+                break
+
+        (sqr_sin_sigma, sin_sigma, cos_sigma, sigma, _, sqr_cos_alpha,
+         cos2sigma_m) = vincenty_terms(dlon)
+        u_sqr = sqr_cos_alpha * (WGS84_A ** 2 - b ** 2) / b ** 2
+        a_ = 1 + u_sqr / 16384 * (
+                4096 + u_sqr * (-768 + u_sqr * (320 - 175 * u_sqr)))
+        b_ = u_sqr / 1024 * (256 + u_sqr * (-128 + u_sqr * (74 - 47 * u_sqr)))
+        delta_sigma = b_ * sin_sigma * (
+            cos2sigma_m + b_ / 4 * (
+                cos_sigma * (-1 + 2 * cos2sigma_m ** 2) -
+                b_ / 6 * cos2sigma_m * (-3 + 4 * sqr_sin_sigma) *
+                (-3 + 4 * cos2sigma_m ** 2))
+        )
+        gcdist = b * a_ * (sigma - delta_sigma) * 1E-3
+        baz = np.degrees(np.arctan2(
+            cos_u1 * np.sin(dlon),
+            -sin_u1 * cos_u2 + cos_u1 * sin_u2 * np.cos(dlon)) + np.pi) % 360
+
+    # Coincident points have no defined direction
+    coincident = np.isclose(src_lat, rcv_lat) & np.isclose(
+        (src_lon - rcv_lon + 180) % 360 - 180, 0)
+    gcdist[coincident] = 0.
+    baz[coincident] = 0.
+
+    unstable = ~(converged & np.isfinite(gcdist) & np.isfinite(baz))
+    unstable &= ~coincident
+    for i in np.flatnonzero(unstable):
+        dist_m, _, baz[i] = gps2dist_azimuth(lat1=src_lat[i], lon1=src_lon[i],
+                                             lat2=rcv_lat[i], lon2=rcv_lon[i])
+        gcdist[i] = dist_m * 1E-3
+
+    return gcdist.reshape(shape), baz.reshape(shape)
 
 
 def merge_inventories(inv_a, inv_b):
@@ -276,8 +414,8 @@ def sort_by_backazimuth(ds, clockwise=True):
     :rtype: list
     :return: list of stations in order from 0deg to 360deg in direction
     """
-    station_names, list_of_baz = [], []
-    event = ds.events[0]
+    station_names, latitudes, longitudes = [], [], []
+    origin = ds.events[0].preferred_origin()
     for sta_name in ds.waveforms.list():
         try:
             sta = ds.waveforms[sta_name].StationXML[0][0]
@@ -286,11 +424,15 @@ def sort_by_backazimuth(ds, clockwise=True):
                           UserWarning)
             continue
         station_names.append(sta_name)
-
-        _, baz = gcd_and_baz(event, sta)
-        list_of_baz.append(baz)
-
-    list_of_baz, station_names = zip(*sorted(zip(list_of_baz, station_names)))
+        latitudes.append(sta.latitude)
+        longitudes.append(sta.longitude)
+
+    _, list_of_baz = gcd_and_baz_array(src_lat=origin.latitude,
+                                       src_lon=origin.longitude,
+                                       rcv_lat=latitudes, rcv_lon=longitudes)
+    # Sort by backazimuth, then by name for matching backazimuths
+    station_names = [station_names[i] for i in
+                     np.lexsort((station_names, list_of_baz))]
 
     if not clockwise:
         station_names.reverse()
@@ -6,10 +6,24 @@ Pyflex source code.
 
 Functions should work in place on a Manager class to avoid having to pass in
 all the different arguments from the Manager.
+
+Phase arrivals used by Pyflex to reject windows are cached, as the
+source-receiver geometry does not change during an inversion.
 """
+import copy
+import pyflex
 import numpy as np
+from collections import OrderedDict
+from obspy.taup import TauPyModel
+from obspy.geodetics import locations2degrees
 from pyatoa import logger
-from pyatoa.utils.calculate import abs_max
+from pyatoa.utils.calculate import abs_max, xcorr
+
+
+# Number of source depth and distance pairs whose phase arrivals are kept
+PHASE_ARRIVAL_CACHE_SIZE = 1024
+_PHASE_ARRIVAL_CACHE = OrderedDict()
+_TAUP_MODELS = {}
 
 
 def zero_pad_then_window(ws, pad_by_fraction_of_npts=.2):
@@ -126,3 +140,181 @@ def reject_on_global_amplitude_ratio(data, windows, ratio=0.2):
                 )
 
     return accepted_windows, rejected_windows
+
+
+def window_criteria(obs, syn, left, right, index=None):
+    """
+    Vectorized version of pyflex.Window._calc_criteria(), calculating the
+    maximum normalized cross correlation, cross correlation time shift and
+    amplitude anomaly of many windows at once. Window segments are zero padded
+    to a common length and cross correlated in the frequency domain.
+
+    .. note::
+        Values match Pyflex to floating point precision, the time shift is
+        given in samples, as Window.cc_shift
+
+    :type obs: np.ndarray
+    :param obs: observed data, 1D, or 2D with one row per component
+    :type syn: np.ndarray
+    :param syn: synthetic data, same shape as `obs`
+    :type left: np.ndarray
+    :param left: left sample index of each window
+    :type right: np.ndarray
+    :param right: right sample index of each window, inclusive
+    :type index: np.ndarray
+    :param index: if `obs` and `syn` are 2D, the row that each window belongs
+        to. Defaults to the zeroth row
+    :rtype: tuple of np.ndarray
+    :return: max_cc_value, cc_shift (samples) and dlnA of each window
+    """
+    obs, syn = np.atleast_2d(obs), np.atleast_2d(syn)
+    left = np.asarray(left, dtype=int)
+    # Pyflex slices up to right + 1, which is bounded by the end of the data
+    right = np.minimum(np.asarray(right, dtype=int), obs.shape[1] - 1)
+    if index is None:
+        index = np.zeros(len(left), dtype=int)
+    if not len(left):
+        return np.array([]), np.array([], dtype=int), np.array([])
+
+    # Gather the window segments, zeroing samples beyond each window
+    npts = right - left + 1
+    nmax = npts.max()
+    samples = np.arange(nmax)
+    mask = samples < npts[:, None]
+    idx = np.minimum(left[:, None] + samples, obs.shape[1] - 1)
+    d = np.where(mask, obs[index[:, None], idx], 0)
+    s = np.where(mask, syn[index[:, None], idx], 0)
+
+    # Cross correlation for lags -(nmax - 1) to (nmax - 1), as np.correlate
+    cc, lags = xcorr(d, s, npts)
+
+    imax = cc.argmax(axis=1)
+    dd, ss = (d ** 2).sum(axis=1), (s ** 2).sum(axis=1)
+    max_cc_value = cc[np.arange(len(cc)), imax] / np.sqrt(ss * dd)
+    cc_shift = lags[imax]
+    dlnA = 0.5 * np.log(dd / ss)
+
+    return max_cc_value, cc_shift, dlnA
+
+
+def phase_arrivals(source_depth_in_km, distance_in_degree, earth_model="ak135"):
+    """
+    Theoretical phase arrivals from TauP, in the format of
+    pyflex.WindowSelector.ttimes. Arrivals are cached for each earth model,
+    source depth and distance, so that each component of a station, and each
+    evaluation of a source-receiver pair, only calls TauP once.
+
+    :type source_depth_in_km: float
+    :param source_depth_in_km: source depth in km
+    :type distance_in_degree: float
+    :param distance_in_degree: source-receiver distance in degrees
+    :type earth_model: str
+    :param earth_model: TauP earth model, as in pyflex.Config.earth_model
+    :rtype: list of dict
+    :return: arrivals as dictionaries with keys 'time' (s after origin time)
+        and 'name' (phase name), sorted by time
+    """
+    key = (earth_model, round(source_depth_in_km, 6),
+           round(distance_in_degree, 9))
+    try:
+        _PHASE_ARRIVAL_CACHE.move_to_end(key)
+        ttimes = _PHASE_ARRIVAL_CACHE[key]
+    except KeyError:
+        arrivals = taup_model(earth_model).get_travel_times(
+            source_depth_in_km=source_depth_in_km,
+            distance_in_degree=distance_in_degree)
+        ttimes = [{"time": _.time, "name": _.name} for _ in arrivals]
+        _PHASE_ARRIVAL_CACHE[key] = ttimes
+        if len(_PHASE_ARRIVAL_CACHE) > PHASE_ARRIVAL_CACHE_SIZE:
+            _PHASE_ARRIVAL_CACHE.popitem(last=False)
+
+    return [dict(_) for _ in ttimes]
+
+
+def taup_model(earth_model="ak135"):
+    """
+    TauP model shared by all phase arrival calculations and window selectors,
+    as loading a model takes longer than most travel time calculations
+
+    :type earth_model: str
+    :param earth_model: TauP earth model, as in pyflex.Config.earth_model
+    :rtype: obspy.taup.TauPyModel
+    :return: the TauP model, loaded on first use
+    """
+    if earth_model not in _TAUP_MODELS:
+        _TAUP_MODELS[earth_model] = TauPyModel(model=earth_model)
+
+    return _TAUP_MODELS[earth_model]
+
+
+def clear_phase_arrival_cache():
+    """
+    Empty the cache of phase arrivals
+    """
+    _PHASE_ARRIVAL_CACHE.clear()
+
+
+class WindowSelector(pyflex.WindowSelector):
+    """
+    Pyflex WindowSelector that takes precomputed phase arrivals, e.g. from an
+    ASDFDataSet, and otherwise calculates them through `phase_arrivals`, rather
+    than calling TauP for every component of every station.
+
+    .. note::
+        pyflex.WindowSelector.__init__() loads a TauP model for every
+        selector, which takes longer than selecting the windows of most
+        components. Initialization is therefore repeated here without it, and
+        `taupy_model` refers to the shared model of `taup_model`, which is
+        only loaded if it is used.
+    """
+    def __init__(self, observed, synthetic, config, event=None, station=None,
+                 ttimes=None):
+        """
+        Arguments as in pyflex.WindowSelector
+
+        :type ttimes: list of dict
+        :param ttimes: precomputed phase arrivals with keys 'time' and 'name',
+            if None, arrivals are calculated from the event and station
+        """
+        self.observed = observed
+        self.synthetic = synthetic
+        self._sanity_checks()
+
+        self.event = event
+        self.station = station
+        self._parse_event_and_station()
+
+        # Copy to not modify the original data
+        self.observed = self.observed.copy()
+        self.synthetic = self.synthetic.copy()
+        self.observed.data = np.ascontiguousarray(self.observed.data)
+        self.synthetic.data = np.ascontiguousarray(self.synthetic.data)
+
+        self.config = copy.deepcopy(config)
+        self.config._convert_to_array(npts=self.observed.stats.npts)
+
+        self.ttimes = []
+        self.windows = []
+        self.rejects = {}
+        self._ttimes = ttimes
+
+    @property
+    def taupy_model(self):
+        """Shared TauP model of the earth model given by the Config"""
+        return taup_model(self.config.earth_model)
+
+    def calculate_ttimes(self):
+        """
+        Overwrites pyflex.WindowSelector.calculate_ttimes() to use
+        precomputed or cached phase arrivals
+        """
+        if self._ttimes is not None:
+            self.ttimes = [dict(_) for _ in self._ttimes]
+        else:
+            dist_in_deg = locations2degrees(
+                self.station.latitude, self.station.longitude,
+                self.event.latitude, self.event.longitude)
+            self.ttimes = phase_arrivals(
+                source_depth_in_km=self.event.depth_in_m / 1000.0,
+                distance_in_degree=dist_in_deg,
+                earth_model=self.config.earth_model)
@@ -575,7 +575,8 @@ class WaveMaker:
                                   plot_window_annos=plot_window_annos, 
                                   plot_phase_arrivals=plot_arrivals)
 
-            if adjsrc is not None and plot_adjsrcs:
+            if adjsrc is not None and adjsrc.adjoint_source is not None \
+                    and plot_adjsrcs:
                 lines += self.plot_adjsrcs(ax=twax, adjsrc=adjsrc)
                 if i == len(self.st_obs) // 2:  
                     # middle trace: append units of the adjoint source on ylabel